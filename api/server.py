@@ -0,0 +1,596 @@
+"""
+api/server.py - API HTTP de l'agent Akuiteo (intégrations ServiceNow, Teams)
+Lancer avec : python api/server.py [--host 0.0.0.0] [--port 8080]
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hmac
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_TOKEN, SERVER_WORKERS, SERVER_QUEUE_SIZE,
+    SERVER_REQUEST_TIMEOUT_S, SERVER_MAX_SESSIONS, SERVER_MAX_BODY_MB, TOP_K,
+    SERVER_MAX_ASYNC_CHATS, ANSWER_CACHE_ENABLED,
+)
+from core.warmup import AkuiteoWarmup
+# core.agent / core.vision_engine (anthropic) sont importés à la première requête :
+# le serveur répond à /health pendant le warm-up du moteur RAG.
+
+logger = logging.getLogger(__name__)
+
+MEDIA_SUFFIXES = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp"}
+MAX_SESSION_ID_LENGTH = 128
+
+
+class APIError(Exception):
+    """Erreur renvoyée au client : code HTTP, message et en-têtes éventuels (Retry-After)."""
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# ─── Pool de workers à file bornée ────────────────────────────────────────────
+
+class WorkerPool:
+    """
+    Exécute les requêtes coûteuses (agent, RAG, vision) sur max_workers threads,
+    avec au plus queue_size requêtes en attente.
+    - Au-delà, submit() refuse immédiatement (429) : la charge ne s'accumule pas
+      sans limite quand Claude ou le retrieval ralentissent
+    - Une requête expirée encore en file est annulée ; déjà démarrée, elle garde
+      sa place jusqu'à la fin réelle de son traitement (un thread ne s'interrompt pas)
+    """
+
+    def __init__(self, max_workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.capacity = self.max_workers + max(0, queue_size)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="api-worker")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise APIError(429, "Serveur saturé, réessayez dans quelques secondes.", {"Retry-After": "5"})
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "capacity": self.capacity,
+                "running": min(self.pending, self.max_workers),
+                "queued": max(0, self.pending - self.max_workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ─── Boucle asyncio des tours /chat ───────────────────────────────────────────
+
+class AsyncTurnRunner:
+    """
+    Boucle d'événements dédiée (un thread) pour les tours AsyncAkuiteoAgent.arun :
+    un tour qui attend Claude n'occupe aucun worker, le nombre de conversations
+    simultanées n'est borné que par max_inflight.
+    - Au-delà de max_inflight tours en cours, submit() refuse immédiatement (429)
+    - Un tour expiré n'est pas interrompu (l'historique de session reste cohérent) :
+      il garde sa place jusqu'à sa fin réelle, comme dans WorkerPool
+    - Le client AsyncAnthropic de la boucle est fermé à l'arrêt (async_client_scope)
+    """
+
+    def __init__(self, max_inflight: int = SERVER_MAX_ASYNC_CHATS):
+        self.max_inflight = max(1, max_inflight)
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._lock = threading.Lock()
+        # Import achevé avant le démarrage du thread : /health lit core.clients dans sys.modules
+        try:
+            from core.clients import async_client_scope
+        except ImportError:  # SDK absent : les tours échoueront, la boucle reste disponible
+            async_client_scope = None
+        self._loop = asyncio.new_event_loop()
+        self._stop = asyncio.Event()
+        self._thread = threading.Thread(
+            target=self._loop.run_until_complete, args=(self._main(async_client_scope),),
+            name="api-async", daemon=True,
+        )
+        self._thread.start()
+
+    async def _main(self, client_scope: Optional[Callable]):
+        if client_scope is None:
+            await self._stop.wait()
+            return
+        async with client_scope():
+            await self._stop.wait()
+
+    def submit(self, coroutine_fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise APIError(429, "Serveur saturé, réessayez dans quelques secondes.", {"Retry-After": "5"})
+        with self._lock:
+            self.inflight += 1
+
+        async def turn():
+            try:
+                return await coroutine_fn(*args)
+            finally:
+                with self._lock:
+                    self.inflight -= 1
+                    self.completed += 1
+                self._slots.release()
+
+        async def shielded():
+            # Annuler le Future renvoyé (timeout) ne l'interrompt pas
+            return await asyncio.shield(asyncio.ensure_future(turn()))
+
+        return asyncio.run_coroutine_threadsafe(shielded(), self._loop)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self.inflight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout=5)
+
+
+# ─── Sessions ─────────────────────────────────────────────────────────────────
+
+class SessionStore:
+    """
+    Conversations en cours : session_id → agent (historique propre) et verrou.
+    Une session ne traite qu'une requête à la fois (409 sinon) ; au-delà de
+    max_sessions, la moins récemment utilisée est oubliée.
+    """
+
+    def __init__(self, factory: Callable, max_sessions: int = SERVER_MAX_SESSIONS):
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, session_id: Optional[str]) -> tuple:
+        """Renvoie (session_id, agent, verrou acquis) ; crée la session si elle est inconnue."""
+        if session_id is not None and (
+            not isinstance(session_id, str) or not 0 < len(session_id) <= MAX_SESSION_ID_LENGTH
+        ):
+            raise APIError(400, f"session_id invalide (1 à {MAX_SESSION_ID_LENGTH} caractères).")
+        with self._lock:
+            entry = self._sessions.get(session_id) if session_id else None
+            if entry is None:
+                session_id = session_id or uuid.uuid4().hex
+                entry = (self._factory(), threading.Lock())
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+        agent, busy = entry
+        if not busy.acquire(blocking=False):
+            raise APIError(409, "Une requête est déjà en cours pour cette session.")
+        return session_id, agent, busy
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# ─── Service ──────────────────────────────────────────────────────────────────
+
+class AgentService:
+    """
+    État partagé par toutes les requêtes :
+    - un seul moteur RAG, chargé en arrière-plan au démarrage (503 tant qu'il ne l'est pas)
+    - un moteur vision et un cache de réponses communs aux sessions
+    - les sessions de conversation (AsyncAkuiteoAgent), la boucle asyncio des
+      tours /chat et le pool de workers (stream SSE, RAG, vision)
+    """
+
+    def __init__(
+        self,
+        workers: int = SERVER_WORKERS,
+        queue_size: int = SERVER_QUEUE_SIZE,
+        timeout_s: float = SERVER_REQUEST_TIMEOUT_S,
+        max_sessions: int = SERVER_MAX_SESSIONS,
+        warmup: Optional[AkuiteoWarmup] = None,
+        max_async_chats: int = SERVER_MAX_ASYNC_CHATS,
+    ):
+        self.warmup = warmup if warmup is not None else AkuiteoWarmup().start()
+        self.pool = WorkerPool(workers, queue_size)
+        self.turns = AsyncTurnRunner(max_async_chats)
+        self.sessions = SessionStore(self._new_agent, max_sessions)
+        self.timeout_s = timeout_s
+        self._vision = None
+        self._answer_cache = None
+        self._lock = threading.Lock()
+
+    @property
+    def rag(self):
+        if not self.warmup.ready:
+            raise APIError(503, "Index RAG en cours de chargement.", {"Retry-After": "10"})
+        if self.warmup.error is not None:
+            raise APIError(503, f"Moteur RAG indisponible : {self.warmup.error}")
+        return self.warmup.engine
+
+    @property
+    def vision(self):
+        with self._lock:
+            if self._vision is None:
+                from core.vision_engine import AkuiteoVisionEngine
+                self._vision = AkuiteoVisionEngine()
+            return self._vision
+
+    def _new_agent(self):
+        from core.agent import AsyncAkuiteoAgent
+        from core.answer_cache import SemanticAnswerCache
+        rag = self.rag
+        with self._lock:
+            if self._answer_cache is None and ANSWER_CACHE_ENABLED:
+                self._answer_cache = SemanticAnswerCache()
+        return AsyncAkuiteoAgent(rag, self.vision, answer_cache=self._answer_cache)
+
+    # ── Endpoints ─────────────────────────────────────────────────────────────
+
+    def chat(self, payload: dict) -> dict:
+        message = _required_text(payload, "message")
+        image = _image_from_payload(payload)
+        session_id, agent, busy = self.sessions.checkout(payload.get("session_id"))
+
+        async def turn():
+            try:
+                return await agent.arun(message, image)
+            finally:
+                busy.release()
+
+        try:
+            future = self.turns.submit(turn)
+        except APIError:
+            busy.release()
+            raise
+        return {"session_id": session_id, **self._wait(future)}
+
+    def chat_stream(self, payload: dict) -> Iterator[dict]:
+        """
+        Valide la requête et réserve un worker avant tout envoi (429 / 503 restent
+        possibles) ; renvoie les événements de run_stream au fil de l'eau.
+        """
+        message = _required_text(payload, "message")
+        image = _image_from_payload(payload)
+        events: "queue.Queue[Optional[dict]]" = queue.Queue()
+
+        def work(agent):
+            # Le tour est mené à son terme même si le client se déconnecte :
+            # l'historique de la session reste cohérent
+            try:
+                for event in agent.run_stream(message, image):
+                    events.put(event)
+            except Exception as e:
+                logger.error(f"❌ Erreur agent (stream) : {e}")
+                events.put({"type": "error", "error": str(e)})
+            finally:
+                events.put(None)
+
+        session_id, future = self._submit_in_session(payload.get("session_id"), work)
+        return self._drain(events, session_id, future)
+
+    def rag_search(self, payload: dict) -> dict:
+        query = _required_text(payload, "query")
+        top_k = payload.get("top_k", TOP_K)
+        if not isinstance(top_k, int) or not 1 <= top_k <= 50:
+            raise APIError(400, "top_k doit être un entier entre 1 et 50.")
+        return self._wait(self.pool.submit(self.rag.query, query, top_k))
+
+    def vision_analyze(self, payload: dict) -> dict:
+        image = _image_from_payload(payload, required=True)
+        question = payload.get("question") or "Qu'est-ce que je vois sur cet écran Akuiteo ?"
+        context = payload.get("context") or ""
+        return self._wait(self.pool.submit(self.vision.analyze_screenshot, image, question, context))
+
+    def delete_session(self, session_id: str) -> dict:
+        if not self.sessions.delete(session_id):
+            raise APIError(404, "Session inconnue.")
+        return {"session_id": session_id, "deleted": True}
+
+    def health(self) -> tuple[int, dict]:
+        if not self.warmup.ready:
+            status = "loading"
+        elif self.warmup.error is not None:
+            status = "error"
+        else:
+            status = "ok"
+        body = {
+            "status": status,
+            "rag": {
+                "ready": status == "ok",
+                "error": str(self.warmup.error) if self.warmup.error is not None else None,
+                "index_version": getattr(self.warmup.engine, "index_version", None),
+                "timings": self.warmup.timings,
+            },
+            "queue": self.pool.stats(),
+            "chats": self.turns.stats(),
+            "sessions": len(self.sessions),
+        }
+        if "core.clients" in sys.modules:
+            body["connections"] = sys.modules["core.clients"].pool_stats()
+        return (200 if status == "ok" else 503), body
+
+    # ── Exécution ─────────────────────────────────────────────────────────────
+
+    def _submit_in_session(self, session_id: Optional[str], work: Callable) -> tuple[str, Future]:
+        """Soumet work(agent) au pool ; le verrou de la session est libéré à la fin (ou à l'annulation)."""
+        session_id, agent, busy = self.sessions.checkout(session_id)
+
+        def job():
+            try:
+                return work(agent)
+            finally:
+                busy.release()
+
+        try:
+            future = self.pool.submit(job)
+        except APIError:
+            busy.release()
+            raise
+        future.add_done_callback(lambda f: f.cancelled() and busy.release())
+        return session_id, future
+
+    def _wait(self, future: Future):
+        try:
+            return future.result(timeout=self.timeout_s)
+        except FutureTimeout:
+            future.cancel()
+            raise APIError(504, f"Délai de traitement dépassé ({self.timeout_s}s).")
+        except APIError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erreur de traitement : {e}")
+            raise APIError(500, f"Erreur de traitement : {e}")
+
+    def _drain(self, events: queue.Queue, session_id: str, future: Future) -> Iterator[dict]:
+        deadline = time.monotonic() + self.timeout_s
+        yield {"type": "session", "session_id": session_id}
+        while True:
+            try:
+                event = events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                future.cancel()
+                yield {"type": "error", "error": f"Délai de traitement dépassé ({self.timeout_s}s)."}
+                return
+            if event is None:
+                return
+            yield event
+
+    def shutdown(self):
+        self.pool.shutdown()
+        self.turns.shutdown()
+
+
+def _required_text(payload: dict, field: str) -> str:
+    value = payload.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise APIError(400, f"Champ « {field} » requis (texte non vide).")
+    return value
+
+
+def _image_from_payload(payload: dict, required: bool = False) -> Optional[BytesIO]:
+    """
+    Capture jointe en base64 (« image_base64 », data URL acceptée) et son type
+    (« image_media_type », PNG par défaut). Renvoyée comme fichier nommé : le
+    moteur vision déduit le type MIME de l'extension.
+    """
+    data = payload.get("image_base64")
+    if not data:
+        if required:
+            raise APIError(400, "Champ « image_base64 » requis.")
+        return None
+    media_type = payload.get("image_media_type", "image/png")
+    if isinstance(data, str) and data.startswith("data:"):
+        header, _, data = data.partition(",")
+        media_type = header[len("data:"):].split(";")[0] or media_type
+    if media_type not in MEDIA_SUFFIXES:
+        raise APIError(400, f"Type d'image non supporté : {media_type}")
+    try:
+        raw_bytes = base64.b64decode(data, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        raise APIError(400, "image_base64 n'est pas du base64 valide.")
+    image = BytesIO(raw_bytes)
+    image.name = "capture" + MEDIA_SUFFIXES[media_type]
+    return image
+
+
+# ─── HTTP ─────────────────────────────────────────────────────────────────────
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes :
+      GET    /health              état du moteur RAG, de la file et des connexions API
+      POST   /chat                {message, session_id?, image_base64?, image_media_type?}
+      POST   /chat/stream         idem, réponse en Server-Sent Events
+      POST   /rag/search          {query, top_k?}
+      POST   /vision              {image_base64, image_media_type?, question?, context?}
+      DELETE /sessions/<id>       oublie une conversation
+    """
+
+    service: AgentService = None
+    protocol_version = "HTTP/1.1"
+    server_version = "AppiAgent/1.0"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        try:
+            self._authorize()
+            if method == "GET" and path == "/health":
+                status, body = self.service.health()
+                return self._send_json(status, body)
+            if method == "DELETE" and path.startswith("/sessions/"):
+                return self._send_json(200, self.service.delete_session(path[len("/sessions/"):]))
+            if method == "POST":
+                payload = self._read_json()
+                if path == "/chat":
+                    return self._send_json(200, self.service.chat(payload))
+                if path == "/chat/stream":
+                    return self._send_events(self.service.chat_stream(payload))
+                if path == "/rag/search":
+                    return self._send_json(200, self.service.rag_search(payload))
+                if path == "/vision":
+                    return self._send_json(200, self.service.vision_analyze(payload))
+            raise APIError(404, f"Route inconnue : {method} {path}")
+        except APIError as e:
+            # Corps éventuellement non lu : la connexion n'est pas réutilisée
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)}, e.headers)
+        except Exception as e:
+            logger.exception(f"❌ Erreur interne sur {method} {path} : {e}")
+            self.close_connection = True
+            self._send_json(500, {"error": "Erreur interne du serveur."})
+
+    def _authorize(self):
+        if not SERVER_TOKEN:
+            return
+        expected = f"Bearer {SERVER_TOKEN}"
+        if not hmac.compare_digest(self.headers.get("Authorization", ""), expected):
+            raise APIError(401, "Jeton d'accès manquant ou invalide.", {"WWW-Authenticate": "Bearer"})
+
+    def _read_json(self) -> dict:
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise APIError(411, "En-tête Content-Length requis.")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise APIError(400, "En-tête Content-Length invalide.")
+        if length > SERVER_MAX_BODY_MB * 1024 * 1024:
+            raise APIError(413, f"Requête trop volumineuse (max {SERVER_MAX_BODY_MB} Mo).")
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise APIError(400, "Corps JSON invalide.")
+        if not isinstance(payload, dict):
+            raise APIError(400, "Le corps doit être un objet JSON.")
+        return payload
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_events(self, events: Iterator[dict]):
+        """Server-Sent Events : « event: <type> » puis l'événement en JSON, connexion fermée à la fin."""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for event in events:
+                data = json.dumps(event, ensure_ascii=False, default=str)
+                self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("🔌 Client déconnecté pendant le stream (le tour se termine en arrière-plan).")
+
+    def log_message(self, format: str, *args):
+        logger.info(f"🌐 {self.address_string()} {format % args}")
+
+
+class AgentHTTPServer(ThreadingHTTPServer):
+    """Un thread léger par connexion ; le travail coûteux passe par le WorkerPool du service."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def create_server(host: str = SERVER_HOST, port: int = SERVER_PORT, service: Optional[AgentService] = None):
+    service = service if service is not None else AgentService()
+    handler = type("BoundAgentRequestHandler", (AgentRequestHandler,), {"service": service})
+    return AgentHTTPServer((host, port), handler), service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP de l'agent Akuiteo")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server, service = create_server(args.host, args.port)
+    logger.info(
+        f"🚀 API Akuiteo sur http://{args.host}:{args.port} — {service.pool.max_workers} workers, "
+        f"file de {service.pool.capacity - service.pool.max_workers} requêtes"
+        + (", jeton requis" if SERVER_TOKEN else "")
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
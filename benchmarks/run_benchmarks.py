@@ -0,0 +1,345 @@
+"""
+benchmarks/run_benchmarks.py — Micro-benchmarks des composants avec seuils de régression
+Lancer depuis la racine du projet :
+    python benchmarks/run_benchmarks.py                          # toutes les suites
+    python benchmarks/run_benchmarks.py --suite image agent      # suites sans modèle d'embedding
+    python benchmarks/run_benchmarks.py --update-baseline        # mesures → baselines.json
+
+Chaque mesure est comparée à benchmarks/baselines.json : le script sort en
+erreur (code 1) si une métrique se dégrade de plus de --threshold (20 % par défaut).
+Aucune baseline n'est versionnée (les mesures dépendent de la machine) : sans
+--update-baseline préalable sur la machine de référence, rien n'est comparé et
+le script le signale.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+BASELINE_FILE = Path(__file__).parent / "baselines.json"
+
+# Questions représentatives (suggestions de l'UI et variantes)
+QUESTIONS = [
+    "Comment creer une opportunite dans le CRM ?",
+    "Comment saisir mes temps dans Akuiteo ?",
+    "Quelles sont les etapes du cycle de vente ?",
+    "Comment rattacher un contact a un client ?",
+    "Ou trouver le tableau de bord commercial ?",
+    "Comment passer une opportunite en affaire gagnee ?",
+    "Quelle est la difference entre un prospect et un client ?",
+    "Comment exporter la liste des opportunites ?",
+]
+
+# Écart absolu en dessous duquel une variation n'est pas une régression (bruit de mesure)
+MIN_ABS_DELTA = {"ms": 0.5, "s": 0.05}
+
+
+# ─── Mesures ───────────────────────────────────────────────────────────────────
+
+def _measure_ms(fn: Callable, repeat: int, warmup: int = 1, setup: Callable = None) -> List[float]:
+    """Durées (ms) de repeat appels de fn, après warmup appels ignorés ; setup hors chrono."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def _p(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+
+
+def _metric(value: float, unit: str, higher_is_better: bool = False) -> dict:
+    return {"value": round(value, 2), "unit": unit, "higher_is_better": higher_is_better}
+
+
+_ENGINE = None
+
+
+def _rag_engine():
+    """Moteur RAG partagé par les suites index / embedding / query (bge-m3 chargé une fois)."""
+    global _ENGINE
+    if _ENGINE is None:
+        from core.rag_engine import AkuiteoRAGEngine
+        _ENGINE = AkuiteoRAGEngine()
+    return _ENGINE
+
+
+def _synthetic_screenshot(width: int, height: int, fmt: str) -> bytes:
+    """
+    Capture synthétique : aplats d'interface (compressibles) + une bande de
+    bruit (incompressible) pour dépasser la limite de 4,5 Mo comme une vraie
+    capture 4K chargée.
+    """
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (width, height), (245, 247, 250))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, width, 80], fill=(15, 76, 129))
+    draw.rectangle([0, 80, 320, height], fill=(230, 234, 240))
+    for row in range(120, height // 2, 48):
+        draw.rectangle([360, row, width - 40, row + 32], outline=(200, 205, 215), fill=(255, 255, 255))
+    noise_height = height // 2
+    noise = Image.frombytes("RGB", (width, noise_height), os.urandom(width * noise_height * 3))
+    img.paste(noise, (0, height - noise_height))
+
+    buf = BytesIO()
+    img.save(buf, format=fmt, quality=95)
+    return buf.getvalue()
+
+
+@contextmanager
+def _isolated_tracer(tmp: str):
+    """Spans mesurés mais écrits sous tmp plutôt que dans data/traces (tampon vidé avant restauration)."""
+    from core import tracing
+
+    trace_path = tracing.TRACER.path
+    tracing.TRACER.path = Path(tmp) / "traces.jsonl"
+    try:
+        yield
+    finally:
+        tracing.TRACER.flush()
+        tracing.TRACER.path = trace_path
+
+
+# ─── Suites ────────────────────────────────────────────────────────────────────
+
+def bench_index() -> Dict[str, dict]:
+    """Construction complète (parsing + embedding sans cache + persistance + BM25) dans un dossier temporaire."""
+    from llama_index.core import Settings
+    from core.bm25 import BM25Index
+    from core.ingestion import AkuiteoIngestionPipeline
+    from core.vector_store import AkuiteoVectorStore
+
+    _rag_engine()
+    pipeline = AkuiteoIngestionPipeline(Settings.embed_model, embed_cache=None)
+    start = time.perf_counter()
+    nodes_by_key = pipeline.run()
+    nodes = [node for key_nodes in nodes_by_key.values() for node in key_nodes]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AkuiteoVectorStore(Path(tmp))
+        store.add(nodes)
+        store.persist()
+        BM25Index.from_records(store.records)
+    build_s = time.perf_counter() - start
+
+    return {
+        "index.build_s": _metric(build_s, "s"),
+        "index.pages_per_s": _metric(pipeline.last_stats["pages_per_s"], "pages/s", higher_is_better=True),
+    }
+
+
+def bench_embedding() -> Dict[str, dict]:
+    """Débit du modèle d'embedding sur des chunks de taille réelle (~CHUNK_SIZE tokens)."""
+    from llama_index.core import Settings
+
+    _rag_engine()
+    chunk = (
+        "Dans le module CRM d'Akuiteo, une opportunité est rattachée à un client et à un "
+        "commercial ; son avancement suit les étapes du cycle de vente jusqu'à la signature. "
+    ) * 12
+    texts = [f"{i} {chunk}" for i in range(128)]
+    Settings.embed_model.get_text_embedding_batch(texts[:8])  # initialisation paresseuse de torch
+    start = time.perf_counter()
+    Settings.embed_model.get_text_embedding_batch(texts)
+    elapsed = time.perf_counter() - start
+    return {"embed.chunks_per_s": _metric(len(texts) / elapsed, "chunks/s", higher_is_better=True)}
+
+
+def bench_query() -> Dict[str, dict]:
+    """Latence de AkuiteoRAGEngine.query : à froid (caches vidés) puis à chaud (cache de résultats)."""
+    engine = _rag_engine()
+    engine.build_index(force_rebuild=False)
+    engine.warm_up()
+
+    cold = []
+    for question in QUESTIONS:
+        engine._query_results.clear()
+        engine._query_embeddings.clear()
+        start = time.perf_counter()
+        engine.query(question)
+        cold.append((time.perf_counter() - start) * 1000)
+
+    warm = []
+    for _ in range(5):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            engine.query(question)
+            warm.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "query.cold_p50_ms": _metric(_p(cold, 0.5), "ms"),
+        "query.cold_p95_ms": _metric(_p(cold, 0.95), "ms"),
+        "query.warm_p50_ms": _metric(_p(warm, 0.5), "ms"),
+    }
+
+
+def bench_image() -> Dict[str, dict]:
+    """_resize_if_needed et _prepare_image sur des captures 4K (PNG) et une photo (JPEG) > 4,5 Mo."""
+    from benchmarks.stub_anthropic import StubAnthropic
+    from core.image_cache import PreparedImageCache
+    from core.vision_cache import VisionAnalysisCache
+    from core.vision_engine import AkuiteoVisionEngine
+
+    screenshot = _synthetic_screenshot(3840, 2160, "PNG")
+    photo = _synthetic_screenshot(4032, 3024, "JPEG")
+
+    # Cache d'analyses et spans hors de data/ : le benchmark ne touche pas aux données du projet
+    with tempfile.TemporaryDirectory() as tmp, _isolated_tracer(tmp):
+        vision = AkuiteoVisionEngine(
+            image_cache=PreparedImageCache(),
+            analysis_cache=VisionAnalysisCache(path=Path(tmp) / "vision.sqlite"),
+            client=StubAnthropic(),
+        )
+        resize_png = _measure_ms(lambda: vision._resize_if_needed(screenshot, "image/png"), repeat=3)
+        resize_jpeg = _measure_ms(lambda: vision._resize_if_needed(photo, "image/jpeg"), repeat=3)
+        prepare = _measure_ms(
+            lambda: vision._prepare_image(screenshot), repeat=3, setup=vision.image_cache.clear
+        )
+        prepare_cached = _measure_ms(lambda: vision._prepare_image(screenshot), repeat=20)
+
+    return {
+        "image.resize_png_4k_ms": _metric(statistics.median(resize_png), "ms"),
+        "image.resize_jpeg_12mp_ms": _metric(statistics.median(resize_jpeg), "ms"),
+        "image.prepare_png_4k_ms": _metric(statistics.median(prepare), "ms"),
+        "image.prepare_cached_ms": _metric(statistics.median(prepare_cached), "ms"),
+    }
+
+
+def bench_agent() -> Dict[str, dict]:
+    """Surcoût de la boucle ReAct (2 itérations, 1 rag_search) hors latence du modèle et du retrieval."""
+    from benchmarks.stub_anthropic import StubAnthropic, StubRAGEngine
+    from core.agent import AkuiteoAgent
+
+    # Sans cache de réponses : chaque tour parcourt la boucle complète
+    agent = AkuiteoAgent(StubRAGEngine(), vision_engine=None, answer_cache=None, client=StubAnthropic())
+
+    def turn():
+        agent.reset_conversation()
+        agent.run(QUESTIONS[0])
+
+    def stream_turn():
+        agent.reset_conversation()
+        for _ in agent.run_stream(QUESTIONS[0]):
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp, _isolated_tracer(tmp):
+        turns = _measure_ms(turn, repeat=200, warmup=10)
+        stream_turns = _measure_ms(stream_turn, repeat=200, warmup=10)
+    return {
+        "agent.turn_overhead_p50_ms": _metric(_p(turns, 0.5), "ms"),
+        "agent.turn_overhead_p95_ms": _metric(_p(turns, 0.95), "ms"),
+        "agent.stream_turn_overhead_p50_ms": _metric(_p(stream_turns, 0.5), "ms"),
+    }
+
+
+SUITES = {
+    "index": bench_index,
+    "embedding": bench_embedding,
+    "query": bench_query,
+    "image": bench_image,
+    "agent": bench_agent,
+}
+
+
+# ─── Comparaison aux baselines ─────────────────────────────────────────────────
+
+def compare(results: Dict[str, dict], baselines: Dict[str, dict], threshold: float) -> List[str]:
+    """Renvoie la liste des régressions au-delà du seuil relatif."""
+    regressions = []
+    for name, metric in results.items():
+        base = baselines.get(name)
+        if base is None or not base["value"]:
+            continue
+        delta = metric["value"] - base["value"]
+        if metric["higher_is_better"]:
+            delta = -delta
+        if abs(delta) < MIN_ABS_DELTA.get(metric["unit"], 0.0):
+            continue
+        if delta / base["value"] > threshold:
+            regressions.append(
+                f"{name} : {metric['value']} {metric['unit']} "
+                f"(baseline {base['value']}, {delta / base['value']:+.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks Akuiteo")
+    parser.add_argument("--suite", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--threshold", type=float, default=0.20, help="Dégradation relative tolérée")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre les mesures comme référence")
+    parser.add_argument("--output", type=Path, help="Écrit les mesures en JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print("=" * 60)
+    print("  Benchmarks Akuiteo")
+    print("=" * 60)
+
+    results: Dict[str, dict] = {}
+    for suite in args.suite:
+        print(f"\n⏱️  Suite {suite}...")
+        try:
+            suite_results = SUITES[suite]()
+        except ImportError as e:
+            print(f"   ⚠️  Ignorée : dépendance manquante ({e})")
+            continue
+        for name, metric in suite_results.items():
+            print(f"   {name:<38} {metric['value']:>10} {metric['unit']}")
+        results.update(suite_results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    baselines = json.loads(BASELINE_FILE.read_text(encoding="utf-8")) if BASELINE_FILE.exists() else {}
+    if args.update_baseline:
+        baselines.update(results)
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n✅ Baselines mises à jour ({BASELINE_FILE.name})")
+        return 0
+
+    if not baselines:
+        print(
+            f"\n⚠️  Aucune baseline ({BASELINE_FILE.name} absent) : rien n'est comparé. "
+            "Lancez avec --update-baseline sur la machine de référence pour en enregistrer une."
+        )
+        return 0
+
+    missing = [name for name in results if name not in baselines]
+    if missing:
+        print(f"\n⚠️  {len(missing)} mesure(s) sans baseline, non comparées :")
+        for name in missing:
+            print(f"   - {name}")
+
+    regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.threshold:.0%} :")
+        for line in regressions:
+            print(f"   - {line}")
+        return 1
+    print(f"\n✅ Aucune régression au-delà de {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
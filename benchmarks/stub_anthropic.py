@@ -0,0 +1,98 @@
+"""
+benchmarks/stub_anthropic.py — Client Anthropic factice pour mesurer le surcoût de la boucle ReAct
+"""
+import time
+from types import SimpleNamespace
+
+
+def _message(stop_reason: str, content: list) -> SimpleNamespace:
+    return SimpleNamespace(
+        stop_reason=stop_reason,
+        content=content,
+        usage=SimpleNamespace(
+            input_tokens=1200,
+            output_tokens=80,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=1000,
+        ),
+    )
+
+
+class _StubStream:
+    def __init__(self, response: SimpleNamespace):
+        self._response = response
+        text = "".join(block.text for block in response.content if block.type == "text")
+        self.text_stream = iter(text.split(" ")) if text else iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_final_message(self) -> SimpleNamespace:
+        return self._response
+
+
+class _StubMessages:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def create(self, **kwargs) -> SimpleNamespace:
+        """
+        Script fixe : première itération → un tool_use rag_search,
+        itération suivante (tool_result reçus) → réponse finale.
+        """
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        last = kwargs["messages"][-1]["content"]
+        if isinstance(last, list) and any(
+            isinstance(block, dict) and block.get("type") == "tool_result" for block in last
+        ):
+            return _message("end_turn", [SimpleNamespace(
+                type="text",
+                text="Pour créer une opportunité, ouvrez CRM > Opportunités puis cliquez sur Nouveau. "
+                     "Source : Mode Opératoire CRM.",
+            )])
+        return _message("tool_use", [
+            SimpleNamespace(type="text", text="Je consulte la documentation."),
+            SimpleNamespace(
+                type="tool_use",
+                id=f"toolu_bench_{self.calls}",
+                name="rag_search",
+                input={"query": "créer une opportunité CRM"},
+            ),
+        ])
+
+    def stream(self, **kwargs) -> _StubStream:
+        return _StubStream(self.create(**kwargs))
+
+
+class StubAnthropic:
+    """Remplace anthropic.Anthropic : mêmes appels messages.create / messages.stream, sans réseau."""
+
+    def __init__(self, latency_s: float = 0.0):
+        self.messages = _StubMessages(latency_s)
+
+
+class StubRAGEngine:
+    """Moteur RAG instantané : isole le coût de l'agent de celui du retrieval."""
+
+    index_version = "benchmark"
+
+    def query_many(self, questions, top_k: int = 5):
+        return [
+            {
+                "passages": ["Menu CRM > Opportunités > Nouveau : renseigner le client et le montant."] * top_k,
+                "sources": ["Mode Opératoire CRM"] * top_k,
+                "count": top_k,
+                "cached": False,
+                "timings": {},
+            }
+            for _ in questions
+        ]
+
+    def embed_query(self, question: str):
+        return [0.0]
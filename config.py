@@ -9,6 +9,12 @@ load_dotenv()
 
 # === API ===
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+API_TIMEOUT_S = 120.0           # Durée max d'une requête Claude (réponses longues, streaming)
+API_CONNECT_TIMEOUT_S = 10.0    # Établissement de la connexion TCP + TLS
+API_MAX_CONNECTIONS = 32        # Connexions HTTP simultanées vers l'API, toutes sessions confondues
+API_MAX_KEEPALIVE = 16          # Connexions inactives gardées ouvertes (TLS réutilisé d'une session à l'autre)
+API_KEEPALIVE_EXPIRY_S = 60.0   # Fermeture d'une connexion inactive au-delà (s)
+API_MAX_RETRIES = 2             # Nouvelles tentatives du SDK (429, 5xx, coupures réseau)
 
 # === Modèles ===
 CLAUDE_MODEL = "claude-opus-4-6"          # Pour le raisonnement ReAct + vision
@@ -30,19 +36,99 @@ CHUNK_SIZE = 512
 CHUNK_OVERLAP = 64
 TOP_K = 5
 SIMILARITY_THRESHOLD = 0.35
+VECTOR_DTYPE = "float32"        # Stockage des embeddings sur disque : "float32" ou "float16"
+SEARCH_BLOCK_ROWS = 65_536      # Lignes de la matrice d'embeddings scorées par bloc
+VECTOR_QUANTIZATION = "none"    # Premier passage en RAM : "none", "int8" (4× moins) ou "binary" (32× moins)
+RESCORE_FACTOR = 4              # int8 : candidats rescorés en pleine précision = top_k × RESCORE_FACTOR
+RESCORE_FACTOR_BINARY = 20      # binary (1 bit/dimension, premier passage grossier) : rappel@5 0,68 à ×4, 1,0 à ×20
+RESCORE_MIN_CANDIDATES = 100    # Plancher de candidats rescorés (petits top_k), quelle que soit la quantification
+HYBRID_SEARCH = True            # Fusion dense (bge-m3) + lexicale (BM25)
+HYBRID_CANDIDATES = 20          # Candidats retenus par chaque recherche avant fusion
+RRF_K = 60                      # Constante de la Reciprocal Rank Fusion
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUERY_CACHE_SIZE = 256          # Requêtes (embeddings et résultats) gardées en mémoire
+QUERY_CACHE_TTL = 3600          # Durée de vie d'une entrée du cache de requêtes (s)
+
+# === Index ANN (grands corpus) ===
+ANN_BACKEND = "auto"            # "auto" (HNSW si hnswlib installé, sinon IVF), "hnsw", "ivf" ou "exact"
+ANN_MIN_VECTORS = 20_000        # En dessous : recherche exacte (plus rapide et rappel parfait)
+HNSW_M = 16                     # Voisins par nœud du graphe (qualité vs mémoire)
+HNSW_EF_CONSTRUCTION = 200      # Effort de construction du graphe
+HNSW_EF_SEARCH = 64             # Effort de recherche : ↑ rappel, ↑ latence
+IVF_NLIST = None                # Nombre de listes IVF (None = 4·√N)
+IVF_NPROBE = 16                 # Listes parcourues par requête : ↑ rappel, ↑ latence
+IVF_TRAIN_ITERS = 10            # Itérations du k-means d'entraînement
+
+# === Ingestion ===
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # Processus de parsing DOCX/PDF
+PDF_PAGES_PER_TASK = 8                              # Pages PDF par tâche de parsing
+EMBED_BATCH_SIZE = 64                               # Chunks par passe du modèle d'embedding
+EMBED_TORCH_THREADS = os.cpu_count() or 1           # Threads torch pour bge-m3 (0 = défaut torch)
+EMBED_CACHE_MAX_ENTRIES = 50_000                    # Cache disque des embeddings (~4 Ko/entrée en bge-m3)
+
+# === Images (vision) ===
+IMAGE_MAX_TOKENS = 1600         # Budget par capture (tokens ≈ largeur × hauteur / 750)
+IMAGE_MAX_LONG_EDGE = 1568      # Côté maximal envoyé (au-delà l'API redimensionne elle-même)
+IMAGE_MAX_BYTES_MB = 4.5        # Limite de taille de l'API (5 Mo) avec marge
+IMAGE_CROP_BORDERS = True       # Recadre les bordures uniformes (fond d'écran, bandes noires)
+IMAGE_JPEG_QUALITY = 85         # Qualité JPEG des photos (les captures d'interface restent en PNG)
+VISION_CACHE_ENABLED = True     # Analyses vision réutilisées pour les écrans récurrents (dHash)
+VISION_CACHE_MAX_DISTANCE = 10  # Bits différents tolérés sur 256 entre deux captures « identiques »
+VISION_CACHE_TTL = 30 * 24 * 3600   # Durée de vie d'une analyse en cache (s)
+VISION_CACHE_MAX_ENTRIES = 5_000
+
+# === Analyse d'images en lot (captures des documents indexés) ===
+SCREENSHOTS_DIR = DATA_DIR / "screenshots"                  # Bibliothèque de captures à pré-analyser
+IMAGE_ANALYSES_FILE = INDEX_DIR / "image_analyses.jsonl"    # Checkpoint des analyses, indexé comme document « images »
+IMAGE_PIPELINE_CONCURRENCY = 4                              # Appels Claude Vision simultanés
+IMAGE_PIPELINE_MIN_SIDE = 200                               # Images plus petites ignorées (logos, icônes, puces)
+
+# === Traçage ===
+TRACE_OTLP_ENDPOINT = os.getenv("OTLP_TRACES_ENDPOINT", "")   # ex. http://localhost:4318/v1/traces
+TRACE_ENABLED = os.getenv("AGENT_TRACING", "") == "1" or bool(TRACE_OTLP_ENDPOINT)   # Opt-in
+TRACE_FILE = DATA_DIR / "traces" / "traces.jsonl"    # Un span JSON par ligne
+TRACE_FILE_MAX_MB = 50                               # Au-delà : rotation en traces.jsonl.1
+TRACE_BUFFER_SPANS = 64                              # Spans en tampon avant écriture (vidé aussi à la fin de chaque trace)
+TRACE_PENDING_TTL_S = 600                            # Trace OTLP sans fin de span racine (flux abandonné) oubliée après ce délai
+TRACE_STATS_WINDOW = 500                             # Mesures gardées par span pour le panneau de latence
+
+# === Serveur HTTP (intégrations ServiceNow, Teams) ===
+SERVER_HOST = os.getenv("AGENT_API_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("AGENT_API_PORT", "8080"))
+SERVER_TOKEN = os.getenv("AGENT_API_TOKEN", "")     # Si défini : en-tête « Authorization: Bearer <token> » exigé
+SERVER_WORKERS = 8                  # Requêtes (agent, RAG, vision) traitées en parallèle
+SERVER_QUEUE_SIZE = 32              # Requêtes en attente d'un worker ; au-delà : 429
+SERVER_MAX_ASYNC_CHATS = 256        # Tours /chat asynchrones simultanés (sans worker) ; au-delà : 429
+SERVER_REQUEST_TIMEOUT_S = 180      # Attente + traitement d'une requête ; au-delà : 504
+SERVER_MAX_SESSIONS = 500           # Conversations (agents) gardées en mémoire, éviction LRU
+SERVER_MAX_BODY_MB = 10             # Taille maximale d'une requête (capture base64 comprise)
 
 # === Agent ===
 MAX_ITERATIONS = 8
-SYSTEM_PROMPT = """Tu es l'assistant Akuiteo de Rydge Conseil.
-Tu aides les collaborateurs à utiliser le logiciel Akuiteo (ERP/CRM de gestion de projets).
-Tu as accès à deux outils :
-1. rag_search : recherche dans la documentation Akuiteo (procédures, cas d'usage)
-2. vision_analysis : analyse de captures d'écran Akuiteo fournies par l'utilisateur
-
-Règles :
-- Réponds toujours en français sauf si l'utilisateur parle anglais
-- Pour toute question procédurale, utilise d'abord rag_search
-- Si une image est fournie, utilise vision_analysis pour l'analyser
-- Cite la source documentaire de tes réponses (ex: "Source : Livre Blanc, §3.2")
-- Si tu n'es pas sûr, dis-le clairement et propose une recherche complémentaire
-"""
+TOOL_MAX_WORKERS = 8            # Threads partagés pour exécuter en parallèle les tools d'une réponse
+PROMPT_CACHING = True           # Points de cache (system + tools, historique) sur les appels Claude
+HISTORY_TOKEN_BUDGET = 30_000   # Au-delà, l'historique est compacté avant le tour suivant
+HISTORY_KEEP_TURNS = 2          # Derniers tours conservés intacts (images, tool_result complets)
+HISTORY_TOOL_RESULT_CHARS = 1_500   # Longueur des tool_result des anciens tours après troncature
+VISION_MODE = "tool"            # "tool" : appel Claude Vision dédié | "inline" : le modèle ReAct lit la capture
+IMAGE_CACHE_MAX_MB = 64         # Cache mémoire des captures préparées (base64), partagé agent / vision
+ANSWER_CACHE_ENABLED = True     # Cache sémantique des réponses (questions texte en début de conversation)
+ANSWER_CACHE_THRESHOLD = 0.92   # Similarité cosinus bge-m3 minimale pour réutiliser une réponse
+ANSWER_CACHE_TTL = 7 * 24 * 3600    # Durée de vie d'une réponse en cache (s)
+ANSWER_CACHE_MAX_ENTRIES = 2_000
+# Prompt système de l'agent, assemblé par build_system_prompt (core/agent.py) selon
+# les outils exposés : en VISION_MODE = "inline", vision_analysis et sa règle en sont absents
+SYSTEM_PROMPT_INTRO = """Tu es l'assistant Akuiteo de Rydge Conseil.
+Tu aides les collaborateurs à utiliser le logiciel Akuiteo (ERP/CRM de gestion de projets)."""
+SYSTEM_PROMPT_TOOLS = {
+    "rag_search": "recherche dans la documentation Akuiteo (procédures, cas d'usage)",
+    "vision_analysis": "analyse de captures d'écran Akuiteo fournies par l'utilisateur",
+}
+SYSTEM_PROMPT_RULES = [             # (outil requis, None si la règle vaut pour tous les modes)
+    (None, "Réponds toujours en français sauf si l'utilisateur parle anglais"),
+    ("rag_search", "Pour toute question procédurale, utilise d'abord rag_search"),
+    ("vision_analysis", "Si une image est fournie, utilise vision_analysis pour l'analyser"),
+    (None, 'Cite la source documentaire de tes réponses (ex: "Source : Livre Blanc, §3.2")'),
+    (None, "Si tu n'es pas sûr, dis-le clairement et propose une recherche complémentaire"),
+]
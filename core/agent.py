@@ -2,21 +2,40 @@
 core/agent.py — Agent ReAct Akuiteo avec tools RAG + Vision
 Architecture : ReAct loop manuel via Claude API (tool_use)
 """
+import asyncio
+import contextvars
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Iterator, Optional, Union
 
 import anthropic
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
-from config import ANTHROPIC_API_KEY, CLAUDE_MODEL, MAX_ITERATIONS, SYSTEM_PROMPT
-from core.rag_engine import AkuiteoRAGEngine
-from core.vision_engine import AkuiteoVisionEngine
+from config import (
+    CLAUDE_MODEL, MAX_ITERATIONS, PROMPT_CACHING, TOOL_MAX_WORKERS, VISION_MODE,
+    SYSTEM_PROMPT_INTRO, SYSTEM_PROMPT_TOOLS, SYSTEM_PROMPT_RULES,
+)
+from core.answer_cache import SemanticAnswerCache
+from core.clients import async_client_scope, get_async_client, get_client
+from core.history import ConversationHistoryManager
+from core.tracing import annotate, span, traced
+
+if TYPE_CHECKING:  # core.rag_engine importe llama_index/torch : chargé par l'appelant
+    from core.rag_engine import AkuiteoRAGEngine
+    from core.vision_engine import AkuiteoVisionEngine
 
 logger = logging.getLogger(__name__)
 
+# Pool borné partagé par toutes les sessions pour exécuter les tools d'une même réponse
+_TOOL_POOL = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="akuiteo-tool")
+
+# Point de cache de prompt (TTL 5 min, prolongé à chaque lecture)
+CACHE_CONTROL = {"type": "ephemeral"}
+
 # ─── Définition des tools pour l'API Claude ───────────────────────────────────
 
 TOOLS = [
@@ -65,6 +84,30 @@ TOOLS = [
 ]
 
 
+# Consignes d'analyse d'écran ajoutées au prompt système en VISION_MODE = "inline"
+INLINE_VISION_PROMPT = """
+Mode vision intégré : les captures d'écran Akuiteo sont jointes directement
+au message de l'utilisateur. Analyse-les toi-même ; pour une capture :
+1. Identifie précisément le module et le menu visible (ex: CRM > Opportunités)
+2. Décris les éléments d'interface utiles à la question (boutons, menus, données affichées)
+3. Identifie si une action est en cours ou un problème visible
+4. Explique ce que l'utilisateur peut faire depuis cet écran
+5. Signale tout élément inhabituel ou erreur visible
+"""
+
+_TOOL_COUNTS = {1: "un outil", 2: "deux outils"}
+
+
+def build_system_prompt(tool_names: list[str]) -> str:
+    """Prompt système décrivant les seuls outils exposés (et les règles qui les concernent)."""
+    tools = [name for name in SYSTEM_PROMPT_TOOLS if name in tool_names]
+    lines = [SYSTEM_PROMPT_INTRO, f"Tu as accès à {_TOOL_COUNTS.get(len(tools), f'{len(tools)} outils')} :"]
+    lines += [f"{i}. {name} : {SYSTEM_PROMPT_TOOLS[name]}" for i, name in enumerate(tools, 1)]
+    lines += ["", "Règles :"]
+    lines += [f"- {rule}" for tool, rule in SYSTEM_PROMPT_RULES if tool is None or tool in tools]
+    return "\n".join(lines) + "\n"
+
+
 # ─── Agent ReAct ───────────────────────────────────────────────────────────────
 
 class AkuiteoAgent:
@@ -74,18 +117,55 @@ class AkuiteoAgent:
     Implémente un ReAct loop (Reason + Act) via l'API Claude tool_use.
     - Tool 1 : rag_search  → recherche documentaire vectorielle
     - Tool 2 : vision_analysis → analyse Claude Vision sur captures Akuiteo
+
+    vision_mode = "inline" : pas de tool vision_analysis ; la capture, déjà
+    jointe au message, est analysée par le modèle ReAct lui-même (consignes
+    INLINE_VISION_PROMPT), ce qui économise un appel Claude et un envoi d'image.
     """
 
-    def __init__(self, rag_engine: AkuiteoRAGEngine, vision_engine: AkuiteoVisionEngine):
+    def __init__(
+        self,
+        rag_engine: "AkuiteoRAGEngine",
+        vision_engine: "AkuiteoVisionEngine",
+        vision_mode: str = VISION_MODE,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        client: Optional[anthropic.Anthropic] = None,
+    ):
+        """
+        Args:
+            answer_cache : cache sémantique des réponses ; None le désactive
+                           (à l'appelant de respecter ANSWER_CACHE_ENABLED, cf. load_answer_cache)
+            client : client Anthropic injecté ; par défaut le client partagé du
+                     processus (core/clients.py, pool de connexions commun aux sessions)
+        """
+        if vision_mode not in ("tool", "inline"):
+            raise ValueError(f"VISION_MODE inconnu : {vision_mode}")
         self.rag = rag_engine
         self.vision = vision_engine
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.vision_mode = vision_mode
+        if vision_mode == "inline":
+            self.tools = [tool for tool in TOOLS if tool["name"] != "vision_analysis"]
+        else:
+            self.tools = TOOLS
+        self.system_prompt = build_system_prompt([tool["name"] for tool in self.tools])
+        if vision_mode == "inline":
+            self.system_prompt += INLINE_VISION_PROMPT
+        self._client = client
         self.conversation_history = []
+        self.history = ConversationHistoryManager()
+        self.answer_cache = answer_cache
+        self.turn_sources: list[str] = []
+
+    @property
+    def client(self) -> anthropic.Anthropic:
+        """Client injecté, sinon le client partagé du processus (créé au premier appel synchrone)."""
+        return self._client if self._client is not None else get_client()
 
     def reset_conversation(self):
         """Réinitialise l'historique de conversation."""
         self.conversation_history = []
 
+    @traced("agent.turn")
     def run(
         self,
         user_message: str,
@@ -99,96 +179,362 @@ class AkuiteoAgent:
             image_input  : Capture d'écran Akuiteo optionnelle
 
         Returns:
-            dict avec 'response' (str), 'tools_used' (list), 'iterations' (int)
+            dict avec 'response' (str), 'tools_used' (list), 'iterations' (int),
+            'tool_timings' (list de {tool, tool_use_id, duration_ms}), 'usage' (tokens du tour),
+            'sources' (documents cités par rag_search) et 'cached' (réponse issue du cache sémantique)
         """
+        turn = self._new_turn()
+        cached = self._lookup_answer(user_message, image_input, turn)
+
         # Construction du message utilisateur (texte + image si fournie)
         user_content = self._build_user_content(user_message, image_input)
-        self.conversation_history.append({"role": "user", "content": user_content})
-
-        tools_used = []
-        iterations = 0
+        self._append_user_message(user_content)
+        if cached is not None:
+            return self._cached_turn(cached, turn)
 
         # ── ReAct Loop ────────────────────────────────────────────────────────
-        while iterations < MAX_ITERATIONS:
-            iterations += 1
-
-            response = self.client.messages.create(
-                model=CLAUDE_MODEL,
-                max_tokens=2000,
-                system=SYSTEM_PROMPT,
-                tools=TOOLS,
-                messages=self.conversation_history,
-            )
+        while turn["iterations"] < MAX_ITERATIONS:
+            turn["iterations"] += 1
+
+            with span("claude.messages", iteration=turn["iterations"]):
+                response = self.client.messages.create(**self._request_kwargs())
+                self._record_usage(response, turn)
 
             # Pas d'appel de tool → réponse finale
             if response.stop_reason == "end_turn":
-                final_text = self._extract_text(response)
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response.content,
-                })
-                return {
-                    "response": final_text,
-                    "tools_used": tools_used,
-                    "iterations": iterations,
-                }
+                return self._finish_turn(response, turn)
 
             # Traitement des tool_use blocks
             if response.stop_reason == "tool_use":
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response.content,
-                })
-
-                tool_results = []
-                for block in response.content:
-                    if block.type != "tool_use":
-                        continue
-
-                    tool_name = block.name
-                    tool_input = block.input
-                    tools_used.append(tool_name)
-
-                    logger.info(f"🔧 Tool appelé : {tool_name} | Input : {tool_input}")
-
-                    # ── Exécution du tool ──────────────────────────────────
-                    if tool_name == "rag_search":
-                        result = self._run_rag_search(tool_input.get("query", ""))
-
-                    elif tool_name == "vision_analysis":
-                        if image_input is None:
-                            result = "⚠️ Aucune image n'a été fournie par l'utilisateur. Impossible d'analyser."
-                        else:
-                            result = self._run_vision_analysis(
-                                image_input=image_input,
-                                question=tool_input.get("question", user_message),
-                                rag_context=tool_input.get("rag_context", ""),
-                            )
-                    else:
-                        result = f"Tool inconnu : {tool_name}"
-
-                    tool_results.append({
-                        "type": "tool_result",
+                tool_blocks = self._start_tool_calls(response, turn)
+                tool_results, timings = self._execute_tools(tool_blocks, image_input, user_message)
+                self._end_tool_calls(tool_results, timings, turn)
+
+        return self._max_iterations_reached(turn)
+
+    @traced("agent.turn")
+    def run_stream(
+        self,
+        user_message: str,
+        image_input: Optional[Union[str, bytes]] = None,
+    ) -> Iterator[dict]:
+        """
+        Variante streaming de run() (Messages API en streaming).
+
+        Yields des événements dict :
+            {"type": "text", "text": ...}                              delta de texte
+            {"type": "tool_start", "tool", "tool_use_id", "input"}     avant exécution
+            {"type": "tool_end", "tool", "tool_use_id", "duration_ms"} dès la fin de chaque tool
+            {"type": "done", ...}                                      même contenu que run()
+        """
+        turn = self._new_turn()
+        cached = self._lookup_answer(user_message, image_input, turn)
+
+        user_content = self._build_user_content(user_message, image_input)
+        self._append_user_message(user_content)
+        if cached is not None:
+            yield {"type": "text", "text": cached["response"]}
+            yield {"type": "done", **self._cached_turn(cached, turn)}
+            return
+
+        # ── ReAct Loop ────────────────────────────────────────────────────────
+        while turn["iterations"] < MAX_ITERATIONS:
+            turn["iterations"] += 1
+
+            with span("claude.messages", iteration=turn["iterations"], stream=True) as call:
+                with self.client.messages.stream(**self._request_kwargs()) as stream:
+                    for text in stream.text_stream:
+                        if "first_token_ms" not in call.attributes:
+                            call.set(first_token_ms=call.duration_ms)
+                        yield {"type": "text", "text": text}
+                    response = stream.get_final_message()
+                self._record_usage(response, turn)
+
+            if response.stop_reason == "end_turn":
+                yield {"type": "done", **self._finish_turn(response, turn)}
+                return
+
+            if response.stop_reason == "tool_use":
+                tool_blocks = self._start_tool_calls(response, turn)
+                for block in tool_blocks:
+                    yield {
+                        "type": "tool_start",
+                        "tool": block.name,
                         "tool_use_id": block.id,
-                        "content": result,
-                    })
+                        "input": block.input,
+                    }
+                groups = self._group_tool_calls(tool_blocks)
+                completed = [None] * len(groups)
+                for i, result in self._iter_tool_groups(groups, image_input, user_message):
+                    completed[i] = result
+                    for block in groups[i]:
+                        yield {
+                            "type": "tool_end",
+                            "tool": block.name,
+                            "tool_use_id": block.id,
+                            "duration_ms": result[1],
+                        }
+                tool_results, timings = self._assemble_tool_results(tool_blocks, groups, completed)
+                self._end_tool_calls(tool_results, timings, turn)
+
+        yield {"type": "done", **self._max_iterations_reached(turn)}
+
+    # ── Étapes du ReAct loop (partagées avec AsyncAkuiteoAgent) ─────────────────
+
+    def _append_user_message(self, user_content):
+        """Compacte l'historique s'il dépasse le budget, puis ajoute le message du nouveau tour."""
+        self.conversation_history = self.history.compact(self.conversation_history)
+        self.conversation_history.append({"role": "user", "content": user_content})
+        self.turn_sources = []
+
+    @staticmethod
+    def _new_turn() -> dict:
+        return {
+            "tools_used": [],
+            "tool_timings": [],
+            "iterations": 0,
+            "usage": {
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+            },
+        }
 
-                # Ajout des résultats tools dans l'historique
-                self.conversation_history.append({
-                    "role": "user",
-                    "content": tool_results,
-                })
+    @staticmethod
+    def _record_usage(response, turn: dict):
+        """Cumule la consommation de tokens (dont écriture / lecture du cache de prompt) de chaque appel du tour."""
+        usage = {key: getattr(response.usage, key, 0) or 0 for key in turn["usage"]}
+        for key, count in usage.items():
+            turn["usage"][key] += count
+        annotate(stop_reason=response.stop_reason, **usage)
+        logger.info(
+            f"🧮 Tokens : {usage['input_tokens']} in / {usage['output_tokens']} out | "
+            f"cache : {usage['cache_read_input_tokens']} lus / {usage['cache_creation_input_tokens']} écrits"
+        )
+
+    def _request_kwargs(self) -> dict:
+        """
+        Paramètres de l'appel Messages API pour l'itération courante.
 
-        # Fallback si MAX_ITERATIONS atteint
-        logger.warning(f"⚠️ MAX_ITERATIONS ({MAX_ITERATIONS}) atteint.")
+        Avec PROMPT_CACHING, deux points de cache : le system (préfixe tools +
+        system, identique pour toutes les conversations) et le dernier bloc de
+        l'historique (préfixe relu à l'itération / au tour suivant).
+        """
+        if not PROMPT_CACHING:
+            return {
+                "model": CLAUDE_MODEL,
+                "max_tokens": 2000,
+                "system": self.system_prompt,
+                "tools": self.tools,
+                "messages": self.conversation_history,
+            }
         return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": 2000,
+            "system": [{"type": "text", "text": self.system_prompt, "cache_control": CACHE_CONTROL}],
+            "tools": self.tools,
+            "messages": _with_cache_breakpoint(self.conversation_history),
+        }
+
+    def _finish_turn(self, response, turn: dict) -> dict:
+        """Enregistre la réponse finale dans l'historique (et le cache sémantique) et construit le résultat."""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": response.content,
+        })
+        result = {
+            "response": self._extract_text(response),
+            "tools_used": turn["tools_used"],
+            "iterations": turn["iterations"],
+            "tool_timings": turn["tool_timings"],
+            "usage": turn["usage"],
+            "sources": list(dict.fromkeys(self.turn_sources)),
+            "cached": False,
+        }
+        self._store_answer(result, turn)
+        _annotate_turn(result)
+        return result
+
+    # ── Cache sémantique des réponses ───────────────────────────────────────────
+
+    def _lookup_answer(self, user_message: str, image_input, turn: dict) -> Optional[dict]:
+        """
+        Cherche une réponse en cache pour une question texte posée sans
+        contexte (début de conversation) ; prépare sinon turn["question_embedding"]
+        pour mémoriser la réponse en fin de tour.
+        """
+        if self.answer_cache is None or image_input is not None or self.conversation_history:
+            return None
+        if not self.answer_cache.accepts(user_message):
+            return None
+        version = getattr(self.rag, "index_version", None)
+        if version is None:
+            return None
+        try:
+            start = time.perf_counter()
+            with span("answer_cache.lookup") as lookup:
+                embedding = self.rag.embed_query(user_message)
+                cached = self.answer_cache.lookup(embedding, version)
+                lookup.set(hit=cached is not None)
+        except Exception as e:
+            logger.warning(f"Cache de réponses indisponible : {e}")
+            return None
+        if cached is None:
+            turn["question"] = user_message
+            turn["question_embedding"] = embedding
+            turn["index_version"] = version
+            return None
+        logger.info(
+            f"💾 Réponse en cache (similarité {cached['similarity']}) : « {cached['question']} » "
+            f"en {_elapsed_ms(start)} ms"
+        )
+        return cached
+
+    def _cached_turn(self, cached: dict, turn: dict) -> dict:
+        """Tour servi par le cache : la réponse est ajoutée à l'historique comme une réponse du modèle."""
+        self.conversation_history.append({"role": "assistant", "content": cached["response"]})
+        result = {
+            "response": cached["response"],
+            "tools_used": cached["tools_used"],
+            "iterations": 0,
+            "tool_timings": [],
+            "usage": turn["usage"],
+            "sources": cached["sources"],
+            "cached": True,
+        }
+        _annotate_turn(result)
+        return result
+
+    def _store_answer(self, result: dict, turn: dict):
+        if "question_embedding" not in turn:
+            return
+        try:
+            self.answer_cache.put(
+                question=turn["question"],
+                embedding=turn["question_embedding"],
+                index_version=turn["index_version"],
+                response=result["response"],
+                sources=result["sources"],
+                tools_used=result["tools_used"],
+            )
+        except Exception as e:
+            logger.warning(f"Impossible d'enregistrer la réponse en cache : {e}")
+
+    def _start_tool_calls(self, response, turn: dict) -> list:
+        """Enregistre la réponse tool_use dans l'historique et renvoie ses tool_use blocks."""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": response.content,
+        })
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+        for block in tool_blocks:
+            turn["tools_used"].append(block.name)
+            logger.info(f"🔧 Tool appelé : {block.name} | Input : {block.input}")
+        return tool_blocks
+
+    def _end_tool_calls(self, tool_results: list, timings: list, turn: dict):
+        """Ajoute les résultats des tools dans l'historique."""
+        turn["tool_timings"].extend(timings)
+        self.conversation_history.append({
+            "role": "user",
+            "content": tool_results,
+        })
+
+    def _max_iterations_reached(self, turn: dict) -> dict:
+        """Fallback si MAX_ITERATIONS atteint."""
+        logger.warning(f"⚠️ MAX_ITERATIONS ({MAX_ITERATIONS}) atteint.")
+        annotate(max_iterations_reached=True)
+        result = {
             "response": "Je n'ai pas pu finaliser la réponse dans le nombre d'itérations autorisé. Reformulez votre question.",
-            "tools_used": tools_used,
-            "iterations": iterations,
+            "tools_used": turn["tools_used"],
+            "iterations": turn["iterations"],
+            "tool_timings": turn["tool_timings"],
+            "usage": turn["usage"],
+            "sources": list(dict.fromkeys(self.turn_sources)),
+            "cached": False,
         }
+        _annotate_turn(result)
+        return result
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
+    @staticmethod
+    def _group_tool_calls(tool_blocks: list) -> list[list]:
+        """Regroupe les tool_use : tous les rag_search ensemble (query_many), un groupe par autre tool."""
+        rag_blocks = [block for block in tool_blocks if block.name == "rag_search"]
+        groups = [rag_blocks] if rag_blocks else []
+        groups += [[block] for block in tool_blocks if block.name != "rag_search"]
+        return groups
+
+    @staticmethod
+    def _assemble_tool_results(tool_blocks: list, groups: list[list], completed: list) -> tuple[list, list]:
+        """Remet les sorties (une par block, durée par groupe) dans l'ordre des tool_use_id."""
+        outputs, durations = {}, {}
+        for blocks, (group_outputs, duration_ms) in zip(groups, completed):
+            for block, output in zip(blocks, group_outputs):
+                outputs[block.id] = output
+                durations[block.id] = duration_ms
+
+        tool_results = [
+            {"type": "tool_result", "tool_use_id": block.id, "content": outputs[block.id]}
+            for block in tool_blocks
+        ]
+        timings = [
+            {"tool": block.name, "tool_use_id": block.id, "duration_ms": durations[block.id]}
+            for block in tool_blocks
+        ]
+        return tool_results, timings
+
+    def _execute_tools(self, tool_blocks: list, image_input, user_message: str) -> tuple[list, list]:
+        """
+        Exécute les tool_use d'une même réponse en parallèle sur le pool partagé.
+        Les rag_search sont regroupés en un seul appel query_many ; chaque
+        vision_analysis est une tâche distincte.
+
+        Returns:
+            (tool_results dans l'ordre des tool_use_id, timings par tool)
+        """
+        groups = self._group_tool_calls(tool_blocks)
+        completed = [None] * len(groups)
+        for i, result in self._iter_tool_groups(groups, image_input, user_message):
+            completed[i] = result
+        return self._assemble_tool_results(tool_blocks, groups, completed)
+
+    def _iter_tool_groups(self, groups: list[list], image_input, user_message: str) -> Iterator[tuple[int, tuple]]:
+        """Yields (indice du groupe, (sorties, durée en ms)) dans l'ordre de fin des groupes."""
+        if len(groups) == 1:
+            yield 0, _timed(self._run_tool_group, groups[0], image_input, user_message)
+            return
+        futures = {
+            _TOOL_POOL.submit(
+                contextvars.copy_context().run,  # spans des tools rattachés au tour
+                _timed, self._run_tool_group, blocks, image_input, user_message,
+            ): i
+            for i, blocks in enumerate(groups)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def _run_tool_group(self, blocks: list, image_input, user_message: str) -> list[str]:
+        """Exécute un groupe de tool_use ; renvoie une sortie par block."""
+        with span("tool." + blocks[0].name, calls=len(blocks)):
+            if blocks[0].name == "rag_search":
+                return self._run_rag_searches([block.input.get("query", "") for block in blocks])
+            return self._run_single_tool(blocks[0], image_input, user_message)
+
+    def _run_single_tool(self, block, image_input, user_message: str) -> list[str]:
+        """Exécute un tool autre que rag_search (sortie en liste, comme _run_rag_searches)."""
+        if block.name == "vision_analysis" and self.vision_mode == "tool":
+            if image_input is None:
+                return ["⚠️ Aucune image n'a été fournie par l'utilisateur. Impossible d'analyser."]
+            return [self._run_vision_analysis(
+                image_input=image_input,
+                question=block.input.get("question", user_message),
+                rag_context=block.input.get("rag_context", ""),
+            )]
+        return [f"Tool inconnu : {block.name}"]
+
     def _build_user_content(self, text: str, image_input=None) -> list | str:
         """Construit le contenu du message utilisateur (texte ± image)."""
         if image_input is None:
@@ -196,7 +542,6 @@ class AkuiteoAgent:
 
         # Message multimodal avec image
         try:
-            from core.vision_engine import AkuiteoVisionEngine
             img_b64, media_type = self.vision._prepare_image(image_input)
             return [
                 {
@@ -215,19 +560,35 @@ class AkuiteoAgent:
 
     def _run_rag_search(self, query: str) -> str:
         """Exécute une recherche RAG et formate le résultat pour Claude."""
-        try:
-            result = self.rag.query(query)
-            if not result["passages"]:
-                return "Aucun passage pertinent trouvé dans la documentation Akuiteo pour cette requête."
+        return self._run_rag_searches([query])[0]
 
-            formatted = []
-            for i, (passage, source) in enumerate(zip(result["passages"], result["sources"]), 1):
-                formatted.append(f"[{i}] Source : {source}\n{passage}")
-
-            return "\n\n---\n\n".join(formatted)
+    def _run_rag_searches(self, queries: list[str]) -> list[str]:
+        """Exécute plusieurs recherches RAG en un seul appel groupé (query_many)."""
+        if not queries:
+            return []
+        try:
+            results = self.rag.query_many(queries)
         except Exception as e:
             logger.error(f"Erreur RAG : {e}")
-            return f"Erreur lors de la recherche documentaire : {e}"
+            return [f"Erreur lors de la recherche documentaire : {e}"] * len(queries)
+        return [self._format_rag_result(result) for result in results]
+
+    def _format_rag_result(self, result: dict) -> str:
+        """Formate les passages d'une recherche RAG pour Claude et mémorise leurs sources pour le tour."""
+        self.turn_sources.extend(result["sources"])
+        return self._format_passages(result)
+
+    @staticmethod
+    def _format_passages(result: dict) -> str:
+        """Formate les passages d'une recherche RAG pour Claude."""
+        if not result["passages"]:
+            return "Aucun passage pertinent trouvé dans la documentation Akuiteo pour cette requête."
+
+        formatted = []
+        for i, (passage, source) in enumerate(zip(result["passages"], result["sources"]), 1):
+            formatted.append(f"[{i}] Source : {source}\n{passage}")
+
+        return "\n\n---\n\n".join(formatted)
 
     def _run_vision_analysis(self, image_input, question: str, rag_context: str = "") -> str:
         """Exécute l'analyse vision et formate le résultat."""
@@ -237,14 +598,19 @@ class AkuiteoAgent:
                 user_question=question,
                 context=rag_context,
             )
-            analysis = result.get("analysis", "Analyse indisponible.")
-            meta = result.get("metadata", {})
-            tokens_info = f"[Tokens: {meta.get('input_tokens', '?')} in / {meta.get('output_tokens', '?')} out]"
-            return f"{analysis}\n\n{tokens_info}"
+            return self._format_vision_result(result)
         except Exception as e:
             logger.error(f"Erreur Vision : {e}")
             return f"Erreur lors de l'analyse de l'image : {e}"
 
+    @staticmethod
+    def _format_vision_result(result: dict) -> str:
+        """Formate l'analyse vision (et sa consommation de tokens) pour Claude."""
+        analysis = result.get("analysis", "Analyse indisponible.")
+        meta = result.get("metadata", {})
+        tokens_info = f"[Tokens: {meta.get('input_tokens', '?')} in / {meta.get('output_tokens', '?')} out]"
+        return f"{analysis}\n\n{tokens_info}"
+
     def _extract_text(self, response) -> str:
         """Extrait le texte de la réponse finale de l'API."""
         text_parts = []
@@ -252,3 +618,166 @@ class AkuiteoAgent:
             if hasattr(block, "text"):
                 text_parts.append(block.text)
         return "\n".join(text_parts) if text_parts else "Pas de réponse générée."
+
+
+
+# ─── Agent asynchrone ─────────────────────────────────────────────────────────
+
+class AsyncAkuiteoAgent(AkuiteoAgent):
+    """
+    Variante asyncio de l'agent, pour servir de nombreuses conversations
+    simultanées dans un seul processus sans bloquer un thread par requête.
+    - Appels Claude via AsyncAnthropic
+    - Vision via AkuiteoVisionEngine.aanalyze_screenshot
+    - Retrieval (CPU) déporté dans l'executor via AkuiteoRAGEngine.aquery_many
+    Le ReAct loop et l'historique sont ceux d'AkuiteoAgent ; le client synchrone
+    n'est créé que si run_stream est utilisé. Sert l'endpoint /chat de api/server.py.
+    """
+
+    def __init__(
+        self,
+        rag_engine: "AkuiteoRAGEngine",
+        vision_engine: "AkuiteoVisionEngine",
+        vision_mode: str = VISION_MODE,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        client: Optional[anthropic.AsyncAnthropic] = None,
+    ):
+        super().__init__(rag_engine, vision_engine, vision_mode, answer_cache)
+        self._async_client = client
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """Client injecté, sinon le client partagé de la boucle d'événements courante."""
+        return self._async_client if self._async_client is not None else get_async_client()
+
+    def run(
+        self,
+        user_message: str,
+        image_input: Optional[Union[str, bytes]] = None,
+    ) -> dict:
+        """API synchrone : simple enveloppe de arun() (hors boucle d'événements active)."""
+        async def scoped_run():
+            async with async_client_scope():
+                return await self.arun(user_message, image_input)
+
+        return asyncio.run(scoped_run())
+
+    @traced("agent.turn")
+    async def arun(
+        self,
+        user_message: str,
+        image_input: Optional[Union[str, bytes]] = None,
+    ) -> dict:
+        """
+        Point d'entrée asynchrone de l'agent — même contrat que AkuiteoAgent.run.
+        """
+        turn = self._new_turn()
+        cached = await asyncio.to_thread(self._lookup_answer, user_message, image_input, turn)
+
+        user_content = await asyncio.to_thread(self._build_user_content, user_message, image_input)
+        self._append_user_message(user_content)
+        if cached is not None:
+            return self._cached_turn(cached, turn)
+
+        # ── ReAct Loop ────────────────────────────────────────────────────────
+        while turn["iterations"] < MAX_ITERATIONS:
+            turn["iterations"] += 1
+
+            with span("claude.messages", iteration=turn["iterations"]):
+                response = await self.async_client.messages.create(**self._request_kwargs())
+                self._record_usage(response, turn)
+
+            if response.stop_reason == "end_turn":
+                return self._finish_turn(response, turn)
+
+            if response.stop_reason == "tool_use":
+                tool_blocks = self._start_tool_calls(response, turn)
+                tool_results, timings = await self._aexecute_tools(tool_blocks, image_input, user_message)
+                self._end_tool_calls(tool_results, timings, turn)
+
+        return self._max_iterations_reached(turn)
+
+    async def _aexecute_tools(self, tool_blocks: list, image_input, user_message: str) -> tuple[list, list]:
+        """Exécute les groupes de tool_use concurremment (asyncio.gather)."""
+        groups = self._group_tool_calls(tool_blocks)
+        completed = await asyncio.gather(*(
+            _atimed(self._arun_tool_group(blocks, image_input, user_message))
+            for blocks in groups
+        ))
+        return self._assemble_tool_results(tool_blocks, groups, completed)
+
+    async def _arun_tool_group(self, blocks: list, image_input, user_message: str) -> list[str]:
+        with span("tool." + blocks[0].name, calls=len(blocks)):
+            return await self._arun_tool_calls(blocks, image_input, user_message)
+
+    async def _arun_tool_calls(self, blocks: list, image_input, user_message: str) -> list[str]:
+        if blocks[0].name == "rag_search":
+            queries = [block.input.get("query", "") for block in blocks]
+            try:
+                results = await self.rag.aquery_many(queries)
+            except Exception as e:
+                logger.error(f"Erreur RAG : {e}")
+                return [f"Erreur lors de la recherche documentaire : {e}"] * len(queries)
+            return [self._format_rag_result(result) for result in results]
+
+        block = blocks[0]
+        if block.name == "vision_analysis" and image_input is not None and self.vision_mode == "tool":
+            try:
+                result = await self.vision.aanalyze_screenshot(
+                    image_input=image_input,
+                    user_question=block.input.get("question", user_message),
+                    context=block.input.get("rag_context", ""),
+                )
+                return [self._format_vision_result(result)]
+            except Exception as e:
+                logger.error(f"Erreur Vision : {e}")
+                return [f"Erreur lors de l'analyse de l'image : {e}"]
+
+        return self._run_single_tool(block, image_input, user_message)
+
+
+def _with_cache_breakpoint(messages: list) -> list:
+    """
+    Copie de l'historique avec un point de cache sur le dernier bloc du dernier
+    message. L'historique lui-même n'est pas modifié : un seul point de cache
+    glissant, l'API retrouvant les préfixes déjà écrits aux itérations précédentes.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+    elif content and isinstance(content[-1], dict):
+        blocks = [*content[:-1], {**content[-1], "cache_control": CACHE_CONTROL}]
+    else:
+        return messages
+    return [*messages[:-1], {**last, "content": blocks}]
+
+
+def _annotate_turn(result: dict):
+    """Résumé du tour sur le span agent.turn."""
+    annotate(
+        iterations=result["iterations"],
+        tools_used=result["tools_used"],
+        cached=result["cached"],
+        **result["usage"],
+    )
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _timed(fn, *args) -> tuple:
+    """Appelle fn(*args) et renvoie (résultat, durée en ms)."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _atimed(coro) -> tuple:
+    """Attend coro et renvoie (résultat, durée en ms)."""
+    start = time.perf_counter()
+    result = await coro
+    return result, round((time.perf_counter() - start) * 1000, 1)
@@ -0,0 +1,196 @@
+"""
+core/ann.py — Index de plus proches voisins approximatifs (HNSW / IVF) pour les grands corpus
+"""
+import hashlib
+import json
+import logging
+import math
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    ANN_BACKEND, ANN_MIN_VECTORS, SEARCH_BLOCK_ROWS,
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+    IVF_NLIST, IVF_NPROBE, IVF_TRAIN_ITERS,
+)
+
+logger = logging.getLogger(__name__)
+
+ANN_META_FILE = "ann.json"
+
+
+class IVFIndex:
+    """
+    Index IVF (inverted file) en NumPy pur, sans dépendance.
+    - k-means sphérique sur un échantillon → nlist centroïdes
+    - chaque vecteur est rangé dans la liste de son centroïde le plus proche
+    - une requête ne parcourt que les nprobe listes les plus proches
+    Compromis rappel/latence : augmenter IVF_NPROBE améliore le rappel.
+    """
+
+    name = "ivf"
+    ARRAYS_FILE = "ann_ivf.npz"
+
+    def __init__(self, nprobe: int = IVF_NPROBE):
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.order = np.empty(0, dtype=np.int32)    # lignes triées par liste
+        self.offsets = np.zeros(1, dtype=np.int64)  # début de chaque liste dans order
+
+    def params(self) -> dict:
+        return {"nlist": IVF_NLIST, "iters": IVF_TRAIN_ITERS}
+
+    def build(self, embeddings: np.ndarray, nlist: Optional[int] = IVF_NLIST, iters: int = IVF_TRAIN_ITERS):
+        n = embeddings.shape[0]
+        nlist = nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(n, size=min(n, 32 * nlist), replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iters):
+            assign = self._assign(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            # Centroïde sphérique = somme normalisée des membres de la liste
+            centroids[nonempty] = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assign = self._assign(embeddings, centroids)
+        self.centroids = centroids
+        self.order = np.argsort(assign, kind="stable").astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+        """Centroïde le plus proche de chaque vecteur, calculé par blocs pour borner la mémoire."""
+        assign = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe]
+        )
+
+    def save(self, persist_dir: Path):
+        np.savez(persist_dir / self.ARRAYS_FILE, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    def load(self, persist_dir: Path, dim: int, count: int):
+        arrays = np.load(persist_dir / self.ARRAYS_FILE)
+        self.centroids = arrays["centroids"]
+        self.order = arrays["order"]
+        self.offsets = arrays["offsets"]
+
+
+class HNSWIndex:
+    """
+    Graphe HNSW via hnswlib (dépendance optionnelle : pip install hnswlib).
+    Compromis rappel/latence : HNSW_EF_SEARCH (requête), HNSW_M et
+    HNSW_EF_CONSTRUCTION (qualité du graphe au build).
+    """
+
+    name = "hnsw"
+    GRAPH_FILE = "ann_hnsw.bin"
+
+    def __init__(self, ef_search: int = HNSW_EF_SEARCH):
+        import hnswlib  # ImportError gérée par create_ann_index
+        self._hnswlib = hnswlib
+        self.ef_search = ef_search
+        self.graph = None
+
+    def params(self) -> dict:
+        return {"M": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+
+    def build(self, embeddings: np.ndarray):
+        n, dim = embeddings.shape
+        self.graph = self._hnswlib.Index(space="ip", dim=dim)
+        self.graph.init_index(max_elements=n, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            self.graph.add_items(block, np.arange(start, start + len(block)))
+        self.graph.set_ef(self.ef_search)
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        self.graph.set_ef(max(self.ef_search, k))
+        labels, _ = self.graph.knn_query(query[None, :], k=min(k, self.graph.get_current_count()))
+        return labels[0].astype(np.int64)
+
+    def save(self, persist_dir: Path):
+        self.graph.save_index(str(persist_dir / self.GRAPH_FILE))
+
+    def load(self, persist_dir: Path, dim: int, count: int):
+        self.graph = self._hnswlib.Index(space="ip", dim=dim)
+        self.graph.load_index(str(persist_dir / self.GRAPH_FILE), max_elements=count)
+        self.graph.set_ef(self.ef_search)
+
+
+def create_ann_index(backend: str = ANN_BACKEND, count: int = 0):
+    """
+    Instancie le backend ANN configuré, ou None pour la recherche exacte.
+    "auto" : HNSW si hnswlib est installé, sinon IVF ; exact sous ANN_MIN_VECTORS.
+    """
+    if backend == "exact" or count < ANN_MIN_VECTORS:
+        return None
+    if backend in ("auto", "hnsw"):
+        try:
+            return HNSWIndex()
+        except ImportError:
+            if backend == "hnsw":
+                logger.warning("⚠️  hnswlib non installé, repli sur l'index IVF.")
+    return IVFIndex()
+
+
+def _ids_digest(node_ids: List[str]) -> str:
+    return hashlib.sha256("\n".join(node_ids).encode("utf-8")).hexdigest()
+
+
+def load_or_build_ann(persist_dir: Path, embeddings: np.ndarray, node_ids: List[str], backend: str = ANN_BACKEND):
+    """
+    Charge l'index ANN persisté s'il correspond encore aux vecteurs du store,
+    sinon le (re)construit et le sauvegarde sous persist_dir.
+    """
+    ann = create_ann_index(backend, len(node_ids))
+    if ann is None:
+        return None
+
+    meta_path = persist_dir / ANN_META_FILE
+    digest = _ids_digest(node_ids)
+    if meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if (
+                meta.get("backend") == ann.name
+                and meta.get("params") == ann.params()
+                and meta.get("ids_digest") == digest
+            ):
+                ann.load(persist_dir, dim=embeddings.shape[1], count=len(node_ids))
+                logger.info(f"⚡ Index ANN {ann.name.upper()} chargé ({len(node_ids)} vecteurs).")
+                return ann
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            logger.warning(f"⚠️  Index ANN illisible, reconstruction : {e}")
+
+    logger.info(f"🔨 Construction de l'index ANN {ann.name.upper()} ({len(node_ids)} vecteurs)...")
+    ann.build(embeddings)
+    ann.save(persist_dir)
+    meta_path.write_text(
+        json.dumps({
+            "backend": ann.name,
+            "params": ann.params(),
+            "ids_digest": digest,
+            "count": len(node_ids),
+        }),
+        encoding="utf-8",
+    )
+    return ann
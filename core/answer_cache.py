@@ -0,0 +1,169 @@
+"""
+core/answer_cache.py — Cache sémantique persistant des réponses de l'agent
+"""
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    INDEX_DIR, EMBED_MODEL,
+    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES,
+)
+from core.cache_base import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Chiffres ou codes (AKU-2041, FAC_12, N°3…) : deux questions qui ne diffèrent que par
+# l'identifiant ont des embeddings quasi identiques mais appellent des réponses différentes
+_IDENTIFIER = re.compile(r"\d|\b[A-Z]{2,}[-_/]\w+")
+
+
+class SemanticAnswerCache(SQLiteCache):
+    """
+    Réponses finales de l'agent indexées par l'embedding bge-m3 de la question.
+    - Une question (ou une paraphrase) dont la similarité cosinus avec une
+      question en cache dépasse threshold renvoie la réponse stockée
+    - Entrées valables ttl_s secondes et pour une seule version de l'index RAG
+      (index_version) : un rebuild invalide les réponses qui en dépendaient
+    - Stockage SQLite sous INDEX_DIR ; les vecteurs sont gardés en mémoire
+      (quelques milliers de questions au plus) pour un lookup en un produit matriciel
+    - Les questions contenant des chiffres ou des identifiants ne passent pas par
+      le cache (cf. accepts)
+    """
+
+    table = "answers"
+
+    def __init__(
+        self,
+        path: Path = INDEX_DIR / "answers.sqlite",
+        model_name: str = EMBED_MODEL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_s: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path, [
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " model TEXT NOT NULL,"
+            " index_version TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " response TEXT NOT NULL,"
+            " sources TEXT NOT NULL,"
+            " tools_used TEXT NOT NULL,"
+            " created_at REAL NOT NULL)",
+        ])
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+        self._version: Optional[str] = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+
+    # ── API ───────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def accepts(question: str) -> bool:
+        """False pour une question qui cite un nombre ou un identifiant."""
+        return _IDENTIFIER.search(question) is None
+
+    def lookup(self, embedding: Sequence[float], index_version: str) -> Optional[dict]:
+        """Renvoie {question, response, sources, tools_used, similarity} ou None."""
+        query = _normalize(embedding)
+        with self._lock:
+            self._ensure_loaded(index_version)
+            if len(self._ids):
+                fresh = time.time() - self._created <= self.ttl_s
+                scores = np.where(fresh, self._vectors @ query, -1.0)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    row = self._conn.execute(
+                        "SELECT question, response, sources, tools_used FROM answers WHERE id = ?",
+                        (int(self._ids[best]),),
+                    ).fetchone()
+                    if row is not None:
+                        self.hits += 1
+                        return {
+                            "question": row[0],
+                            "response": row[1],
+                            "sources": json.loads(row[2]),
+                            "tools_used": json.loads(row[3]),
+                            "similarity": round(float(scores[best]), 4),
+                        }
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        embedding: Sequence[float],
+        index_version: str,
+        response: str,
+        sources: List[str],
+        tools_used: List[str],
+    ):
+        with self._lock:
+            now = time.time()
+            # Les réponses d'une autre version de l'index ou expirées ne servent plus
+            self._conn.execute(
+                "DELETE FROM answers WHERE model != ? OR index_version != ? OR created_at < ?",
+                (self.model_name, index_version, now - self.ttl_s),
+            )
+            self._conn.execute(
+                "INSERT INTO answers (model, index_version, question, vector, response, sources, tools_used, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.model_name,
+                    index_version,
+                    question,
+                    _normalize(embedding).tobytes(),
+                    response,
+                    json.dumps(sources, ensure_ascii=False),
+                    json.dumps(tools_used),
+                    now,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            self._version = None  # rechargé au prochain lookup
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._version = None
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _ensure_loaded(self, index_version: str):
+        """Charge en mémoire les vecteurs de la version d'index courante."""
+        if self._version == index_version:
+            return
+        rows = self._conn.execute(
+            "SELECT id, created_at, vector FROM answers WHERE model = ? AND index_version = ?",
+            (self.model_name, index_version),
+        ).fetchall()
+        self._ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+        self._created = np.asarray([row[1] for row in rows], dtype=np.float64)
+        self._vectors = (
+            np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            if rows else np.empty((0, 0), dtype=np.float32)
+        )
+        self._version = index_version
+
+
+def _normalize(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,137 @@
+"""
+core/bm25.py — Index inversé BM25 pour la recherche lexicale (vocabulaire Akuiteo, français)
+"""
+import json
+import math
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import BM25_K1, BM25_B
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+FRENCH_STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette dans de des du elle en et eux il ils je la le les leur leurs
+lui ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses
+son sur ta te tes toi ton tu un une vos votre vous y est sont ete etre avoir ont fait faire
+comme plus peut peuvent dont ou si tout tous toute toutes cela ca aussi
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenisation française : minuscules, accents retirés, élisions séparées
+    (l'opportunité → opportunite), mots vides retirés, pluriels -s/-x ramenés
+    au singulier (racinisation légère, pour garder les termes métier intacts).
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token in FRENCH_STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        if len(token) > 4 and token[-1] in "sx":
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Index inversé BM25 (Okapi) construit sur les chunks du vector store.
+    Les listes de postings sont des tableaux NumPy : le score d'une requête
+    est une accumulation vectorisée sur les seuls documents contenant ses termes.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.doc_len = np.empty(0, dtype=np.float32)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "BM25Index":
+        """Construit l'index à partir des enregistrements {id, text} du vector store."""
+        index = cls()
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = []
+        for doc, record in enumerate(records):
+            index.ids.append(record["id"])
+            tokens = tokenize(record["text"])
+            lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                docs, tfs = postings.setdefault(token, ([], []))
+                docs.append(doc)
+                tfs.append(tf)
+        index.doc_len = np.asarray(lengths, dtype=np.float32)
+        index.postings = {
+            token: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for token, (docs, tfs) in postings.items()
+        }
+        return index
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Renvoie [(node_id, score)] des top_k chunks, meilleurs en premier."""
+        n = len(self.ids)
+        if n == 0 or top_k <= 0:
+            return []
+        avgdl = float(self.doc_len.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / avgdl)
+        scores = np.zeros(n, dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if matched.size == 0:
+            return []
+        k = min(top_k, matched.size)
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[doc], float(scores[doc])) for doc in top]
+
+    # ── Persistance ───────────────────────────────────────────────────────────
+
+    def save(self, path: Path):
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_len": self.doc_len.astype(int).tolist(),
+            "postings": {
+                token: [docs.tolist(), tfs.astype(int).tolist()]
+                for token, (docs, tfs) in self.postings.items()
+            },
+        }
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.ids = payload["ids"]
+        index.doc_len = np.asarray(payload["doc_len"], dtype=np.float32)
+        index.postings = {
+            token: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for token, (docs, tfs) in payload["postings"].items()
+        }
+        return index
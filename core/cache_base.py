@@ -0,0 +1,66 @@
+"""
+core/cache_base.py — Socle commun des caches : compteurs hits / misses, connexion SQLite partagée
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Sequence
+
+
+class CacheCounters:
+    """
+    Compteurs hits / misses et verrou d'un cache thread-safe.
+    Les sous-classes incrémentent hits / misses sous self._lock.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _counter_stats(self, entries: int, **extra) -> dict:
+        """Dictionnaire stats() : entries, champs propres au cache, hits, misses, hit_rate."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            **extra,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class SQLiteCache(CacheCounters):
+    """
+    Cache persistant sur une table SQLite (sous INDEX_DIR en général).
+    - Connexion unique partagée entre threads (check_same_thread=False),
+      sérialisée par self._lock ; journal WAL pour des lectures non bloquantes
+    - schema : instructions CREATE ... IF NOT EXISTS exécutées à l'ouverture
+    """
+
+    table = ""
+
+    def __init__(self, path: Path, schema: Sequence[str]):
+        super().__init__()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in schema:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return self._counter_stats(self.count())
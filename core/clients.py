@@ -0,0 +1,256 @@
+"""
+core/clients.py — Clients Anthropic partagés par le processus (pool de connexions HTTP, keep-alive, métriques)
+"""
+import asyncio
+import contextlib
+import threading
+import time
+import weakref
+from pathlib import Path
+
+import anthropic
+import httpx
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    ANTHROPIC_API_KEY, API_TIMEOUT_S, API_CONNECT_TIMEOUT_S,
+    API_MAX_CONNECTIONS, API_MAX_KEEPALIVE, API_KEEPALIVE_EXPIRY_S, API_MAX_RETRIES,
+)
+
+
+class PoolMetrics:
+    """
+    Utilisation d'un pool de connexions, alimentée par les transports instrumentés.
+    - Requêtes en cours (jusqu'à la fermeture du corps de réponse, streaming compris) et pic
+    - Connexions ouvertes depuis le démarrage : le reste des requêtes a réutilisé
+      une connexion keep-alive (TLS déjà établi)
+    - Connexions actuellement ouvertes / inactives, tous transports confondus
+    Thread-safe.
+    """
+
+    def __init__(self, max_connections: int = API_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_opened = 0
+        self.headers_ms_total = 0.0
+        self._seen_connections = weakref.WeakSet()
+        self._pools = weakref.WeakKeyDictionary()  # transport → (connexions ouvertes, inactives)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def observe(self, transport, connections: list, headers_ms: float):
+        """Relevé du pool d'un transport après réception des en-têtes d'une réponse."""
+        with self._lock:
+            self.headers_ms_total += headers_ms
+            for connection in connections:
+                if connection not in self._seen_connections:
+                    self._seen_connections.add(connection)
+                    self.connections_opened += 1
+            self._pools[transport] = (
+                len(connections),
+                sum(1 for connection in connections if connection.is_idle()),
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.values())
+            completed = self.requests - self.errors
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": self.max_connections,
+                "utilization": round(self.in_flight / self.max_connections, 3),
+                "open_connections": sum(open_ for open_, _ in pools),
+                "idle_connections": sum(idle for _, idle in pools),
+                "connections_opened": self.connections_opened,
+                "reuse_rate": round(1 - self.connections_opened / completed, 3) if completed else 0.0,
+                "avg_headers_ms": round(self.headers_ms_total / completed, 1) if completed else 0.0,
+            }
+
+
+# ─── Transports instrumentés ──────────────────────────────────────────────────
+# La requête reste « en cours » jusqu'à la fermeture du flux de réponse : un appel
+# messages.stream occupe sa connexion pendant toute la génération.
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, metrics: PoolMetrics):
+        self._stream = stream
+        self._metrics = metrics
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._metrics.release()
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, metrics: PoolMetrics):
+        self._stream = stream
+        self._metrics = metrics
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._metrics.release()
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.acquire()
+        start = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.metrics.release(failed=True)
+            raise
+        self.metrics.observe(self, _connections(self), (time.perf_counter() - start) * 1000)
+        response.stream = _TrackedStream(response.stream, self.metrics)
+        return response
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.acquire()
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.metrics.release(failed=True)
+            raise
+        self.metrics.observe(self, _connections(self), (time.perf_counter() - start) * 1000)
+        response.stream = _AsyncTrackedStream(response.stream, self.metrics)
+        return response
+
+
+def _connections(transport) -> list:
+    pool = getattr(transport, "_pool", None)
+    return list(getattr(pool, "connections", []))
+
+
+# ─── Fabrique ─────────────────────────────────────────────────────────────────
+
+SYNC_POOL = PoolMetrics()
+ASYNC_POOL = PoolMetrics()
+
+_lock = threading.Lock()
+_client = None
+# Les connexions httpx asynchrones sont liées à leur boucle d'événements (asyncio.run
+# en crée une par appel) : un client par boucle, fermé à la sortie de async_client_scope
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anthropic.AsyncAnthropic]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_scopes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, int]" = weakref.WeakKeyDictionary()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=API_MAX_CONNECTIONS,
+        max_keepalive_connections=API_MAX_KEEPALIVE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY_S,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(API_TIMEOUT_S, connect=API_CONNECT_TIMEOUT_S)
+
+
+def get_client() -> anthropic.Anthropic:
+    """Client synchrone du processus : agents de toutes les sessions et moteur vision partagent son pool."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = anthropic.Anthropic(
+                api_key=ANTHROPIC_API_KEY,
+                timeout=_timeout(),
+                max_retries=API_MAX_RETRIES,
+                http_client=anthropic.DefaultHttpxClient(
+                    transport=InstrumentedTransport(SYNC_POOL, limits=_limits()),
+                    timeout=_timeout(),
+                ),
+            )
+        return _client
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    """Client asynchrone de la boucle d'événements courante (à appeler depuis une coroutine)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = anthropic.AsyncAnthropic(
+                api_key=ANTHROPIC_API_KEY,
+                timeout=_timeout(),
+                max_retries=API_MAX_RETRIES,
+                http_client=anthropic.DefaultAsyncHttpxClient(
+                    transport=InstrumentedAsyncTransport(ASYNC_POOL, limits=_limits()),
+                    timeout=_timeout(),
+                ),
+            )
+            _async_clients[loop] = client
+        return client
+
+
+@contextlib.asynccontextmanager
+async def async_client_scope():
+    """
+    Portée du client asynchrone de la boucle courante : à la sortie de la dernière
+    portée ouverte sur cette boucle, le client est fermé (sockets du pool libérés).
+    À ouvrir autour de chaque asyncio.run, ou une fois autour de la coroutine
+    principale d'un service qui garde sa boucle.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _async_scopes[loop] = _async_scopes.get(loop, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _async_scopes[loop] -= 1
+            client = _async_clients.pop(loop, None) if _async_scopes[loop] == 0 else None
+        if client is not None:
+            await client.close()
+
+
+def pool_stats() -> dict:
+    """Métriques des pools de connexions synchrone et asynchrone."""
+    return {"sync": SYNC_POOL.snapshot(), "async": ASYNC_POOL.snapshot()}
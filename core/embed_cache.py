@@ -0,0 +1,118 @@
+"""
+core/embed_cache.py — Cache disque des embeddings de chunks, adressé par contenu
+"""
+import hashlib
+import logging
+import re
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import INDEX_DIR, EMBED_MODEL, EMBED_CACHE_MAX_ENTRIES
+from core.cache_base import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_SQL_BATCH = 500  # Limite de paramètres par requête SQLite
+
+
+def normalize_text(text: str) -> str:
+    """Normalisation avant hachage : espaces multiples et bords ignorés."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class EmbeddingCache(SQLiteCache):
+    """
+    Cache persistant des embeddings, partagé entre les rebuilds de l'index.
+    - Clé : SHA-256 de (EMBED_MODEL, texte normalisé du chunk)
+    - Stockage : SQLite sous INDEX_DIR, vecteurs en float32
+    - Éviction LRU au-delà de max_entries, compteurs hits/misses
+    """
+
+    table = "embeddings"
+
+    def __init__(
+        self,
+        path: Path = INDEX_DIR / "embeddings.sqlite",
+        model_name: str = EMBED_MODEL,
+        max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path, [
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)",
+        ])
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_name}\n{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Renvoie l'embedding en cache de chaque texte, ou None s'il est absent."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                batch = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """Enregistre des embeddings puis évince les entrées les moins récemment utilisées."""
+        now = time.time()
+        rows = [
+            (self.key(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        logger.info(f"🧹 Cache d'embeddings : {excess} entrées évincées (LRU)")
+
+    def stats(self) -> dict:
+        """Statistiques de la session + taille actuelle du cache."""
+        return self._counter_stats(self.count(), max_entries=self.max_entries, evictions=self.evictions)
@@ -0,0 +1,205 @@
+"""
+core/history.py — Compaction de l'historique de conversation sous budget de tokens
+"""
+import json
+import logging
+from pathlib import Path
+from typing import List
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import HISTORY_TOKEN_BUDGET, HISTORY_KEEP_TURNS, HISTORY_TOOL_RESULT_CHARS, IMAGE_MAX_TOKENS
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4          # Estimation grossière pour du texte français
+ANALYSIS_PLACEHOLDER_CHARS = 600
+
+
+def _get(block, key: str, default=None):
+    """Lit un champ d'un bloc de contenu, dict (messages construits ici) ou objet SDK (réponses Claude)."""
+    if isinstance(block, dict):
+        return block.get(key, default)
+    return getattr(block, key, default)
+
+
+def _blocks(message: dict) -> list:
+    content = message["content"]
+    return [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " … [tronqué]"
+
+
+def _text_of(message: dict) -> str:
+    return "\n".join(
+        _get(block, "text", "") for block in _blocks(message) if _get(block, "type") == "text"
+    ).strip()
+
+
+def estimate_tokens(messages: List[dict]) -> int:
+    """Estimation du nombre de tokens d'entrée de l'historique (texte ~4 caractères/token)."""
+    chars, images = 0, 0
+    for message in messages:
+        for block in _blocks(message):
+            kind = _get(block, "type")
+            if kind == "image":
+                images += 1
+            elif kind == "text":
+                chars += len(_get(block, "text", ""))
+            elif kind == "tool_use":
+                chars += len(json.dumps(_get(block, "input", {}), ensure_ascii=False))
+            elif kind == "tool_result":
+                content = _get(block, "content", "")
+                chars += len(content) if isinstance(content, str) else len(json.dumps(content, ensure_ascii=False))
+    return chars // CHARS_PER_TOKEN + images * IMAGE_MAX_TOKENS  # captures ramenées à ce budget par image_optimizer
+
+
+class ConversationHistoryManager:
+    """
+    Maintient l'historique sous HISTORY_TOKEN_BUDGET avant chaque nouveau tour.
+    Les HISTORY_KEEP_TURNS derniers tours ne sont jamais touchés ; sur les plus
+    anciens, les étapes suivantes sont appliquées dans l'ordre, uniquement tant
+    que le budget est dépassé :
+    1. images        → texte de substitution (avec l'analyse vision du tour si disponible)
+    2. tool_result   → tronqués à HISTORY_TOOL_RESULT_CHARS caractères
+    3. tours résumés → question + réponse finale (tool_use / tool_result retirés ensemble)
+    4. tours retirés → les plus anciens d'abord
+
+    Un tour commence à chaque message utilisateur qui n'est pas un retour de
+    tools : les paires tool_use / tool_result restent donc toujours dans le
+    même tour, et l'alternance user / assistant est préservée.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_recent_turns: int = HISTORY_KEEP_TURNS,
+        tool_result_chars: int = HISTORY_TOOL_RESULT_CHARS,
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_result_chars = tool_result_chars
+        self.last_stats: dict = {}
+
+    def compact(self, messages: List[dict]) -> List[dict]:
+        """Renvoie l'historique compacté (nouvelle liste ; les messages d'origine ne sont pas modifiés)."""
+        tokens_before = estimate_tokens(messages)
+        self.last_stats = {"tokens_before": tokens_before, "tokens_after": tokens_before, "steps": []}
+        if tokens_before <= self.token_budget:
+            return messages
+
+        turns = self._split_turns(messages)
+        old_count = max(0, len(turns) - self.keep_recent_turns)
+        steps = [
+            ("images", self._strip_images),
+            ("tool_results", self._truncate_tool_results),
+            ("summaries", self._summarize_turn),
+        ]
+        for name, step in steps:
+            for i in range(old_count):
+                turns[i] = step(turns[i])
+            self.last_stats["steps"].append(name)
+            if self._tokens(turns) <= self.token_budget:
+                return self._done(turns)
+
+        dropped = 0
+        while dropped < old_count and self._tokens(turns[dropped:]) > self.token_budget:
+            dropped += 1
+        if dropped:
+            self.last_stats["steps"].append("dropped")
+            self.last_stats["dropped_turns"] = dropped
+        return self._done(turns[dropped:])
+
+    # ── Étapes ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _split_turns(messages: List[dict]) -> List[List[dict]]:
+        turns: List[List[dict]] = []
+        for message in messages:
+            is_tool_results = message["role"] == "user" and any(
+                _get(block, "type") == "tool_result" for block in _blocks(message)
+            )
+            if message["role"] == "user" and not is_tool_results or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    @staticmethod
+    def _vision_analysis(turn: List[dict]) -> str:
+        """Sortie du tool vision_analysis du tour, s'il a été appelé."""
+        vision_ids = {
+            _get(block, "id")
+            for message in turn if message["role"] == "assistant"
+            for block in _blocks(message)
+            if _get(block, "type") == "tool_use" and _get(block, "name") == "vision_analysis"
+        }
+        for message in turn:
+            for block in _blocks(message):
+                if _get(block, "type") == "tool_result" and _get(block, "tool_use_id") in vision_ids:
+                    content = _get(block, "content", "")
+                    return content if isinstance(content, str) else ""
+        return ""
+
+    def _strip_images(self, turn: List[dict]) -> List[dict]:
+        analysis = self._vision_analysis(turn)
+        if analysis:
+            placeholder = "[Capture d'écran retirée de l'historique — analyse : " + _truncate(
+                analysis, ANALYSIS_PLACEHOLDER_CHARS
+            ) + "]"
+        else:
+            placeholder = "[Capture d'écran jointe par l'utilisateur — retirée de l'historique]"
+
+        compacted = []
+        for message in turn:
+            if message["role"] == "user" and isinstance(message["content"], list):
+                content = [
+                    {"type": "text", "text": placeholder} if _get(block, "type") == "image" else block
+                    for block in message["content"]
+                ]
+                message = {**message, "content": content}
+            compacted.append(message)
+        return compacted
+
+    def _truncate_tool_results(self, turn: List[dict]) -> List[dict]:
+        compacted = []
+        for message in turn:
+            if message["role"] == "user" and isinstance(message["content"], list):
+                content = []
+                for block in message["content"]:
+                    if _get(block, "type") == "tool_result" and isinstance(_get(block, "content"), str):
+                        block = {**block, "content": _truncate(block["content"], self.tool_result_chars)}
+                    content.append(block)
+                message = {**message, "content": content}
+            compacted.append(message)
+        return compacted
+
+    @staticmethod
+    def _summarize_turn(turn: List[dict]) -> List[dict]:
+        """Réduit un tour à sa question et sa réponse finale (texte seul)."""
+        question = _text_of(turn[0]) or "(question sans texte)"
+        answer = ""
+        if len(turn) > 1 and turn[-1]["role"] == "assistant":
+            answer = _text_of(turn[-1])
+        return [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer or "(pas de réponse finale)"},
+        ]
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _tokens(turns: List[List[dict]]) -> int:
+        return estimate_tokens([message for turn in turns for message in turn])
+
+    def _done(self, turns: List[List[dict]]) -> List[dict]:
+        messages = [message for turn in turns for message in turn]
+        self.last_stats["tokens_after"] = estimate_tokens(messages)
+        logger.info(
+            f"🗜️  Historique compacté : {self.last_stats['tokens_before']} → "
+            f"{self.last_stats['tokens_after']} tokens estimés ({', '.join(self.last_stats['steps'])})"
+        )
+        return messages
@@ -0,0 +1,71 @@
+"""
+core/image_cache.py — Cache mémoire des images préparées (base64, type MIME, stats) pour Claude
+"""
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import IMAGE_CACHE_MAX_MB
+from core.cache_base import CacheCounters
+
+
+def image_key(raw_bytes: bytes, media_type: str) -> str:
+    """Clé de cache : empreinte du contenu brut (indépendante du nom ou de l'objet d'upload)."""
+    return hashlib.sha256(raw_bytes).hexdigest() + ":" + media_type
+
+
+class PreparedImageCache(CacheCounters):
+    """
+    Cache LRU borné en mémoire (taille cumulée des charges base64).
+    Une capture donnée n'est décodée / redimensionnée / encodée qu'une fois,
+    qu'elle soit jointe au message de l'agent ou analysée par vision_analysis.
+    Thread-safe ; compte les hits/misses comme LRUTTLCache.
+    """
+
+    def __init__(self, max_bytes: int = int(IMAGE_CACHE_MAX_MB * 1024 * 1024)):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, prepared: tuple):
+        size = len(prepared[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous[0])
+            self._data[key] = prepared
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size_bytes -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return self._counter_stats(len(self._data), size_mb=round(self.size_bytes / 1024 / 1024, 2))
+
+
+# Instance partagée par défaut (agent, moteur vision, sessions Streamlit du processus)
+PREPARED_IMAGES = PreparedImageCache()
@@ -0,0 +1,217 @@
+"""
+core/image_optimizer.py — Optimisation des captures avant envoi à Claude (budget de tokens image)
+"""
+import logging
+import math
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageOps
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    IMAGE_MAX_TOKENS, IMAGE_MAX_LONG_EDGE, IMAGE_MAX_BYTES_MB,
+    IMAGE_CROP_BORDERS, IMAGE_JPEG_QUALITY,
+)
+
+logger = logging.getLogger(__name__)
+
+PIXELS_PER_TOKEN = 750          # Coût image Claude ≈ largeur × hauteur / 750 tokens
+API_MAX_LONG_EDGE = 1568        # Au-delà, l'API redimensionne elle-même l'image
+API_MAX_PIXELS = 1_150_000
+SCREENSHOT_MAX_COLORS = 4096    # Palette d'un échantillon 256×256 : au-delà, contenu photographique
+BORDER_TOLERANCE = 12           # Écart de couleur toléré pour une bordure « uniforme »
+MIN_CROP_GAIN = 0.02            # Recadrage ignoré s'il retire moins de 2 % de la surface
+
+DHASH_SIZE = 16                 # dHash 16×16 = 256 bits (écrans Akuiteo de même gabarit mieux distingués)
+
+_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/gif": "GIF", "image/webp": "WEBP"}
+
+
+def perceptual_hash(img: Image.Image, hash_size: int = DHASH_SIZE) -> str:
+    """
+    dHash : signe des différences de luminance entre pixels voisins d'une
+    miniature (hash_size+1)×hash_size. Deux captures du même écran (autre
+    résolution, compression, curseur) ne diffèrent que de quelques bits.
+    Renvoie hash_size² bits en hexadécimal.
+    """
+    # Réduction BOX (moyenne par zone) : stable face aux changements de résolution et à l'anti-crénelage
+    pixels = img.convert("L").resize((hash_size + 1, hash_size), Image.BOX).tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Tokens facturés pour une image, après le redimensionnement automatique de l'API."""
+    scale = min(1.0, API_MAX_LONG_EDGE / max(width, height), math.sqrt(API_MAX_PIXELS / (width * height)))
+    return math.ceil(width * scale * height * scale / PIXELS_PER_TOKEN)
+
+
+class ImageOptimizer:
+    """
+    Prépare une capture en une seule passe :
+    1. recadrage des bordures uniformes (fond d'écran, bandes noires)
+    2. dimensions cibles calculées d'emblée depuis le budget de tokens
+       (max_tokens × 750 pixels) et le côté maximal, un seul resize LANCZOS
+    3. format selon le contenu : PNG pour les captures d'interface (aplats,
+       texte net), JPEG pour les photos ; repli JPEG si le PNG dépasse max_bytes
+    Une image déjà conforme est renvoyée telle quelle, sans réencodage.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = IMAGE_MAX_TOKENS,
+        max_long_edge: int = IMAGE_MAX_LONG_EDGE,
+        max_bytes: int = int(IMAGE_MAX_BYTES_MB * 1024 * 1024),
+        crop_borders: bool = IMAGE_CROP_BORDERS,
+        jpeg_quality: int = IMAGE_JPEG_QUALITY,
+    ):
+        self.max_tokens = max_tokens
+        self.max_long_edge = max_long_edge
+        self.max_bytes = max_bytes
+        self.crop_borders = crop_borders
+        self.jpeg_quality = jpeg_quality
+
+    def optimize(self, raw_bytes: bytes, media_type: str, keep_format: bool = False) -> tuple[bytes, str, dict]:
+        """
+        Returns:
+            (octets optimisés, media_type, stats) — stats : tailles, dimensions,
+            tokens estimés avant / après et économies, format et type de contenu
+        """
+        start = time.perf_counter()
+        img = Image.open(BytesIO(raw_bytes))
+        original_size = img.size
+        stats = {
+            "original_bytes": len(raw_bytes),
+            "original_size": list(original_size),
+            "original_tokens": estimate_image_tokens(*original_size),
+            "cropped": False,
+        }
+
+        # GIF animés : hors périmètre, envoyés tels quels
+        if getattr(img, "n_frames", 1) > 1:
+            stats["dhash"] = perceptual_hash(img)
+            return raw_bytes, media_type, self._finish(stats, raw_bytes, original_size, media_type, "animation", start)
+
+        img = ImageOps.exif_transpose(img)
+        if self.crop_borders:
+            cropped = self._crop_uniform_borders(img)
+            if cropped is not None:
+                img = cropped
+                stats["cropped"] = True
+
+        content = self._classify(img)
+        target = self._target_size(*img.size)
+        if keep_format:
+            fmt, target_media_type = _FORMATS.get(media_type, "PNG"), media_type
+        else:
+            fmt = "PNG" if content == "screenshot" else "JPEG"
+            target_media_type = "image/png" if fmt == "PNG" else "image/jpeg"
+
+        if target == img.size and not stats["cropped"] and len(raw_bytes) <= self.max_bytes:
+            # Déjà dans le budget : réencoder ne ferait que coûter du temps (et de la qualité en JPEG)
+            stats["dhash"] = perceptual_hash(img)
+            return raw_bytes, media_type, self._finish(stats, raw_bytes, original_size, media_type, content, start)
+
+        if target != img.size:
+            img = img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+        data = self._encode(img, fmt)
+        if fmt == "PNG" and len(data) > self.max_bytes and not keep_format:
+            fmt, target_media_type = "JPEG", "image/jpeg"
+            data = self._encode(img, fmt)
+        data, img = self._fit_bytes(data, img, fmt)
+        # Empreinte de l'image envoyée à Claude (clé du cache des analyses vision)
+        stats["dhash"] = perceptual_hash(img)
+        return data, target_media_type, self._finish(stats, data, img.size, target_media_type, content, start)
+
+    # ── Étapes ────────────────────────────────────────────────────────────────
+
+    def _target_size(self, width: int, height: int) -> tuple[int, int]:
+        """Dimensions finales calculées en une fois depuis le budget de pixels et le côté maximal."""
+        max_pixels = self.max_tokens * PIXELS_PER_TOKEN
+        scale = min(1.0, self.max_long_edge / max(width, height), math.sqrt(max_pixels / (width * height)))
+        if scale >= 1.0:
+            return width, height
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    @staticmethod
+    def _classify(img: Image.Image) -> str:
+        """'screenshot' (peu de couleurs distinctes, aplats) ou 'photo'."""
+        sample = img.copy()
+        sample.thumbnail((256, 256))
+        sample = sample.convert("RGB")
+        return "screenshot" if sample.getcolors(SCREENSHOT_MAX_COLORS) is not None else "photo"
+
+    @staticmethod
+    def _crop_uniform_borders(img: Image.Image):
+        """Image recadrée sur son contenu si les bords ont la couleur du coin haut-gauche, sinon None."""
+        # Détection sur une version réduite, boîte ramenée à pleine résolution (arrondie vers l'extérieur)
+        factor = max(1, max(img.size) // 1024)
+        small = img.convert("RGB").reduce(factor) if factor > 1 else img.convert("RGB")
+        background = Image.new("RGB", small.size, small.getpixel((0, 0)))
+        diff = ImageChops.difference(small, background).convert("L")
+        small_bbox = diff.point(lambda value: 255 if value > BORDER_TOLERANCE else 0).getbbox()
+        if small_bbox is None:
+            return None
+        bbox = (
+            max(0, (small_bbox[0] - 1) * factor),
+            max(0, (small_bbox[1] - 1) * factor),
+            min(img.width, (small_bbox[2] + 1) * factor),
+            min(img.height, (small_bbox[3] + 1) * factor),
+        )
+        kept = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        if kept >= (1 - MIN_CROP_GAIN) * img.width * img.height:
+            return None
+        return img.crop(bbox)
+
+    def _encode(self, img: Image.Image, fmt: str, quality: int = None) -> bytes:
+        buf = BytesIO()
+        if fmt == "JPEG":
+            if img.mode != "RGB":
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", img.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            img.save(buf, format="JPEG", quality=quality or self.jpeg_quality, optimize=True)
+        else:
+            img.save(buf, format=fmt)
+        return buf.getvalue()
+
+    def _fit_bytes(self, data: bytes, img: Image.Image, fmt: str) -> tuple[bytes, Image.Image]:
+        """Garantit la limite d'octets de l'API : qualité JPEG réduite, puis redimensionnements calculés."""
+        if len(data) <= self.max_bytes:
+            return data, img
+        if fmt == "JPEG":
+            for quality in (70, 55):
+                data = self._encode(img, fmt, quality)
+                if len(data) <= self.max_bytes:
+                    return data, img
+        # La taille encodée n'est pas proportionnelle à la surface : on réduit jusqu'à tenir
+        while len(data) > self.max_bytes and max(img.size) > 1:
+            scale = min(0.9, math.sqrt(self.max_bytes / len(data)) * 0.9)
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+            data = self._encode(img, fmt, 55 if fmt == "JPEG" else None)
+        return data, img
+
+    @staticmethod
+    def _finish(stats: dict, data: bytes, size: tuple, media_type: str, content: str, start: float) -> dict:
+        stats.update({
+            "optimized_bytes": len(data),
+            "optimized_size": list(size),
+            "optimized_tokens": estimate_image_tokens(*size),
+            "media_type": media_type,
+            "content": content,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        stats["bytes_saved"] = stats["original_bytes"] - stats["optimized_bytes"]
+        stats["tokens_saved"] = stats["original_tokens"] - stats["optimized_tokens"]
+        return stats
@@ -0,0 +1,259 @@
+"""
+core/image_pipeline.py — Analyse en lot des captures (images des PDF/DOCX indexés, bibliothèque de captures)
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zipfile
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from PIL import Image
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    DOCUMENTS, SCREENSHOTS_DIR, IMAGE_ANALYSES_FILE,
+    IMAGE_PIPELINE_CONCURRENCY, IMAGE_PIPELINE_MIN_SIDE,
+)
+from core.clients import async_client_scope
+from core.ingestion import SOURCE_LABELS
+from core.tracing import annotate, traced
+from core.vision_engine import AkuiteoVisionEngine
+
+logger = logging.getLogger(__name__)
+
+# Question fixe : une même capture donne la même clé dans le cache d'analyses vision
+INDEXING_QUESTION = (
+    "Décris cet écran Akuiteo pour la documentation : module et menu, champs, "
+    "colonnes et boutons visibles, actions possibles. Réponds en texte suivi, sans préambule."
+)
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+
+def _named_bytes(data: bytes, name: str) -> BytesIO:
+    """Octets d'image portant un nom (le moteur vision en déduit le type MIME)."""
+    buf = BytesIO(data)
+    buf.name = name
+    return buf
+
+
+def _pdf_images(path: Path) -> Iterator[dict]:
+    from pypdf import PdfReader
+    reader = PdfReader(str(path))
+    labels = reader.page_labels
+    for i, page in enumerate(reader.pages):
+        try:
+            images = list(page.images)
+        except Exception as e:
+            logger.warning(f"⚠️  Images illisibles page {i + 1} de {path.name} : {e}")
+            continue
+        for image in images:
+            yield {
+                "name": image.name,
+                "page_label": labels[i] if i < len(labels) else str(i + 1),
+                "data": image.data,
+            }
+
+
+def _docx_images(path: Path) -> Iterator[dict]:
+    """Images embarquées d'un DOCX (archive zip, dossier word/media)."""
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(archive.namelist()):
+            if name.startswith("word/media/") and name.lower().endswith(IMAGE_SUFFIXES):
+                yield {"name": Path(name).name, "page_label": "", "data": archive.read(name)}
+
+
+def _screenshot_images(directory: Path) -> Iterator[dict]:
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            yield {"name": str(path.relative_to(directory)), "page_label": "", "data": path.read_bytes()}
+
+
+class ImageAnalysisPipeline:
+    """
+    Pré-analyse les captures d'écran pour en faire du contexte RAG.
+    - Extrait les images des PDF/DOCX de DOCUMENTS et de SCREENSHOTS_DIR
+      (dédoublonnées par empreinte SHA-256, logos et icônes ignorés)
+    - Les analyse via AkuiteoVisionEngine.aanalyze_screenshot, au plus
+      `concurrency` appels simultanés (asyncio.Semaphore)
+    - Ajoute chaque analyse réussie au checkpoint JSONL dès sa réception :
+      une exécution interrompue reprend là où elle s'était arrêtée
+    - Le checkpoint est indexé comme le document « images » : un build
+      incrémental (build_index(force_rebuild=True)) y intègre les nouvelles analyses
+    """
+
+    def __init__(
+        self,
+        vision_engine: Optional[AkuiteoVisionEngine] = None,
+        checkpoint_path: Path = IMAGE_ANALYSES_FILE,
+        screenshots_dir: Path = SCREENSHOTS_DIR,
+        concurrency: int = IMAGE_PIPELINE_CONCURRENCY,
+        min_side: int = IMAGE_PIPELINE_MIN_SIDE,
+    ):
+        self.vision = vision_engine if vision_engine is not None else AkuiteoVisionEngine()
+        self.checkpoint_path = checkpoint_path
+        self.screenshots_dir = screenshots_dir
+        self.concurrency = max(1, concurrency)
+        self.min_side = min_side
+        self.last_stats: dict = {}
+
+    def run(self) -> dict:
+        return asyncio.run(self.arun())
+
+    @traced("images.pipeline")
+    async def arun(self) -> dict:
+        """
+        Extrait puis analyse les images pas encore présentes dans le checkpoint.
+
+        Returns:
+            stats : images trouvées, déjà analysées, analysées, en échec, ignorées, durée
+        """
+        start = time.perf_counter()
+        self._repair_checkpoint()
+        done = self._load_checkpoint()
+        images, skipped = await asyncio.to_thread(self._collect, done)
+        logger.info(
+            f"🖼️  {len(images)} images à analyser ({len(done)} déjà dans le checkpoint, "
+            f"{skipped} ignorées), {self.concurrency} appels simultanés"
+        )
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        async with async_client_scope():
+            with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+                results = await asyncio.gather(
+                    *(self._analyze(image, semaphore, checkpoint) for image in images)
+                )
+
+        analyzed = sum(results)
+        self.last_stats = {
+            "found": len(images) + len(done) + skipped,
+            "already_done": len(done),
+            "analyzed": analyzed,
+            "failed": len(images) - analyzed,
+            "skipped": skipped,
+            "duration_s": round(time.perf_counter() - start, 1),
+        }
+        annotate(**self.last_stats)
+        logger.info(
+            f"✅ Analyse des images : {analyzed} analysées, {self.last_stats['failed']} en échec "
+            f"en {self.last_stats['duration_s']}s (checkpoint : {self.checkpoint_path.name})"
+        )
+        return self.last_stats
+
+    # ── Étapes ────────────────────────────────────────────────────────────────
+
+    def _repair_checkpoint(self):
+        """
+        Coupe la dernière ligne si elle est tronquée (interruption pendant une écriture) :
+        les entrées ajoutées ensuite commencent sur une ligne propre.
+        """
+        if not self.checkpoint_path.exists():
+            return
+        with open(self.checkpoint_path, "rb+") as f:
+            data = f.read()
+            if not data or data.endswith(b"\n"):
+                return
+            f.truncate(data.rfind(b"\n") + 1)
+        logger.warning(f"⚠️  Dernière ligne tronquée retirée de {self.checkpoint_path.name}")
+
+    def _load_checkpoint(self) -> set:
+        """Identifiants des images déjà analysées (ligne tronquée par une interruption ignorée)."""
+        done = set()
+        if not self.checkpoint_path.exists():
+            return done
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    continue
+        return done
+
+    def _sources(self) -> Dict[str, tuple]:
+        """doc_key → (fichier ou dossier, extracteur)."""
+        sources = {}
+        for doc_key, path in DOCUMENTS.items():
+            suffix = path.suffix.lower()
+            if path.exists() and suffix in (".pdf", ".docx"):
+                sources[doc_key] = (path, _pdf_images if suffix == ".pdf" else _docx_images)
+        if self.screenshots_dir.is_dir():
+            sources["screenshots"] = (self.screenshots_dir, _screenshot_images)
+        return sources
+
+    def _collect(self, done: set) -> tuple[List[dict], int]:
+        """Images à analyser (nouvelles, assez grandes, une seule fois chacune) et nombre d'ignorées."""
+        images = []
+        seen = set(done)
+        skipped = 0
+        for doc_key, (path, extract) in self._sources().items():
+            try:
+                for image in extract(path):
+                    image_id = hashlib.sha256(image["data"]).hexdigest()
+                    if image_id in seen:
+                        continue
+                    seen.add(image_id)
+                    if not self._is_large_enough(image["data"]):
+                        skipped += 1
+                        continue
+                    images.append({
+                        **image,
+                        "id": image_id,
+                        "doc_key": doc_key,
+                        "source": SOURCE_LABELS.get(doc_key, path.name),
+                        "file_name": path.name if path.is_file() else f"{path.name}/{image['name']}",
+                    })
+            except Exception as e:
+                logger.error(f"❌ Extraction des images de {path.name} impossible : {e}")
+        return images, skipped
+
+    def _is_large_enough(self, data: bytes) -> bool:
+        try:
+            with Image.open(BytesIO(data)) as img:
+                return min(img.size) >= self.min_side
+        except Exception:
+            return False
+
+    async def _analyze(self, image: dict, semaphore: asyncio.Semaphore, checkpoint) -> bool:
+        async with semaphore:
+            result = await self.vision.aanalyze_screenshot(
+                _named_bytes(image["data"], image["name"]), INDEXING_QUESTION
+            )
+        if "error" in result["metadata"]:
+            logger.warning(f"⚠️  Analyse échouée : {image['file_name']} / {image['name']}")
+            return False
+
+        entry = {key: image[key] for key in ("id", "doc_key", "source", "file_name", "page_label")}
+        entry["image_name"] = image["name"]
+        entry["analysis"] = result["analysis"]
+        entry["analyzed_at"] = time.time()
+        # Écriture entre deux await : les lignes ne s'entrelacent pas
+        checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        checkpoint.flush()
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse en lot des captures Akuiteo pour l'index RAG")
+    parser.add_argument("--concurrency", type=int, default=IMAGE_PIPELINE_CONCURRENCY)
+    parser.add_argument("--screenshots", type=Path, default=SCREENSHOTS_DIR)
+    parser.add_argument("--no-index", action="store_true", help="ne pas mettre à jour l'index RAG")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    stats = ImageAnalysisPipeline(
+        screenshots_dir=args.screenshots, concurrency=args.concurrency
+    ).run()
+    if stats["analyzed"] and not args.no_index:
+        from core.rag_engine import AkuiteoRAGEngine
+        AkuiteoRAGEngine().build_index(force_rebuild=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+core/ingestion.py — Pipeline d'ingestion parallèle (parsing multi-processus + embedding par lots)
+"""
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, DOCUMENTS, IMAGE_ANALYSES_FILE,
+    INGEST_WORKERS, PDF_PAGES_PER_TASK, EMBED_BATCH_SIZE, EMBED_TORCH_THREADS,
+)
+from core.embed_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# Mapping lisible pour les citations
+SOURCE_LABELS = {
+    "livre_blanc":  "Livre Blanc Akuiteo",
+    "cas_usages":   "Cas d'Usage CRM (POC)",
+    "mode_op_crm":  "Mode Opératoire CRM",
+    "screenshots":  "Bibliothèque de captures",
+    "images":       "Captures analysées",
+}
+
+SUPPORTED_SUFFIXES = (".docx", ".pdf")
+
+# Pseudo-document : descriptions des images produites par core/image_pipeline.py
+IMAGE_ANALYSES_KEY = "images"
+
+
+def document_paths() -> Dict[str, Path]:
+    """Sources indexées : les documents de config.DOCUMENTS et le fichier des analyses d'images."""
+    return {**DOCUMENTS, IMAGE_ANALYSES_KEY: IMAGE_ANALYSES_FILE}
+
+
+# ─── Tâches exécutées dans les processus de parsing ───────────────────────────
+# Fonctions de module (picklables) renvoyant des dicts simples plutôt que des
+# Document LlamaIndex, pour limiter le coût de sérialisation entre processus.
+
+def _count_pdf_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _parse_pdf_pages(path: str, start: int, stop: int) -> List[dict]:
+    """Extrait le texte des pages [start, stop) d'un PDF (une entrée par page, comme PDFReader)."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    labels = reader.page_labels
+    file_name = Path(path).name
+    pages = []
+    for i in range(start, stop):
+        pages.append({
+            "text": reader.pages[i].extract_text() or "",
+            "metadata": {
+                "page_label": labels[i] if i < len(labels) else str(i + 1),
+                "file_name": file_name,
+            },
+        })
+    return pages
+
+
+def _parse_docx(path: str) -> List[dict]:
+    from llama_index.readers.file import DocxReader
+    docs = DocxReader().load_data(file=Path(path))
+    return [{"text": doc.text, "metadata": dict(doc.metadata)} for doc in docs]
+
+
+def _parse_image_analyses(path: str) -> List[dict]:
+    """Une entrée par image analysée, citée avec son document et sa page d'origine."""
+    pages = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                where = entry["file_name"] + (f", page {entry['page_label']}" if entry.get("page_label") else "")
+                pages.append({
+                    "text": f"Capture d'écran ({where}) :\n{entry['analysis']}",
+                    "metadata": {
+                        "source": f"{entry['source']} — capture {entry['image_name']}",
+                        "file_name": entry["file_name"],
+                        "page_label": entry.get("page_label") or "",
+                        "image_id": entry["id"],
+                    },
+                })
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # Ligne tronquée par une interruption : ignorée, l'image sera réanalysée
+                logger.warning(f"⚠️  {Path(path).name} ligne {number} illisible, ignorée : {e}")
+    return pages
+
+
+# ─── Pipeline ─────────────────────────────────────────────────────────────────
+
+class AkuiteoIngestionPipeline:
+    """
+    Pipeline d'ingestion des documents Akuiteo.
+    - Parse les DOCX et les pages PDF dans un pool de processus
+    - Découpe en chunks au fil de l'eau et les embed par grands lots
+    - Réutilise les embeddings du cache disque quand le texte est inchangé
+    - Mesure le débit (pages/s, chunks/s) dans last_stats
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        embed_cache: Optional[EmbeddingCache] = None,
+        workers: int = INGEST_WORKERS,
+        pages_per_task: int = PDF_PAGES_PER_TASK,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        torch_threads: int = EMBED_TORCH_THREADS,
+    ):
+        self.embed_model = embed_model
+        self.embed_cache = embed_cache
+        self.workers = max(1, workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.torch_threads = torch_threads
+        self.splitter = SentenceSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+        )
+        self.last_stats: dict = {}
+
+    def run(self, doc_keys: Optional[Iterable[str]] = None) -> Dict[str, List[BaseNode]]:
+        """
+        Parse, découpe et embed les documents demandés (tous par défaut).
+
+        Returns:
+            dict doc_key → nœuds embeddés. Un document dont une partie
+            du parsing a échoué est entièrement écarté.
+        """
+        self._set_torch_threads()
+        keys = list(document_paths()) if doc_keys is None else list(doc_keys)
+        tasks = self._plan_tasks(keys)
+
+        start = time.perf_counter()
+        embed_s = 0.0
+        self._cache_hits = 0
+        pages = 0
+        nodes_by_key: Dict[str, List[BaseNode]] = {}
+        failed = set()
+        pending: List[BaseNode] = []
+
+        for doc_key, parsed in self._parse(tasks, failed):
+            pages += len(parsed)
+            for node in self._split(doc_key, parsed):
+                nodes_by_key.setdefault(doc_key, []).append(node)
+                pending.append(node)
+            if len(pending) >= self.embed_batch_size:
+                embed_s += self._embed(pending)
+                pending = []
+        if pending:
+            embed_s += self._embed(pending)
+
+        for doc_key in failed:
+            nodes_by_key.pop(doc_key, None)
+
+        total_s = time.perf_counter() - start
+        chunks = sum(len(nodes) for nodes in nodes_by_key.values())
+        self.last_stats = {
+            "documents": len(nodes_by_key),
+            "pages": pages,
+            "chunks": chunks,
+            "total_s": round(total_s, 2),
+            "embed_s": round(embed_s, 2),
+            "pages_per_s": round(pages / total_s, 1) if total_s else 0.0,
+            "chunks_per_s": round(chunks / embed_s, 1) if embed_s else 0.0,
+            "cache_hits": self._cache_hits,
+            "cache_misses": chunks - self._cache_hits,
+        }
+        logger.info(
+            f"📊 Ingestion : {pages} pages, {chunks} chunks en {total_s:.1f}s "
+            f"({self.last_stats['pages_per_s']} pages/s, "
+            f"{self.last_stats['chunks_per_s']} chunks/s à l'embedding, "
+            f"{self._cache_hits} embeddings repris du cache)"
+        )
+        return nodes_by_key
+
+    # ── Étapes ────────────────────────────────────────────────────────────────
+
+    def _plan_tasks(self, doc_keys: List[str]) -> List[Tuple[str, tuple]]:
+        """Découpe le travail en tâches : un DOCX entier ou une plage de pages PDF."""
+        paths = document_paths()
+        tasks = []
+        for doc_key in doc_keys:
+            doc_path = paths[doc_key]
+            if not doc_path.exists():
+                if doc_key != IMAGE_ANALYSES_KEY:
+                    logger.warning(f"⚠️  Document manquant : {doc_path.name}")
+                continue
+
+            if doc_key == IMAGE_ANALYSES_KEY:
+                tasks.append((doc_key, (_parse_image_analyses, str(doc_path))))
+                continue
+
+            suffix = doc_path.suffix.lower()
+            if suffix not in SUPPORTED_SUFFIXES:
+                logger.warning(f"⚠️  Format non supporté : {suffix}")
+                continue
+
+            if suffix == ".docx":
+                tasks.append((doc_key, (_parse_docx, str(doc_path))))
+                continue
+
+            try:
+                page_count = _count_pdf_pages(str(doc_path))
+            except Exception as e:
+                logger.error(f"❌ Erreur chargement {doc_path.name}: {e}")
+                continue
+            for first in range(0, page_count, self.pages_per_task):
+                last = min(first + self.pages_per_task, page_count)
+                tasks.append((doc_key, (_parse_pdf_pages, str(doc_path), first, last)))
+        return tasks
+
+    def _parse(self, tasks, failed: set):
+        """Exécute les tâches de parsing et rend (doc_key, pages) au fil de l'eau."""
+        if self.workers == 1 or len(tasks) <= 1:
+            for doc_key, (fn, *args) in tasks:
+                try:
+                    yield doc_key, fn(*args)
+                except Exception as e:
+                    logger.error(f"❌ Erreur chargement {document_paths()[doc_key].name}: {e}")
+                    failed.add(doc_key)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+            futures = {pool.submit(fn, *args): doc_key for doc_key, (fn, *args) in tasks}
+            for future in as_completed(futures):
+                doc_key = futures[future]
+                try:
+                    yield doc_key, future.result()
+                except Exception as e:
+                    logger.error(f"❌ Erreur chargement {document_paths()[doc_key].name}: {e}")
+                    failed.add(doc_key)
+
+    def _split(self, doc_key: str, parsed: List[dict]) -> List[BaseNode]:
+        """Convertit les pages parsées en Documents annotés puis en chunks."""
+        filename = document_paths()[doc_key].name
+        label = SOURCE_LABELS.get(doc_key, filename)
+        documents = []
+        for page in parsed:
+            metadata = dict(page["metadata"])
+            metadata.setdefault("source", label)
+            metadata["filename"] = filename
+            metadata["doc_key"] = doc_key
+            documents.append(Document(text=page["text"], metadata=metadata))
+        return self.splitter.get_nodes_from_documents(documents)
+
+    def _embed(self, nodes: List[BaseNode]) -> float:
+        """
+        Embed un lot de nœuds (texte + métadonnées, comme LlamaIndex) ; renvoie la durée.
+        Seuls les textes absents du cache passent par le modèle.
+        """
+        start = time.perf_counter()
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        if self.embed_cache is not None:
+            embeddings = self.embed_cache.get_many(texts)
+        else:
+            embeddings = [None] * len(texts)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self._cache_hits += len(texts) - len(missing)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = self.embed_model.get_text_embedding_batch(missing_texts)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+            if self.embed_cache is not None:
+                self.embed_cache.put_many(missing_texts, computed)
+
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        return time.perf_counter() - start
+
+    def _set_torch_threads(self):
+        """Fixe le nombre de threads torch utilisés par le modèle d'embedding."""
+        if not self.torch_threads:
+            return
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(self.torch_threads)
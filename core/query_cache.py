@@ -0,0 +1,65 @@
+"""
+core/query_cache.py — Cache mémoire LRU + TTL pour les requêtes RAG
+"""
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from core.cache_base import CacheCounters
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?!.;:,]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Clé de cache d'une requête : casse, espaces et ponctuation finale ignorés."""
+    query = unicodedata.normalize("NFC", query).lower()
+    query = _WHITESPACE.sub(" ", query).strip()
+    return _TRAILING_PUNCT.sub("", query)
+
+
+class LRUTTLCache(CacheCounters):
+    """
+    Cache clé → valeur borné en taille (LRU) et en durée de vie (TTL).
+    Thread-safe ; compte les hits/misses pour le suivi du taux de succès.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_s:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return self._counter_stats(len(self._data))
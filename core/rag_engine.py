@@ -1,169 +1,461 @@
 """
-core/rag_engine.py — Indexation et retrieval RAG avec LlamaIndex
+core/rag_engine.py — Indexation et retrieval RAG (ingestion LlamaIndex, vector store mmap)
 """
+import asyncio
+import hashlib
+import json
 import logging
+import time
 from pathlib import Path
-from typing import Optional, List
-
-from llama_index.core import (
-    VectorStoreIndex,
-    StorageContext,
-    load_index_from_storage,
-    Settings,
-    Document,
-)
-from llama_index.core.node_parser import SentenceSplitter
+from typing import Dict, Iterable, List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.schema import BaseNode
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.readers.file import DocxReader, PDFReader
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from config import (
     CHUNK_SIZE, CHUNK_OVERLAP, TOP_K,
-    INDEX_DIR, DOCUMENTS, EMBED_MODEL
+    INDEX_DIR, EMBED_MODEL, EMBED_BATCH_SIZE,
+    VECTOR_DTYPE, VECTOR_QUANTIZATION, QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+    HYBRID_SEARCH, HYBRID_CANDIDATES, RRF_K
 )
+from core.ann import load_or_build_ann
+from core.bm25 import BM25Index
+from core.embed_cache import EmbeddingCache
+from core.ingestion import AkuiteoIngestionPipeline, document_paths
+from core.query_cache import LRUTTLCache, normalize_query
+from core.tracing import annotate, span, traced
+from core.vector_store import AkuiteoVectorStore
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_VERSION = 1
+
 
 class AkuiteoRAGEngine:
     """
     Moteur RAG pour la documentation Akuiteo.
-    - Indexe les 3 documents (DOCX + PDF)
+    - Indexe les 3 documents (DOCX + PDF) et les analyses de leurs captures (core/image_pipeline.py)
+    - Recherche hybride : similarité dense bge-m3 + BM25, fusionnées par RRF
     - Expose une méthode query() pour le tool RAG de l'agent ReAct
     """
 
-    def __init__(self):
-        self.index: Optional[VectorStoreIndex] = None
+    def __init__(self, quantization: str = VECTOR_QUANTIZATION):
+        """
+        Args:
+            quantization : "none", "int8" ou "binary" — copie quantifiée des
+                           embeddings pour le premier passage de la recherche
+        """
+        self.quantization = quantization
+        self.store: Optional[AkuiteoVectorStore] = None
+        self.bm25: Optional[BM25Index] = None
+        self.index_version: Optional[str] = None
+        self.last_build_stats: dict = {}
+        self._query_embeddings = LRUTTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self._query_results = LRUTTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
         self._configure_settings()
+        self.embed_cache = EmbeddingCache()
+        self.pipeline = AkuiteoIngestionPipeline(Settings.embed_model, self.embed_cache)
 
     def _configure_settings(self):
         """Configure le modèle d'embedding local (pas de coût API)."""
         Settings.embed_model = HuggingFaceEmbedding(
             model_name=EMBED_MODEL,
             cache_folder=str(INDEX_DIR / "embed_cache"),
+            embed_batch_size=EMBED_BATCH_SIZE,
         )
         Settings.llm = None  # LLM géré par l'agent, pas par LlamaIndex
         Settings.chunk_size = CHUNK_SIZE
         Settings.chunk_overlap = CHUNK_OVERLAP
 
-    def build_index(self, force_rebuild: bool = False) -> VectorStoreIndex:
+    def build_index(self, force_rebuild: bool = False) -> AkuiteoVectorStore:
         """
         Construit ou charge l'index vectoriel depuis les documents.
-        Priorité au cache ; rebuild si force_rebuild=True.
+        Priorité au cache ; si force_rebuild=True, seuls les documents
+        ajoutés, modifiés ou supprimés depuis le dernier build sont
+        ré-indexés (manifeste des empreintes SHA-256 dans INDEX_DIR).
         """
         INDEX_DIR.mkdir(parents=True, exist_ok=True)
         persist_path = INDEX_DIR / "vectorstore"
+        has_index = AkuiteoVectorStore.exists(persist_path)
+
+        manifest = self._load_manifest()
 
         # Chargement depuis cache si disponible
-        if not force_rebuild and (persist_path / "docstore.json").exists():
-            logger.info("⚡ Chargement de l'index depuis le cache...")
-            storage_context = StorageContext.from_defaults(
-                persist_dir=str(persist_path)
-            )
-            self.index = load_index_from_storage(storage_context)
-            logger.info("✅ Index chargé depuis le cache.")
-            return self.index
+        if not force_rebuild and has_index:
+            self._load_index(persist_path)
+        # Rebuild incrémental si le manifeste correspond aux réglages actuels
+        elif (
+            has_index
+            and manifest is not None
+            and manifest.get("settings") == self._index_settings()
+        ):
+            self._update_index(persist_path, manifest)
+        else:
+            self._full_build(persist_path)
 
-        # Construction de l'index
+        self._load_bm25(persist_path)
+        self.store.ann = load_or_build_ann(
+            persist_path, self.store.embeddings, [record["id"] for record in self.store.records]
+        )
+        self._on_index_changed()
+        return self.store
+
+    def _on_index_changed(self):
+        """Invalide les résultats de requêtes en cache et date la version de l'index."""
+        manifest = self._load_manifest() or {}
+        fingerprint = json.dumps(
+            [manifest.get("settings"), sorted(
+                (key, entry.get("sha256")) for key, entry in manifest.get("documents", {}).items()
+            )],
+        )
+        self.index_version = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+        self._query_results.clear()
+
+    def _load_bm25(self, persist_path: Path):
+        """Charge l'index BM25 persisté, ou le reconstruit s'il ne correspond plus au vector store."""
+        bm25_path = persist_path / "bm25.json"
+        node_ids = [record["id"] for record in self.store.records]
+        if bm25_path.exists():
+            try:
+                bm25 = BM25Index.load(bm25_path)
+                if bm25.ids == node_ids:
+                    self.bm25 = bm25
+                    return
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️  Index BM25 illisible, reconstruction : {e}")
+        self.bm25 = BM25Index.from_records(self.store.records)
+        self.bm25.save(bm25_path)
+        logger.info(f"✅ Index BM25 construit ({len(node_ids)} chunks).")
+
+    def _load_index(self, persist_path: Path) -> AkuiteoVectorStore:
+        """Ouvre l'index persisté sur disque (embeddings en mmap)."""
+        logger.info("⚡ Chargement de l'index depuis le cache...")
+        self.store = AkuiteoVectorStore(persist_path, quantization=self.quantization).load()
+        logger.info(f"✅ Index chargé depuis le cache ({len(self.store)} chunks).")
+        return self.store
+
+    def _full_build(self, persist_path: Path) -> AkuiteoVectorStore:
+        """Construit l'index complet à partir de tous les documents."""
         logger.info("🔨 Construction de l'index RAG...")
-        documents = self._load_documents()
+        hashes = self._hash_documents()
+        nodes_by_key = self._build_nodes(hashes.keys())
 
-        if not documents:
+        if not nodes_by_key:
             raise ValueError(
                 "Aucun document trouvé dans data/. "
                 "Placez Extrait_LivreBlanc.docx, Cas_d_Usages_CRM_Akuiteo_POC.pdf "
                 "et Mode_operatoire_-_CRM.pdf dans le dossier data/."
             )
 
-        splitter = SentenceSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
+        nodes = [node for key_nodes in nodes_by_key.values() for node in key_nodes]
+        self.store = AkuiteoVectorStore(persist_path, quantization=self.quantization)
+        self.store.add(nodes)
+        self.store.persist()
+        self._save_manifest({
+            doc_key: self._manifest_entry(doc_key, hashes[doc_key], key_nodes)
+            for doc_key, key_nodes in nodes_by_key.items()
+        })
+        self.last_build_stats = {
+            "mode": "full",
+            "added": sorted(nodes_by_key),
+            "changed": [],
+            "removed": [],
+            "chunks": len(nodes),
+            "ingestion": self.pipeline.last_stats,
+        }
+        logger.info(
+            f"✅ Index construit et sauvegardé "
+            f"({len(nodes)} chunks depuis {len(nodes_by_key)} documents)."
         )
+        return self.store
+
+    def _update_index(self, persist_path: Path, manifest: dict) -> AkuiteoVectorStore:
+        """
+        Met à jour l'index existant : supprime les nœuds des documents
+        modifiés/supprimés et insère ceux des documents ajoutés/modifiés.
+        """
+        hashes = self._hash_documents()
+        indexed = manifest.get("documents", {})
 
-        self.index = VectorStoreIndex.from_documents(
-            documents,
-            transformations=[splitter],
-            show_progress=True,
+        added = sorted(k for k in hashes if k not in indexed)
+        changed = sorted(
+            k for k in hashes if k in indexed and indexed[k]["sha256"] != hashes[k]
         )
-        self.index.storage_context.persist(persist_dir=str(persist_path))
+        removed = sorted(k for k in indexed if k not in hashes)
+
+        self._load_index(persist_path)
+        self.last_build_stats = {
+            "mode": "incremental",
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+            "chunks": 0,
+        }
+        if not (added or changed or removed):
+            logger.info("✅ Index déjà à jour, aucun document modifié.")
+            return self.store
+
         logger.info(
-            f"✅ Index construit et sauvegardé "
-            f"({len(documents)} chunks depuis {len(DOCUMENTS)} documents)."
+            f"🔁 Mise à jour incrémentale — ajoutés : {added or '-'}, "
+            f"modifiés : {changed or '-'}, supprimés : {removed or '-'}"
         )
-        return self.index
-
-    def _load_documents(self) -> List[Document]:
-        """Charge les documents DOCX et PDF avec métadonnées source."""
-        all_docs = []
-        readers = {
-            ".docx": DocxReader(),
-            ".pdf":  PDFReader(),
+
+        stale_ids = [
+            node_id
+            for doc_key in changed + removed
+            for node_id in indexed[doc_key].get("node_ids", [])
+        ]
+        self.store.delete(stale_ids)
+        for doc_key in changed + removed:
+            indexed.pop(doc_key, None)
+
+        nodes_by_key = self._build_nodes(added + changed)
+        nodes = [node for key_nodes in nodes_by_key.values() for node in key_nodes]
+        self.store.add(nodes)
+        for doc_key, key_nodes in nodes_by_key.items():
+            indexed[doc_key] = self._manifest_entry(doc_key, hashes[doc_key], key_nodes)
+
+        self.store.persist()
+        self._save_manifest(indexed)
+        self.last_build_stats["chunks"] = len(nodes)
+        self.last_build_stats["ingestion"] = self.pipeline.last_stats
+        logger.info(
+            f"✅ Index mis à jour ({len(stale_ids)} chunks supprimés, "
+            f"{len(nodes)} chunks insérés)."
+        )
+        return self.store
+
+    def _build_nodes(self, doc_keys: Iterable[str]) -> Dict[str, List[BaseNode]]:
+        """Parse, découpe et embed les documents demandés, regroupés par doc_key."""
+        return self.pipeline.run(doc_keys)
+
+    # ── Manifeste des documents indexés ───────────────────────────────────────
+
+    @staticmethod
+    def _index_settings() -> dict:
+        """Réglages dont un changement impose un rebuild complet."""
+        return {
+            "embed_model": EMBED_MODEL,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "vector_dtype": VECTOR_DTYPE,
         }
 
-        # Mapping lisible pour les citations
-        source_labels = {
-            "livre_blanc":  "Livre Blanc Akuiteo",
-            "cas_usages":   "Cas d'Usage CRM (POC)",
-            "mode_op_crm":  "Mode Opératoire CRM",
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        """Empreinte SHA-256 du contenu d'un fichier."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _hash_documents(self) -> Dict[str, str]:
+        """Empreintes des documents présents (DOCUMENTS et fichier des analyses d'images)."""
+        return {
+            doc_key: self._hash_file(doc_path)
+            for doc_key, doc_path in document_paths().items()
+            if doc_path.exists()
         }
 
-        for doc_key, doc_path in DOCUMENTS.items():
-            if not doc_path.exists():
-                logger.warning(f"⚠️  Document manquant : {doc_path.name}")
-                continue
+    @staticmethod
+    def _manifest_entry(doc_key: str, sha256: str, nodes: List[BaseNode]) -> dict:
+        return {
+            "filename": document_paths()[doc_key].name,
+            "sha256": sha256,
+            "node_ids": [node.node_id for node in nodes],
+        }
 
-            suffix = doc_path.suffix.lower()
-            reader = readers.get(suffix)
-            if reader is None:
-                logger.warning(f"⚠️  Format non supporté : {suffix}")
-                continue
+    @staticmethod
+    def _load_manifest() -> Optional[dict]:
+        """Lit le manifeste ; None s'il est absent, illisible ou d'une autre version."""
+        manifest_path = INDEX_DIR / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Manifeste illisible, rebuild complet : {e}")
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
 
-            try:
-                docs = reader.load_data(file=doc_path)
-                label = source_labels.get(doc_key, doc_path.name)
-                for doc in docs:
-                    doc.metadata["source"] = label
-                    doc.metadata["filename"] = doc_path.name
-                    doc.metadata["doc_key"] = doc_key
-                all_docs.extend(docs)
-                logger.info(f"✅ {label} : {len(docs)} chunks chargés")
-            except Exception as e:
-                logger.error(f"❌ Erreur chargement {doc_path.name}: {e}")
-
-        return all_docs
+    def _save_manifest(self, documents: Dict[str, dict]):
+        """Écrit le manifeste de façon atomique à côté de data/index/vectorstore."""
+        manifest_path = INDEX_DIR / "manifest.json"
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "settings": self._index_settings(),
+            "documents": documents,
+        }
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        tmp_path.replace(manifest_path)
 
     def query(self, question: str, top_k: int = TOP_K) -> dict:
         """
         Recherche RAG — appelé par le tool 'rag_search' de l'agent.
+        Les résultats sont mis en cache par (requête normalisée, top_k)
+        jusqu'au prochain rebuild de l'index.
 
         Args:
             question : Question en langage naturel
             top_k    : Nombre de passages à récupérer
 
         Returns:
-            dict avec clés 'passages' (list[str]) et 'sources' (list[str])
+            dict avec clés 'passages' (list[str]), 'sources' (list[str]),
+            'count' (int), 'cached' (bool) et 'timings' (ms par étape)
+        """
+        return self.query_many([question], top_k)[0]
+
+    @traced("rag.query_many")
+    def query_many(self, questions: List[str], top_k: int = TOP_K) -> List[dict]:
+        """
+        Recherche RAG groupée — un résultat par question, dans le même ordre
+        et au même format que query(). Les questions absentes du cache sont
+        embeddées en une seule passe du modèle et scorées contre l'index en
+        une seule opération matricielle.
         """
-        if self.index is None:
+        if self.store is None:
             raise RuntimeError(
                 "Index non initialisé. Appelez build_index() d'abord."
             )
 
-        retriever = self.index.as_retriever(similarity_top_k=top_k)
-        nodes = retriever.retrieve(question)
+        results: List[Optional[dict]] = [None] * len(questions)
+        pending: Dict[tuple, List[int]] = {}  # clé de cache → positions dans questions
+        for i, question in enumerate(questions):
+            cache_key = (normalize_query(question), top_k)
+            cached = self._query_results.get(cache_key)
+            if cached is not None:
+                results[i] = {**cached, "cached": True, "timings": {}}
+            else:
+                pending.setdefault(cache_key, []).append(i)
+        annotate(questions=len(questions), cache_hits=sum(result is not None for result in results))
+        if not pending:
+            return results
+
+        batch = [questions[positions[0]] for positions in pending.values()]
+        timings = {}
+        start = time.perf_counter()
+        embeddings = self._embed_queries(batch)
+        timings["embed_ms"] = _elapsed_ms(start)
+
+        candidates = max(top_k, HYBRID_CANDIDATES) if HYBRID_SEARCH else top_k
+        start = time.perf_counter()
+        with span("rag.search", queries=len(batch), candidates=candidates):
+            dense_batch = self.store.search_many(embeddings, candidates)
+        timings["dense_ms"] = _elapsed_ms(start)
+
+        for (cache_key, positions), question, dense in zip(pending.items(), batch, dense_batch):
+            result, query_timings = self._rank(question, dense, candidates, top_k)
+            query_timings = {**timings, **query_timings}
+            logger.info(
+                "⏱️ RAG " + " | ".join(f"{stage} {ms}" for stage, ms in query_timings.items())
+            )
+            self._query_results.put(cache_key, result)
+            for i in positions:
+                results[i] = {**result, "cached": False, "timings": query_timings}
+        return results
+
+    async def aquery(self, question: str, top_k: int = TOP_K) -> dict:
+        """Variante asynchrone de query() : la recherche s'exécute dans l'executor par défaut."""
+        return (await self.aquery_many([question], top_k))[0]
+
+    async def aquery_many(self, questions: List[str], top_k: int = TOP_K) -> List[dict]:
+        """Variante asynchrone de query_many() (embedding et scoring hors de la boucle d'événements)."""
+        # to_thread (executor par défaut) propage le contexte de traçage
+        return await asyncio.to_thread(self.query_many, questions, top_k)
+
+    def _rank(self, question: str, dense: List[tuple], candidates: int, top_k: int) -> tuple:
+        """Fusionne les classements dense et BM25 d'une question et formate le résultat."""
+        timings = {}
+        dense_scores = dict(dense)
+
+        if HYBRID_SEARCH and self.bm25 is not None:
+            start = time.perf_counter()
+            lexical = self.bm25.search(question, candidates)
+            timings["bm25_ms"] = _elapsed_ms(start)
+
+            start = time.perf_counter()
+            lexical_rows = [self.store.row_of(node_id) for node_id, _ in lexical]
+            rows = self._fuse(
+                [[row for row, _ in dense], [row for row in lexical_rows if row is not None]]
+            )[:top_k]
+            timings["fusion_ms"] = _elapsed_ms(start)
+        else:
+            rows = [row for row, _ in dense[:top_k]]
 
         passages = []
         sources = []
-        for node in nodes:
-            text = node.node.get_content().strip()
-            source = node.node.metadata.get("source", "Source inconnue")
-            score = round(node.score, 3) if node.score else "N/A"
+        for row in rows:
+            record = self.store.record(row)
+            text = record["text"].strip()
+            source = record["metadata"].get("source", "Source inconnue")
+            score = round(dense_scores[row], 3) if row in dense_scores else "BM25"
             if text:
                 passages.append(text)
                 sources.append(f"{source} (score: {score})")
 
-        return {
+        result = {
             "passages": passages,
             "sources": sources,
             "count": len(passages),
         }
+        return result, timings
+
+    @staticmethod
+    def _fuse(rankings: List[List[int]]) -> List[int]:
+        """Reciprocal Rank Fusion : score(d) = Σ 1 / (RRF_K + rang)."""
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, row in enumerate(ranking, 1):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(fused, key=fused.get, reverse=True)
+
+    def embed_query(self, question: str) -> List[float]:
+        """Embedding bge-m3 d'une question (cache de requêtes partagé avec query)."""
+        return self._embed_queries([question])[0]
+
+    @traced("rag.embed_queries")
+    def _embed_queries(self, questions: List[str]) -> List[List[float]]:
+        """
+        Embeddings des requêtes, mis en cache par requête normalisée ;
+        les requêtes absentes du cache passent ensemble dans le modèle.
+        """
+        keys = [normalize_query(question) for question in questions]
+        embeddings = [self._query_embeddings.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        annotate(count=len(questions), cache_misses=len(missing))
+        if len(missing) == 1:
+            embeddings[missing[0]] = Settings.embed_model.get_query_embedding(questions[missing[0]])
+        elif missing:
+            # bge-m3 n'utilise pas d'instruction de requête : embedding requête = embedding texte
+            computed = Settings.embed_model.get_text_embedding_batch(
+                [questions[i] for i in missing]
+            )
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+        for i in missing:
+            self._query_embeddings.put(keys[i], embeddings[i])
+        return embeddings
+
+    def warm_up(self):
+        """Premier passage du modèle d'embedding, hors cache, pour initialiser torch."""
+        Settings.embed_model.get_query_embedding("Akuiteo")
+
+    def cache_stats(self) -> dict:
+        """Taux de succès des caches de requêtes et du cache d'embeddings."""
+        return {
+            "index_version": self.index_version,
+            "query_embeddings": self._query_embeddings.stats(),
+            "query_results": self._query_results.stats(),
+            "chunk_embeddings": self.embed_cache.stats(),
+        }
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,294 @@
+"""
+core/tracing.py — Spans de traçage (latence, tokens) exportés en JSONL et, en option, en OTLP
+"""
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    TRACE_ENABLED, TRACE_FILE, TRACE_FILE_MAX_MB, TRACE_BUFFER_SPANS,
+    TRACE_OTLP_ENDPOINT, TRACE_PENDING_TTL_S, TRACE_STATS_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "appi-akuiteo"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("akuiteo_current_span", default=None)
+
+
+class Span:
+    """Opération chronométrée ; les spans d'un même tour partagent trace_id."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return round((end_ns - self.start_ns) / 1e6, 2)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Reçoit les spans terminés :
+    - une ligne JSON par span dans TRACE_FILE, mise en tampon et écrite hors du
+      verrou des agrégats, à la fin de chaque trace ou tous les TRACE_BUFFER_SPANS spans
+    - si TRACE_OTLP_ENDPOINT est défini, chaque trace complète (à la fin de son
+      span racine) est envoyée en OTLP/HTTP JSON à un collecteur local, en arrière-plan ;
+      une trace dont le span racine ne se termine pas est oubliée après TRACE_PENDING_TTL_S
+    - agrégats glissants par nom de span (TRACE_STATS_WINDOW dernières mesures)
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACE_ENABLED,
+        path: Optional[Path] = TRACE_FILE,
+        otlp_endpoint: str = TRACE_OTLP_ENDPOINT,
+        stats_window: int = TRACE_STATS_WINDOW,
+        buffer_spans: int = TRACE_BUFFER_SPANS,
+        pending_ttl_s: float = TRACE_PENDING_TTL_S,
+    ):
+        self.enabled = enabled
+        self.path = path
+        self.otlp_endpoint = otlp_endpoint
+        self.buffer_spans = buffer_spans
+        self.pending_ttl_s = pending_ttl_s
+        self._durations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=stats_window))
+        self._tokens: Dict[str, int] = defaultdict(int)
+        self._buffer: List[str] = []
+        # trace_id → (début d'attente, spans), dans l'ordre d'arrivée : les plus anciennes en tête
+        self._pending: Dict[str, Tuple[float, List[Span]]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def finish(self, span: Span):
+        record = span.to_dict()
+        line = json.dumps(record, ensure_ascii=False, default=str) if self.path is not None else None
+        lines = trace = None
+        with self._lock:
+            self._durations[span.name].append(record["duration_ms"])
+            for key, value in span.attributes.items():
+                if key.endswith("_tokens") and isinstance(value, int) and span.name.startswith(("claude.", "vision.")):
+                    self._tokens[key] += value
+            if line is not None:
+                self._buffer.append(line)
+                if span.parent_id is None or len(self._buffer) >= self.buffer_spans:
+                    lines, self._buffer = self._buffer, []
+            if self.otlp_endpoint:
+                trace = self._collect_trace(span)
+        if lines:
+            self._write(lines)
+        if trace:
+            threading.Thread(target=self._export_otlp, args=(trace,), name="otlp-export", daemon=True).start()
+
+    def flush(self):
+        """Écrit les spans encore en tampon (fin de processus, changement de fichier)."""
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if lines:
+            self._write(lines)
+
+    def _collect_trace(self, span: Span) -> Optional[List[Span]]:
+        """Range le span avec sa trace ; renvoie la trace complète à la fin de son span racine."""
+        now = time.monotonic()
+        stale = []
+        for trace_id, (since, _) in self._pending.items():
+            if now - since < self.pending_ttl_s:
+                break
+            stale.append(trace_id)
+        for trace_id in stale:
+            del self._pending[trace_id]
+        if stale:
+            logger.debug(f"{len(stale)} trace(s) sans span racine terminé oubliée(s)")
+
+        self._pending.setdefault(span.trace_id, (now, []))[1].append(span)
+        if span.parent_id is None:
+            return self._pending.pop(span.trace_id)[1]
+        return None
+
+    def _write(self, lines: List[str]):
+        """Ajoute des spans au fichier JSONL (rotation unique en .1 au-delà de TRACE_FILE_MAX_MB)."""
+        with self._write_lock:
+            path = self.path
+            if path is None:
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.stat().st_size > TRACE_FILE_MAX_MB * 1024 * 1024:
+                path.replace(path.with_suffix(path.suffix + ".1"))
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def stats(self) -> dict:
+        """{"spans": {nom: {count, mean_ms, p50_ms, p95_ms, max_ms}}, "tokens": {...}}"""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._durations.items() if values}
+            tokens = dict(self._tokens)
+        spans = {}
+        for name, values in sorted(snapshot.items()):
+            spans[name] = {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values), 1),
+                "p50_ms": round(values[len(values) // 2], 1),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+                "max_ms": round(values[-1], 1),
+            }
+        return {"spans": spans, "tokens": tokens}
+
+    def _export_otlp(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "core.tracing"},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+        request = urllib.request.Request(
+            self.otlp_endpoint,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        except OSError as e:
+            logger.warning(f"⚠️  Export OTLP impossible ({self.otlp_endpoint}) : {e}")
+
+
+TRACER = Tracer()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Ouvre un span enfant du span courant (contextvars : suit threads copiés et tâches asyncio)."""
+    if not TRACER.enabled:
+        yield _NOOP_SPAN
+        return
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:  # flux abandonné par le consommateur : pas une erreur
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        try:
+            _current_span.reset(token)
+        except ValueError:  # générateur repris dans un autre contexte
+            _current_span.set(None)
+        TRACER.finish(current)
+
+
+def annotate(**attributes):
+    """Ajoute des attributs au span courant (sans effet hors span)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def traced(name: str):
+    """Décorateur : exécute la fonction (sync, async ou générateur) dans un span."""
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            raise TypeError("traced ne prend pas en charge les générateurs asynchrones")
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                with span(name):
+                    return (yield from fn(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return {"key": key, "value": {"stringValue": value}}
+
+
+def _otlp_span(span: Span) -> dict:
+    encoded = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    return encoded
@@ -0,0 +1,281 @@
+"""
+core/vector_store.py — Vector store binaire mappé en mémoire (NumPy mmap + sidecar JSONL)
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    VECTOR_DTYPE, SEARCH_BLOCK_ROWS, VECTOR_QUANTIZATION,
+    RESCORE_FACTOR, RESCORE_FACTOR_BINARY, RESCORE_MIN_CANDIDATES,
+)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.jsonl"
+INT8_FILE = "embeddings_int8.npy"
+INT8_SCALE_FILE = "embeddings_int8_scale.npy"
+BINARY_FILE = "embeddings_binary.npy"
+
+# Nombre de bits à 1 de chaque octet, pour la distance de Hamming vectorisée
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Anciens fichiers JSON du SimpleVectorStore LlamaIndex, remplacés par ce format
+LEGACY_FILES = (
+    "docstore.json",
+    "default__vector_store.json",
+    "image__vector_store.json",
+    "index_store.json",
+    "graph_store.json",
+)
+
+
+class AkuiteoVectorStore:
+    """
+    Vector store persisté en deux fichiers :
+    - embeddings.npy : matrice contiguë (N, D) float32/float16, normalisée L2,
+      ouverte en mmap (chargement quasi instantané, pages partagées entre processus)
+    - nodes.jsonl    : une ligne par nœud (id, texte, métadonnées), même ordre que la matrice
+    La recherche top-k est un produit matriciel vectorisé par blocs de lignes,
+    ou, si un index ANN est attaché (self.ann), un rescoring exact de ses candidats.
+
+    Avec quantization="int8" ou "binary", une copie quantifiée (4× / 32× plus
+    petite) est gardée en RAM pour le premier passage ; seuls les top_k × RESCORE_FACTOR
+    candidats (RESCORE_FACTOR_BINARY en binaire, au moins RESCORE_MIN_CANDIDATES) sont
+    rescorés contre les vecteurs pleine précision mappés sur disque.
+    """
+
+    def __init__(
+        self,
+        persist_dir: Path,
+        dtype: str = VECTOR_DTYPE,
+        quantization: str = VECTOR_QUANTIZATION,
+    ):
+        self.persist_dir = persist_dir
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self.embeddings: np.ndarray = np.empty((0, 0), dtype=self.dtype)
+        self._codes: Optional[np.ndarray] = None   # int8 (N, D) ou bits packés (N, D/8)
+        self._scales: Optional[np.ndarray] = None  # échelle par ligne (int8)
+        self.records: List[dict] = []
+        self._row_by_id: Dict[str, int] = {}
+        self.ann = None  # Index ANN optionnel (core.ann), invalidé à chaque modification
+
+    @staticmethod
+    def exists(persist_dir: Path) -> bool:
+        return (persist_dir / EMBEDDINGS_FILE).exists() and (persist_dir / NODES_FILE).exists()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    # ── Persistance ───────────────────────────────────────────────────────────
+
+    def load(self) -> "AkuiteoVectorStore":
+        """Ouvre la matrice en mmap (lecture seule) et lit le sidecar des nœuds."""
+        embeddings = np.load(self.persist_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        with open(self.persist_dir / NODES_FILE, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if len(records) != embeddings.shape[0]:
+            raise ValueError(
+                f"Vector store incohérent : {embeddings.shape[0]} vecteurs "
+                f"pour {len(records)} nœuds."
+            )
+        self.embeddings = embeddings
+        self.dtype = embeddings.dtype
+        self._set_records(records)
+        self._load_quantized()
+        return self
+
+    def persist(self):
+        """Écrit les deux fichiers de façon atomique puis les rouvre en mmap."""
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        emb_tmp = self.persist_dir / f"{EMBEDDINGS_FILE}.tmp.npy"
+        nodes_tmp = self.persist_dir / f"{NODES_FILE}.tmp"
+
+        np.save(emb_tmp, np.ascontiguousarray(self.embeddings, dtype=self.dtype))
+        with open(nodes_tmp, "w", encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        # os.replace garde l'ancien inode valide pour les processus qui l'ont mappé
+        os.replace(emb_tmp, self.persist_dir / EMBEDDINGS_FILE)
+        os.replace(nodes_tmp, self.persist_dir / NODES_FILE)
+        for name in LEGACY_FILES:
+            (self.persist_dir / name).unlink(missing_ok=True)
+        for name in (INT8_FILE, INT8_SCALE_FILE, BINARY_FILE):
+            (self.persist_dir / name).unlink(missing_ok=True)
+        self.load()
+
+    # ── Quantification ────────────────────────────────────────────────────────
+
+    def _load_quantized(self):
+        """Charge (ou calcule et persiste) la copie quantifiée utilisée au premier passage."""
+        self._codes = self._scales = None
+        if self.quantization not in ("int8", "binary") or len(self.records) == 0:
+            return
+
+        n = len(self.records)
+        if self.quantization == "int8":
+            codes_path = self.persist_dir / INT8_FILE
+            scales_path = self.persist_dir / INT8_SCALE_FILE
+            if codes_path.exists() and scales_path.exists():
+                codes, scales = np.load(codes_path), np.load(scales_path)
+                if codes.shape[0] == n:
+                    self._codes, self._scales = codes, scales
+                    return
+            codes = np.empty(self.embeddings.shape, dtype=np.int8)
+            scales = np.empty(n, dtype=np.float32)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                block = np.asarray(self.embeddings[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                block_scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+                codes[start:start + len(block)] = np.round(block / block_scales[:, None]).astype(np.int8)
+                scales[start:start + len(block)] = block_scales
+            np.save(codes_path, codes)
+            np.save(scales_path, scales)
+            self._codes, self._scales = codes, scales
+        else:
+            codes_path = self.persist_dir / BINARY_FILE
+            if codes_path.exists():
+                codes = np.load(codes_path)
+                if codes.shape[0] == n:
+                    self._codes = codes
+                    return
+            codes = np.empty((n, (self.dim + 7) // 8), dtype=np.uint8)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                block = np.asarray(self.embeddings[start:start + SEARCH_BLOCK_ROWS])
+                codes[start:start + len(block)] = np.packbits(block > 0, axis=1)
+            np.save(codes_path, codes)
+            self._codes = codes
+
+    def _quantized_candidates(self, query: np.ndarray, count: int) -> np.ndarray:
+        """Premier passage sur la copie quantifiée : lignes des count meilleurs candidats."""
+        n = self._codes.shape[0]
+        if self.quantization == "int8":
+            scores = np.empty(n, dtype=np.float32)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                block = self._codes[start:start + SEARCH_BLOCK_ROWS].astype(np.float32)
+                scores[start:start + len(block)] = (block @ query) * self._scales[start:start + len(block)]
+        else:
+            query_bits = np.packbits(query > 0)
+            scores = np.empty(n, dtype=np.float32)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                block = self._codes[start:start + SEARCH_BLOCK_ROWS]
+                distances = _POPCOUNT[np.bitwise_xor(block, query_bits)].sum(axis=1, dtype=np.int32)
+                scores[start:start + len(block)] = -distances
+        count = min(count, n)
+        return np.argpartition(-scores, count - 1)[:count]
+
+    # ── Mise à jour ───────────────────────────────────────────────────────────
+
+    def add(self, nodes: Iterable[BaseNode]):
+        """Ajoute des nœuds déjà embeddés (node.embedding renseigné)."""
+        nodes = list(nodes)
+        if not nodes:
+            return
+        self.ann = None
+        self._codes = self._scales = None
+        vectors = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+        vectors = self._normalize(vectors)
+        if len(self.records) == 0:
+            self.embeddings = vectors.astype(self.dtype)
+        else:
+            self.embeddings = np.concatenate(
+                [np.asarray(self.embeddings), vectors.astype(self.dtype)]
+            )
+        self._set_records(self.records + [
+            {
+                "id": node.node_id,
+                "text": node.get_content(),
+                "metadata": dict(node.metadata),
+            }
+            for node in nodes
+        ])
+
+    def delete(self, node_ids: Iterable[str]):
+        """Supprime les nœuds donnés (ids inconnus ignorés)."""
+        drop = {self._row_by_id[i] for i in node_ids if i in self._row_by_id}
+        if not drop:
+            return
+        self.ann = None
+        self._codes = self._scales = None
+        keep = np.ones(len(self.records), dtype=bool)
+        keep[list(drop)] = False
+        self.embeddings = np.asarray(self.embeddings)[keep]
+        self._set_records([record for record, kept in zip(self.records, keep) if kept])
+
+    # ── Recherche ─────────────────────────────────────────────────────────────
+
+    def search(self, query_embedding, top_k: int) -> List[Tuple[int, float]]:
+        """
+        Top-k par similarité cosinus ; renvoie [(ligne, score)] triés.
+        Avec un index ANN ou une copie quantifiée, seuls leurs candidats
+        sont scorés, contre les vecteurs pleine précision (scores exacts).
+        """
+        return self.search_many([query_embedding], top_k)[0]
+
+    def search_many(self, query_embeddings, top_k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k de plusieurs requêtes. En recherche exacte, toutes les requêtes
+        sont scorées en un seul produit matriciel (N, D) × (D, M) par bloc.
+        """
+        n = len(self.records)
+        if n == 0 or top_k <= 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+
+        if self.ann is not None or self._codes is not None:
+            return [self._search_candidates(query, top_k) for query in queries]
+
+        scores = np.empty((n, len(queries)), dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = self.embeddings[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ queries.T
+        return [self._top_k(scores[:, j], top_k) for j in range(len(queries))]
+
+    def _search_candidates(self, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Candidats de l'index ANN ou du premier passage quantifié, rescorés exactement."""
+        if self.ann is not None:
+            rows = np.unique(self.ann.candidates(query, top_k))
+            rows = rows[rows >= 0]
+        else:
+            factor = RESCORE_FACTOR_BINARY if self.quantization == "binary" else RESCORE_FACTOR
+            count = max(top_k * factor, RESCORE_MIN_CANDIDATES)
+            rows = np.sort(self._quantized_candidates(query, count))
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+        return [(int(rows[i]), score) for i, score in self._top_k(scores, top_k)]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def record(self, row: int) -> dict:
+        return self.records[row]
+
+    def row_of(self, node_id: str) -> Optional[int]:
+        return self._row_by_id.get(node_id)
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _set_records(self, records: List[dict]):
+        self.records = records
+        self._row_by_id = {record["id"]: row for row, record in enumerate(records)}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
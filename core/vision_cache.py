@@ -0,0 +1,98 @@
+"""
+core/vision_cache.py — Cache persistant des analyses vision, par empreinte perceptuelle des captures
+"""
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    INDEX_DIR, CLAUDE_MODEL,
+    VISION_CACHE_MAX_DISTANCE, VISION_CACHE_TTL, VISION_CACHE_MAX_ENTRIES,
+)
+from core.cache_base import SQLiteCache
+from core.image_optimizer import hamming_distance
+from core.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class VisionAnalysisCache(SQLiteCache):
+    """
+    Analyses Claude Vision réutilisées pour les écrans récurrents.
+    - Clé exacte : modèle + question normalisée + empreinte du contexte RAG
+    - Clé approchée : dHash de la capture préparée ; une capture à au plus
+      max_distance bits d'une capture en cache (même écran, autre résolution,
+      compression ou curseur) renvoie l'analyse stockée
+    - TTL, éviction LRU au-delà de max_entries, stockage SQLite sous INDEX_DIR
+    """
+
+    table = "analyses"
+
+    def __init__(
+        self,
+        path: Path = INDEX_DIR / "vision.sqlite",
+        model_name: str = CLAUDE_MODEL,
+        max_distance: int = VISION_CACHE_MAX_DISTANCE,
+        ttl_s: float = VISION_CACHE_TTL,
+        max_entries: int = VISION_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path, [
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " question_key TEXT NOT NULL,"
+            " dhash TEXT NOT NULL,"
+            " analysis TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_analyses_question ON analyses(question_key)",
+        ])
+        self.model_name = model_name
+        self.max_distance = max_distance
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+    def question_key(self, question: str, context: str = "") -> str:
+        payload = f"{self.model_name}\n{normalize_query(question)}\n{context.strip()}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def lookup(self, dhash: str, question: str, context: str = "") -> Optional[dict]:
+        """Renvoie {analysis, distance} de la capture en cache la plus proche, ou None."""
+        key = self.question_key(question, context)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, dhash, analysis FROM analyses WHERE question_key = ? AND created_at >= ?",
+                (key, now - self.ttl_s),
+            ).fetchall()
+            best = None
+            for row_id, cached_hash, analysis in rows:
+                distance = hamming_distance(dhash, cached_hash)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id, analysis)
+            if best is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE analyses SET last_used = ? WHERE id = ?", (now, best[1]))
+            self._conn.commit()
+            self.hits += 1
+            return {"analysis": best[2], "distance": best[0]}
+
+    def put(self, dhash: str, question: str, context: str, analysis: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO analyses (question_key, dhash, analysis, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.question_key(question, context), dhash, analysis, now, now),
+            )
+            self._conn.execute("DELETE FROM analyses WHERE created_at < ?", (now - self.ttl_s,))
+            self._conn.execute(
+                "DELETE FROM analyses WHERE id NOT IN "
+                "(SELECT id FROM analyses ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
@@ -1,18 +1,22 @@
 """
 core/vision_engine.py — Analyse de captures d'écran Akuiteo via Claude Vision
 """
+import asyncio
 import base64
 import logging
 from pathlib import Path
-from io import BytesIO
-from typing import Union
+from typing import Optional, Union
 
 import anthropic
-from PIL import Image
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
-from config import ANTHROPIC_API_KEY, CLAUDE_MODEL
+from config import CLAUDE_MODEL, PROMPT_CACHING, IMAGE_MAX_BYTES_MB, VISION_CACHE_ENABLED
+from core.clients import get_async_client, get_client
+from core.image_cache import PREPARED_IMAGES, PreparedImageCache, image_key
+from core.image_optimizer import ImageOptimizer
+from core.tracing import annotate, traced
+from core.vision_cache import VisionAnalysisCache
 
 logger = logging.getLogger(__name__)
 
@@ -35,9 +39,28 @@ class AkuiteoVisionEngine:
     Utilise Claude Vision (nativement multimodal).
     """
 
-    def __init__(self):
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    def __init__(
+        self,
+        image_cache: Optional[PreparedImageCache] = None,
+        optimizer: Optional[ImageOptimizer] = None,
+        analysis_cache: Optional[VisionAnalysisCache] = None,
+        client: Optional[anthropic.Anthropic] = None,
+        async_client: Optional[anthropic.AsyncAnthropic] = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.image_cache = image_cache if image_cache is not None else PREPARED_IMAGES
+        self.optimizer = optimizer if optimizer is not None else ImageOptimizer()
+        if analysis_cache is None and VISION_CACHE_ENABLED:
+            analysis_cache = VisionAnalysisCache()
+        self.analysis_cache = analysis_cache
+        self._async_client = async_client
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """Client injecté, sinon le client partagé de la boucle d'événements courante."""
+        return self._async_client if self._async_client is not None else get_async_client()
 
+    @traced("vision.analyze")
     def analyze_screenshot(
         self,
         image_input: Union[str, bytes, "UploadedFile"],  # Streamlit UploadedFile ou path
@@ -56,57 +79,59 @@ class AkuiteoVisionEngine:
             dict avec 'analysis' (str) et 'metadata' (dict)
         """
         try:
-            image_data, media_type = self._prepare_image(image_input)
+            image_data, media_type, image_stats = self.prepare_image(image_input)
         except Exception as e:
             logger.error(f"❌ Erreur préparation image : {e}")
-            return {"analysis": f"Erreur lors du chargement de l'image : {e}", "metadata": {}}
+            return {"analysis": f"Erreur lors du chargement de l'image : {e}", "metadata": {"error": str(e)}}
 
-        # Construction du prompt avec contexte RAG si disponible
-        prompt_parts = []
-        if context:
-            prompt_parts.append(
-                f"Contexte documentaire Akuiteo pertinent :\n{context}\n\n"
-            )
-        prompt_parts.append(user_question)
-        full_prompt = "".join(prompt_parts)
+        cached = self._cached_analysis(image_stats, user_question, context)
+        if cached is not None:
+            return cached
 
         try:
             response = self.client.messages.create(
-                model=CLAUDE_MODEL,
-                max_tokens=1500,
-                system=VISION_SYSTEM_PROMPT,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": image_data,
-                                },
-                            },
-                            {
-                                "type": "text",
-                                "text": full_prompt,
-                            },
-                        ],
-                    }
-                ],
+                **self._build_request(image_data, media_type, user_question, context)
             )
+            result = self._build_result(response, context)
+            self._store_analysis(image_stats, user_question, context, result)
+            return result
 
-            analysis = response.content[0].text
+        except Exception as e:
+            logger.error(f"❌ Erreur API Claude Vision : {e}")
             return {
-                "analysis": analysis,
-                "metadata": {
-                    "model": CLAUDE_MODEL,
-                    "input_tokens": response.usage.input_tokens,
-                    "output_tokens": response.usage.output_tokens,
-                    "has_context": bool(context),
-                },
+                "analysis": f"Erreur lors de l'analyse : {e}",
+                "metadata": {"error": str(e)},
             }
 
+    @traced("vision.analyze")
+    async def aanalyze_screenshot(
+        self,
+        image_input: Union[str, bytes, "UploadedFile"],
+        user_question: str = "Qu'est-ce que je vois sur cet écran Akuiteo ?",
+        context: str = "",
+    ) -> dict:
+        """
+        Variante asynchrone de analyze_screenshot (AsyncAnthropic) : la
+        préparation de l'image (PIL) est déportée dans un thread.
+        """
+        try:
+            image_data, media_type, image_stats = await asyncio.to_thread(self.prepare_image, image_input)
+        except Exception as e:
+            logger.error(f"❌ Erreur préparation image : {e}")
+            return {"analysis": f"Erreur lors du chargement de l'image : {e}", "metadata": {"error": str(e)}}
+
+        cached = await asyncio.to_thread(self._cached_analysis, image_stats, user_question, context)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self.async_client.messages.create(
+                **self._build_request(image_data, media_type, user_question, context)
+            )
+            result = self._build_result(response, context)
+            await asyncio.to_thread(self._store_analysis, image_stats, user_question, context, result)
+            return result
+
         except Exception as e:
             logger.error(f"❌ Erreur API Claude Vision : {e}")
             return {
@@ -114,6 +139,103 @@ class AkuiteoVisionEngine:
                 "metadata": {"error": str(e)},
             }
 
+    def _cached_analysis(self, image_stats: dict, user_question: str, context: str) -> Optional[dict]:
+        """Analyse d'une capture perceptuellement identique pour la même question, sans appel API."""
+        if self.analysis_cache is None or "dhash" not in image_stats:
+            return None
+        try:
+            cached = self.analysis_cache.lookup(image_stats["dhash"], user_question, context)
+        except Exception as e:
+            logger.warning(f"Cache d'analyses vision indisponible : {e}")
+            return None
+        annotate(vision_cache_hit=cached is not None)
+        if cached is None:
+            return None
+        logger.info(f"💾 Analyse vision reprise du cache (distance dHash {cached['distance']})")
+        return {
+            "analysis": cached["analysis"],
+            "metadata": {
+                "model": CLAUDE_MODEL,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "has_context": bool(context),
+                "cached": True,
+                "dhash_distance": cached["distance"],
+            },
+        }
+
+    def _store_analysis(self, image_stats: dict, user_question: str, context: str, result: dict):
+        if self.analysis_cache is None or "dhash" not in image_stats:
+            return
+        try:
+            self.analysis_cache.put(image_stats["dhash"], user_question, context, result["analysis"])
+        except Exception as e:
+            logger.warning(f"Impossible d'enregistrer l'analyse vision en cache : {e}")
+
+    def _build_request(self, image_data: str, media_type: str, user_question: str, context: str) -> dict:
+        """Paramètres de l'appel Messages API pour une analyse de capture."""
+        # Construction du prompt avec contexte RAG si disponible
+        prompt_parts = []
+        if context:
+            prompt_parts.append(
+                f"Contexte documentaire Akuiteo pertinent :\n{context}\n\n"
+            )
+        prompt_parts.append(user_question)
+        full_prompt = "".join(prompt_parts)
+
+        image_block = {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": image_data,
+            },
+        }
+        system = VISION_SYSTEM_PROMPT
+        if PROMPT_CACHING:
+            # Préfixe system + image mis en cache : une nouvelle question sur
+            # la même capture ne repaie pas l'image
+            system = [{"type": "text", "text": VISION_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+            image_block["cache_control"] = {"type": "ephemeral"}
+
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": 1500,
+            "system": system,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        image_block,
+                        {
+                            "type": "text",
+                            "text": full_prompt,
+                        },
+                    ],
+                }
+            ],
+        }
+
+    @staticmethod
+    def _build_result(response, context: str) -> dict:
+        analysis = response.content[0].text
+        annotate(
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            cache_read_input_tokens=getattr(response.usage, "cache_read_input_tokens", 0) or 0,
+        )
+        return {
+            "analysis": analysis,
+            "metadata": {
+                "model": CLAUDE_MODEL,
+                "input_tokens": response.usage.input_tokens,
+                "output_tokens": response.usage.output_tokens,
+                "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", 0) or 0,
+                "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", 0) or 0,
+                "has_context": bool(context),
+            },
+        }
+
     def _prepare_image(self, image_input) -> tuple[str, str]:
         """
         Convertit l'image en base64 pour l'API Claude.
@@ -122,21 +244,20 @@ class AkuiteoVisionEngine:
         Returns:
             (base64_string, media_type)
         """
-        # Streamlit UploadedFile
-        if hasattr(image_input, "read"):
-            raw_bytes = image_input.read()
-            name = getattr(image_input, "name", "image.png")
-        # Chemin fichier
-        elif isinstance(image_input, (str, Path)):
-            path = Path(image_input)
-            raw_bytes = path.read_bytes()
-            name = path.name
-        # Bytes bruts
-        elif isinstance(image_input, bytes):
-            raw_bytes = image_input
-            name = "image.png"
-        else:
-            raise ValueError(f"Type d'image non supporté : {type(image_input)}")
+        image_data, media_type, _ = self.prepare_image(image_input)
+        return image_data, media_type
+
+    @traced("image.prepare")
+    def prepare_image(self, image_input) -> tuple[str, str, dict]:
+        """
+        Optimise (ImageOptimizer : budget de tokens, format, recadrage) et
+        encode l'image. Le résultat est mis en cache par empreinte du contenu
+        (image_cache) : une même capture n'est traitée qu'une fois.
+
+        Returns:
+            (base64_string, media_type, stats de l'optimisation)
+        """
+        raw_bytes, name = self._read_image(image_input)
 
         # Détection du type MIME
         ext = Path(name).suffix.lower()
@@ -149,30 +270,60 @@ class AkuiteoVisionEngine:
         }
         media_type = mime_map.get(ext, "image/png")
 
-        # Redimensionnement si image trop grande (max 5MB pour Claude)
-        raw_bytes = self._resize_if_needed(raw_bytes, media_type)
-
-        return base64.standard_b64encode(raw_bytes).decode("utf-8"), media_type
-
-    def _resize_if_needed(self, raw_bytes: bytes, media_type: str, max_size_mb: float = 4.5) -> bytes:
-        """Redimensionne l'image si > max_size_mb pour respecter les limites API."""
-        if len(raw_bytes) <= max_size_mb * 1024 * 1024:
-            return raw_bytes
-
-        logger.info(f"📐 Image trop grande ({len(raw_bytes)/1024/1024:.1f}MB), redimensionnement...")
-        img = Image.open(BytesIO(raw_bytes))
-        
-        # Réduction progressive jusqu'à taille acceptable
-        quality = 85
-        scale = 0.9
-        while len(raw_bytes) > max_size_mb * 1024 * 1024 and scale > 0.2:
-            new_size = (int(img.width * scale), int(img.height * scale))
-            resized = img.resize(new_size, Image.LANCZOS)
-            buf = BytesIO()
-            fmt = "JPEG" if "jpeg" in media_type else "PNG"
-            resized.save(buf, format=fmt, quality=quality)
-            raw_bytes = buf.getvalue()
-            scale -= 0.1
-            quality = max(60, quality - 5)
-
-        return raw_bytes
+        key = image_key(raw_bytes, media_type)
+        prepared = self.image_cache.get(key)
+        annotate(media_type=media_type, raw_bytes=len(raw_bytes), cache_hit=prepared is not None)
+        if prepared is not None:
+            return prepared
+
+        optimized, media_type, stats = self.optimizer.optimize(raw_bytes, media_type)
+        annotate(
+            optimized_bytes=stats["optimized_bytes"],
+            original_tokens=stats["original_tokens"],
+            optimized_tokens=stats["optimized_tokens"],
+        )
+        logger.info(
+            f"🖼️  Image {stats['content']} {stats['original_size'][0]}×{stats['original_size'][1]} → "
+            f"{stats['optimized_size'][0]}×{stats['optimized_size'][1]} {media_type} | "
+            f"{stats['original_bytes'] // 1024} → {stats['optimized_bytes'] // 1024} Ko | "
+            f"~{stats['original_tokens']} → ~{stats['optimized_tokens']} tokens "
+            f"({stats['duration_ms']} ms)"
+        )
+
+        prepared = base64.standard_b64encode(optimized).decode("utf-8"), media_type, stats
+        self.image_cache.put(key, prepared)
+        return prepared
+
+    @staticmethod
+    def _read_image(image_input) -> tuple[bytes, str]:
+        """Octets bruts et nom de l'image, sans consommer l'UploadedFile (relectures possibles)."""
+        # Streamlit UploadedFile (getvalue : tout le contenu, quelle que soit la position)
+        if hasattr(image_input, "getvalue"):
+            return image_input.getvalue(), getattr(image_input, "name", "image.png")
+        # Autre objet fichier : lecture depuis le début puis position restaurée
+        if hasattr(image_input, "read"):
+            position = image_input.tell() if hasattr(image_input, "tell") else None
+            if position is not None:
+                image_input.seek(0)
+            raw_bytes = image_input.read()
+            if position is not None:
+                image_input.seek(position)
+            return raw_bytes, getattr(image_input, "name", "image.png")
+        # Chemin fichier
+        if isinstance(image_input, (str, Path)):
+            path = Path(image_input)
+            return path.read_bytes(), path.name
+        # Bytes bruts
+        if isinstance(image_input, bytes):
+            return image_input, "image.png"
+        raise ValueError(f"Type d'image non supporté : {type(image_input)}")
+
+    def _resize_if_needed(self, raw_bytes: bytes, media_type: str, max_size_mb: float = IMAGE_MAX_BYTES_MB) -> bytes:
+        """
+        Réduit l'image au budget de tokens et sous max_size_mb, dans son format
+        d'origine. Conservé pour compatibilité : délègue à ImageOptimizer.
+        """
+        optimizer = self.optimizer
+        if max_size_mb != IMAGE_MAX_BYTES_MB:
+            optimizer = ImageOptimizer(max_bytes=int(max_size_mb * 1024 * 1024))
+        return optimizer.optimize(raw_bytes, media_type, keep_format=True)[0]
@@ -0,0 +1,75 @@
+"""
+core/warmup.py — Chargement du moteur RAG en arrière-plan (démarrage rapide de l'UI)
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AkuiteoWarmup:
+    """
+    Prépare le moteur RAG dans un thread dédié pendant que l'interface est
+    déjà utilisable. Les modules lourds (llama_index, torch, HuggingFace)
+    ne sont importés que dans ce thread.
+
+    timings (secondes) :
+    - imports     : import de core.rag_engine et de ses dépendances
+    - model_load  : chargement de bge-m3
+    - index_load  : ouverture (ou construction) de l'index
+    - first_query : premier passage du modèle (initialisation paresseuse de torch)
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.error: Optional[Exception] = None
+        self.timings: dict = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rag-warmup", daemon=True)
+
+    def start(self) -> "AkuiteoWarmup":
+        self._thread.start()
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Attend la fin du warm-up et renvoie le moteur RAG (relance l'erreur éventuelle)."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Le moteur RAG est encore en cours de chargement.")
+        if self.error is not None:
+            raise self.error
+        return self.engine
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            from core.rag_engine import AkuiteoRAGEngine
+            self.timings["imports"] = round(time.perf_counter() - start, 2)
+
+            start = time.perf_counter()
+            engine = AkuiteoRAGEngine()
+            self.timings["model_load"] = round(time.perf_counter() - start, 2)
+
+            start = time.perf_counter()
+            engine.build_index(force_rebuild=False)
+            self.timings["index_load"] = round(time.perf_counter() - start, 2)
+
+            start = time.perf_counter()
+            engine.warm_up()
+            self.timings["first_query"] = round(time.perf_counter() - start, 2)
+
+            self.engine = engine
+            logger.info(
+                "🚀 Moteur RAG prêt — "
+                + " | ".join(f"{step} {seconds}s" for step, seconds in self.timings.items())
+            )
+        except Exception as e:
+            logger.error(f"❌ Erreur au chargement du moteur RAG : {e}")
+            self.error = e
+        finally:
+            self._done.set()
@@ -0,0 +1,16 @@
+"""
+tests/conftest.py — Racine du projet dans sys.path, traces des tests hors de data/traces
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def _isolated_traces(tmp_path, monkeypatch):
+    from core import tracing
+    monkeypatch.setattr(tracing.TRACER, "path", tmp_path / "traces.jsonl")
+    monkeypatch.setattr(tracing.TRACER, "otlp_endpoint", "")
@@ -0,0 +1,229 @@
+"""
+tests/test_agent.py — Prompt système selon VISION_MODE, clients Claude, exécution concurrente des tools,
+points de cache de prompt
+"""
+import copy
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config import SYSTEM_PROMPT_TOOLS
+from core import agent as agent_module
+from core.agent import AkuiteoAgent, AsyncAkuiteoAgent, INLINE_VISION_PROMPT
+
+
+def _agent(vision_mode: str) -> AkuiteoAgent:
+    return AkuiteoAgent(rag_engine=None, vision_engine=None, vision_mode=vision_mode, client=object())
+
+
+def test_tool_mode_prompt_lists_both_tools():
+    agent = _agent("tool")
+    assert "Tu as accès à deux outils" in agent.system_prompt
+    assert "utilise vision_analysis" in agent.system_prompt
+    assert INLINE_VISION_PROMPT not in agent.system_prompt
+
+
+def test_inline_mode_prompt_has_no_vision_tool():
+    agent = _agent("inline")
+    assert [tool["name"] for tool in agent.tools] == ["rag_search"]
+    assert "vision_analysis" not in agent.system_prompt
+    assert "Tu as accès à un outil" in agent.system_prompt
+    assert SYSTEM_PROMPT_TOOLS["rag_search"] in agent.system_prompt
+    assert agent.system_prompt.endswith(INLINE_VISION_PROMPT)
+
+
+def test_unknown_vision_mode_rejected():
+    with pytest.raises(ValueError):
+        _agent("ocr")
+
+
+def test_async_agent_does_not_build_sync_client(monkeypatch):
+    created = []
+    monkeypatch.setattr(agent_module, "get_client", lambda: created.append(1) or "sync")
+    async_agent = AsyncAkuiteoAgent(rag_engine=None, vision_engine=None, client="async")
+    assert async_agent.async_client == "async"
+    assert created == []
+    assert async_agent.client == "sync"  # créé seulement si run_stream s'en sert
+    assert created == [1]
+
+
+def test_inline_mode_has_no_vision_tool_to_run():
+    agent = _agent("inline")
+    block = SimpleNamespace(name="vision_analysis", input={})
+    assert agent._run_single_tool(block, image_input=b"png", user_message="?") == ["Tool inconnu : vision_analysis"]
+
+
+class ToolStream:
+    def __init__(self, response):
+        self.response = response
+        self.text_stream = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_final_message(self):
+        return self.response
+
+
+def _tool_use(tool_id, name, **tool_input):
+    return SimpleNamespace(type="tool_use", id=tool_id, name=name, input=tool_input)
+
+
+class ScriptedMessages:
+    """Première itération : tool_blocks (rag_search puis vision_analysis par défaut) ; ensuite réponse finale."""
+
+    def __init__(self, tool_blocks=None):
+        self.tool_blocks = tool_blocks or [
+            _tool_use("rag_1", "rag_search", query="CRM"),
+            _tool_use("vis_1", "vision_analysis"),
+        ]
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5)
+        if self.calls == 1:
+            return SimpleNamespace(stop_reason="tool_use", content=self.tool_blocks, usage=usage)
+        content = [SimpleNamespace(type="text", text="Réponse")]
+        return SimpleNamespace(stop_reason="end_turn", content=content, usage=usage)
+
+    def stream(self, **kwargs):
+        return ToolStream(self.create(**kwargs))
+
+
+def test_stream_tool_end_in_completion_order(monkeypatch):
+    agent = AkuiteoAgent(
+        rag_engine=None, vision_engine=None, client=SimpleNamespace(messages=ScriptedMessages())
+    )
+    slow_rag_started = threading.Event()
+
+    def run_tool_group(blocks, image_input, user_message):
+        if blocks[0].name == "rag_search":
+            slow_rag_started.set()
+            time.sleep(0.2)
+        else:
+            assert slow_rag_started.wait(2)
+        return [f"sortie {block.id}" for block in blocks]
+
+    monkeypatch.setattr(agent, "_run_tool_group", run_tool_group)
+    events = list(agent.run_stream("Que faire ?", image_input=None))
+
+    assert [event["tool_use_id"] for event in events if event["type"] == "tool_end"] == ["vis_1", "rag_1"]
+    tool_results = agent.conversation_history[2]["content"]
+    assert [result["tool_use_id"] for result in tool_results] == ["rag_1", "vis_1"]
+    assert [result["content"] for result in tool_results] == ["sortie rag_1", "sortie vis_1"]
+    assert events[-1]["type"] == "done"
+    assert [timing["tool_use_id"] for timing in events[-1]["tool_timings"]] == ["rag_1", "vis_1"]
+
+
+class SlowRAG:
+    def __init__(self):
+        self.calls = []
+
+    def query_many(self, queries):
+        self.calls.append(list(queries))
+        time.sleep(0.3)
+        return [{"passages": [f"Passage {query}"], "sources": [f"Doc {query}"], "count": 1} for query in queries]
+
+
+class SlowVision:
+    def __init__(self):
+        self.questions = []
+
+    def _prepare_image(self, image_input):
+        return "aW1n", "image/png"
+
+    def analyze_screenshot(self, image_input, user_question, context=""):
+        self.questions.append(user_question)
+        time.sleep(0.3)
+        return {"analysis": f"Écran pour {user_question}", "metadata": {}}
+
+
+def test_run_executes_tool_calls_concurrently_in_order():
+    rag, vision = SlowRAG(), SlowVision()
+    messages = ScriptedMessages([
+        _tool_use("rag_1", "rag_search", query="opportunité"),
+        _tool_use("vis_1", "vision_analysis", question="Quel écran ?"),
+        _tool_use("rag_2", "rag_search", query="kanban"),
+    ])
+    agent = AkuiteoAgent(rag, vision, vision_mode="tool", client=SimpleNamespace(messages=messages))
+
+    start = time.perf_counter()
+    result = agent.run("Que faire ?", image_input=b"png")
+    elapsed = time.perf_counter() - start
+
+    assert rag.calls == [["opportunité", "kanban"]]  # rag_search regroupés en un query_many
+    assert vision.questions == ["Quel écran ?"]
+    assert elapsed < 0.55  # RAG et vision en parallèle, pas 0,6 s en série
+    tool_results = agent.conversation_history[2]["content"]
+    assert [block["tool_use_id"] for block in tool_results] == ["rag_1", "vis_1", "rag_2"]
+    assert "Passage opportunité" in tool_results[0]["content"]
+    assert "Écran pour Quel écran ?" in tool_results[1]["content"]
+    assert "Passage kanban" in tool_results[2]["content"]
+    assert [timing["tool_use_id"] for timing in result["tool_timings"]] == ["rag_1", "vis_1", "rag_2"]
+    assert result["sources"] == ["Doc opportunité", "Doc kanban"]
+
+
+def test_single_tool_group_runs_inline(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(agent_module._TOOL_POOL, "submit", lambda *args: submitted.append(args))
+    rag = SlowRAG()
+    messages = ScriptedMessages([
+        _tool_use("rag_1", "rag_search", query="a"),
+        _tool_use("rag_2", "rag_search", query="b"),
+    ])
+    agent = AkuiteoAgent(rag, vision_engine=None, client=SimpleNamespace(messages=messages))
+    agent.run("Que faire ?")
+    assert submitted == [] and rag.calls == [["a", "b"]]
+
+
+def _breakpoints(value) -> int:
+    """Nombre de cache_control dans une requête (l'API en accepte au plus 4)."""
+    return json.dumps(value, default=lambda obj: vars(obj)).count('"cache_control"')
+
+
+def test_cache_breakpoints_on_system_and_last_block():
+    agent = _agent("tool")
+    agent.conversation_history = [
+        {"role": "user", "content": "Comment créer une opportunité ?"},
+        {"role": "assistant", "content": [_tool_use("rag_1", "rag_search", query="opportunité")]},
+        {"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": "rag_1", "content": "Passage A"},
+        ]},
+    ]
+    history = copy.deepcopy(agent.conversation_history)
+    kwargs = agent._request_kwargs()
+
+    assert kwargs["system"] == [
+        {"type": "text", "text": agent.system_prompt, "cache_control": {"type": "ephemeral"}}
+    ]
+    assert kwargs["tools"] == agent.tools  # préfixe tools couvert par le point de cache du system
+    assert kwargs["messages"][-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert kwargs["messages"][:2] == agent.conversation_history[:2]
+    assert _breakpoints(kwargs) == 2
+    # L'historique n'est pas modifié : le point de cache reste unique et glissant
+    assert _breakpoints(agent.conversation_history) == 0
+    assert agent.conversation_history[2] == history[2]
+
+
+def test_cache_breakpoint_on_plain_text_message():
+    agent = _agent("tool")
+    agent.conversation_history = [{"role": "user", "content": "Bonjour"}]
+    block = {"type": "text", "text": "Bonjour", "cache_control": {"type": "ephemeral"}}
+    assert agent._request_kwargs()["messages"] == [{"role": "user", "content": [block]}]
+    assert agent.conversation_history == [{"role": "user", "content": "Bonjour"}]
+
+
+def test_no_breakpoints_without_prompt_caching(monkeypatch):
+    monkeypatch.setattr(agent_module, "PROMPT_CACHING", False)
+    agent = _agent("tool")
+    agent.conversation_history = [{"role": "user", "content": "Bonjour"}]
+    kwargs = agent._request_kwargs()
+    assert kwargs["system"] == agent.system_prompt
+    assert _breakpoints(kwargs) == 0
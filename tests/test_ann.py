@@ -0,0 +1,83 @@
+"""
+tests/test_ann.py — Index IVF : partition des vecteurs, rappel après rescoring exact, persistance
+"""
+import numpy as np
+import pytest
+
+from core import ann
+from core.ann import IVFIndex, create_ann_index, load_or_build_ann
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 128))
+    vectors = centers[rng.integers(0, 40, 6_000)] + 0.6 * rng.normal(size=(6_000, 128))
+    queries = vectors[rng.integers(0, len(vectors), 30)] + 0.3 * rng.normal(size=(30, 128))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def _recall(index: IVFIndex, vectors: np.ndarray, queries: np.ndarray, k: int = 10) -> float:
+    """Rappel@k des candidats IVF rescorés exactement, comme AkuiteoVectorStore._search_candidates."""
+    found = []
+    for query in queries:
+        truth = set(np.argsort(-(vectors @ query))[:k])
+        rows = np.unique(index.candidates(query, k))
+        top = rows[np.argsort(-(vectors[rows] @ query))[:k]]
+        found.append(len(truth & set(top)) / k)
+    return float(np.mean(found))
+
+
+def test_every_row_in_exactly_one_list(corpus):
+    vectors, _ = corpus
+    index = IVFIndex()
+    index.build(vectors)
+    assert len(index.centroids) == int(4 * np.sqrt(len(vectors)))
+    assert index.offsets[-1] == len(vectors)
+    assert np.array_equal(np.sort(index.order), np.arange(len(vectors)))
+
+
+def test_recall_after_rescoring(corpus):
+    vectors, queries = corpus
+    index = IVFIndex(nprobe=16)
+    index.build(vectors)
+    assert _recall(index, vectors, queries) >= 0.9
+    # Toutes les listes parcourues : recherche exacte
+    index.nprobe = len(index.centroids)
+    assert _recall(index, vectors, queries) == 1.0
+
+
+def test_save_load_roundtrip(corpus, tmp_path):
+    vectors, queries = corpus
+    index = IVFIndex()
+    index.build(vectors)
+    index.save(tmp_path)
+    loaded = IVFIndex()
+    loaded.load(tmp_path, dim=vectors.shape[1], count=len(vectors))
+    assert np.array_equal(loaded.candidates(queries[0], 10), index.candidates(queries[0], 10))
+
+
+def test_exact_below_min_vectors(monkeypatch):
+    assert create_ann_index("ivf", count=10) is None
+    monkeypatch.setattr(ann, "ANN_MIN_VECTORS", 0)
+    assert create_ann_index("exact", count=10) is None
+    assert isinstance(create_ann_index("ivf", count=10), IVFIndex)
+
+
+def test_load_or_build_reuses_then_rebuilds(corpus, tmp_path, monkeypatch):
+    vectors, _ = corpus
+    monkeypatch.setattr(ann, "ANN_MIN_VECTORS", 0)
+    ids = [f"n{i}" for i in range(len(vectors))]
+    built = load_or_build_ann(tmp_path, vectors, ids, backend="ivf")
+    assert (tmp_path / ann.ANN_META_FILE).exists()
+
+    builds = []
+    monkeypatch.setattr(IVFIndex, "build", lambda self, embeddings: builds.append(len(embeddings)))
+    loaded = load_or_build_ann(tmp_path, vectors, ids, backend="ivf")
+    assert builds == []
+    assert np.array_equal(loaded.order, built.order)
+
+    load_or_build_ann(tmp_path, vectors[:-1], ids[:-1], backend="ivf")
+    assert builds == [len(vectors) - 1]
@@ -0,0 +1,101 @@
+"""
+tests/test_answer_cache.py — Cache sémantique des réponses : seuil, TTL, version d'index, identifiants
+"""
+import numpy as np
+import pytest
+
+from core import answer_cache
+from core.agent import AkuiteoAgent
+from core.answer_cache import SemanticAnswerCache
+
+DIM = 8
+
+
+def _vector(angle: float) -> np.ndarray:
+    """Vecteur unitaire dont la similarité cosinus avec _vector(0) vaut cos(angle)."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[0], vector[1] = np.cos(angle), np.sin(angle)
+    return vector
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticAnswerCache(path=tmp_path / "answers.sqlite", model_name="test", threshold=0.92, ttl_s=60)
+
+
+def _put(cache, version="v1", question="Comment créer une opportunité ?"):
+    cache.put(question, _vector(0), version, "Menu CRM > Opportunités", ["Mode Opératoire CRM"], ["rag_search"])
+
+
+def test_paraphrase_above_threshold_hits(cache):
+    _put(cache)
+    cached = cache.lookup(_vector(np.arccos(0.95)), "v1")
+    assert cached["response"] == "Menu CRM > Opportunités"
+    assert cached["sources"] == ["Mode Opératoire CRM"]
+    assert cached["similarity"] == pytest.approx(0.95, abs=1e-3)
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 0, "hit_rate": 1.0}
+
+
+def test_near_miss_below_threshold(cache):
+    _put(cache)
+    assert cache.lookup(_vector(np.arccos(0.90)), "v1") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: clock[0])
+    _put(cache)
+    clock[0] += 59
+    assert cache.lookup(_vector(0), "v1") is not None
+    clock[0] += 2
+    assert cache.lookup(_vector(0), "v1") is None
+
+
+def test_new_index_version_invalidates(cache):
+    _put(cache, version="v1")
+    assert cache.lookup(_vector(0), "v2") is None
+    _put(cache, version="v2", question="Autre question")
+    assert cache.stats()["entries"] == 1  # les réponses de v1 sont purgées
+    assert cache.lookup(_vector(0), "v1") is None
+
+
+def test_reloaded_from_disk(cache, tmp_path):
+    _put(cache)
+    reopened = SemanticAnswerCache(path=tmp_path / "answers.sqlite", model_name="test", threshold=0.92, ttl_s=60)
+    assert reopened.lookup(_vector(0), "v1") is not None
+    other_model = SemanticAnswerCache(path=tmp_path / "answers.sqlite", model_name="autre", ttl_s=60)
+    assert other_model.lookup(_vector(0), "v1") is None
+
+
+@pytest.mark.parametrize("question, accepted", [
+    ("Comment créer une opportunité ?", True),
+    ("Que signifie le code AKU-2041 ?", False),
+    ("Facture 12 bloquée", False),
+    ("Où trouver la TVA ?", True),
+])
+def test_questions_with_identifiers_skip_cache(question, accepted):
+    assert SemanticAnswerCache.accepts(question) is accepted
+
+
+class EmbeddingRAG:
+    index_version = "v1"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_query(self, text):
+        self.embedded.append(text)
+        return _vector(0)
+
+
+def test_agent_does_not_look_up_identifier_questions(cache):
+    _put(cache, question="Que signifie le code AKU-2041 ?")
+    rag = EmbeddingRAG()
+    agent = AkuiteoAgent(rag_engine=rag, vision_engine=None, client=object(), answer_cache=cache)
+
+    turn = {}
+    assert agent._lookup_answer("Que signifie le code AKU-2042 ?", None, turn) is None
+    assert rag.embedded == [] and turn == {}
+
+    assert agent._lookup_answer("Comment créer une opportunité ?", None, turn)["response"] == "Menu CRM > Opportunités"
@@ -0,0 +1,238 @@
+"""
+tests/test_api_server.py — Codes HTTP de l'API : 400/429/409/503/504 et stream SSE ; pool de workers et
+boucle des tours /chat
+"""
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from api.server import AgentService, APIError, AsyncTurnRunner, WorkerPool, create_server
+
+
+class FakeWarmup:
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.ready = engine is not None
+        self.error = None
+        self.timings = {}
+
+
+class StubRAG:
+    index_version = "test"
+
+    def query(self, question, top_k):
+        return {"passages": [question] * top_k, "sources": ["Mode Opératoire CRM"] * top_k, "count": top_k}
+
+
+class BlockingAgent:
+    """arun() / run_stream() attendent release : occupent un tour, un worker ou une session de façon déterministe."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    async def arun(self, message, image=None):
+        self.started.set()
+        await asyncio.to_thread(self.release.wait, 5)
+        return {"response": f"Réponse : {message}", "tools_used": []}
+
+    def run_stream(self, message, image=None):
+        self.started.set()
+        self.release.wait(5)
+        yield {"type": "text", "text": "Réponse"}
+        yield {"type": "done", "response": "Réponse"}
+
+
+@pytest.fixture
+def api():
+    """Démarre un serveur sur un port libre ; renvoie (port, service, agent partagé)."""
+    agent = BlockingAgent()
+    service = AgentService(
+        workers=1, queue_size=0, timeout_s=2, warmup=FakeWarmup(StubRAG()), max_async_chats=1
+    )
+
+    def new_agent():
+        service.rag  # 503 tant que l'index n'est pas prêt, comme AgentService._new_agent
+        return agent
+
+    service.sessions._factory = new_agent
+    server, _ = create_server("127.0.0.1", 0, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1], service, agent
+    agent.release.set()
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read().decode("utf-8")
+    connection.close()
+    return response, data
+
+
+def in_background(fn, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(fn(*args)))
+    thread.start()
+    return thread, results
+
+
+def test_503_while_index_is_loading(api):
+    port, service, _ = api
+    service.warmup = FakeWarmup()
+    response, _ = request(port, "POST", "/chat", {"message": "Comment créer une opportunité ?"})
+    assert response.status == 503
+    assert response.getheader("Retry-After")
+    assert request(port, "GET", "/health")[0].status == 503
+
+
+def test_chat_and_rag_search(api):
+    port, _, agent = api
+    agent.release.set()
+    response, data = request(port, "POST", "/chat", {"message": "Bonjour"})
+    assert response.status == 200
+    body = json.loads(data)
+    assert body["response"] == "Réponse : Bonjour"
+    assert body["session_id"]
+
+    response, data = request(port, "POST", "/rag/search", {"query": "KANBAN", "top_k": 2})
+    assert response.status == 200
+    assert json.loads(data)["count"] == 2
+
+
+def test_400_on_invalid_payload(api):
+    port, _, _ = api
+    assert request(port, "POST", "/chat", {})[0].status == 400
+    assert request(port, "POST", "/rag/search", {"query": "x", "top_k": 0})[0].status == 400
+    assert request(port, "POST", "/vision", {"image_base64": "pas du base64 !"})[0].status == 400
+    assert request(port, "POST", "/inconnue", {})[0].status == 404
+
+
+@pytest.mark.parametrize("length", ["abc", "-1"])
+def test_400_on_invalid_content_length(api, length):
+    port, _, _ = api
+    with socket.create_connection(("127.0.0.1", port), timeout=3) as sock:
+        sock.sendall(
+            f"POST /chat HTTP/1.1\r\nHost: test\r\nContent-Length: {length}\r\n\r\n".encode("ascii")
+        )
+        status_line = sock.recv(1024).split(b"\r\n", 1)[0]
+    assert b" 400 " in status_line
+
+
+def test_429_when_workers_and_queue_are_full(api):
+    port, _, agent = api
+    first, results = in_background(request, port, "POST", "/chat/stream", {"message": "long", "session_id": "a"})
+    assert agent.started.wait(2)
+
+    response, _ = request(port, "POST", "/rag/search", {"query": "KANBAN"})
+    assert response.status == 429
+    assert response.getheader("Retry-After")
+
+    agent.release.set()
+    first.join()
+    assert results[0][0].status == 200
+
+
+def test_chat_turns_run_on_event_loop_without_worker(api):
+    port, service, agent = api
+    first, results = in_background(request, port, "POST", "/chat", {"message": "long", "session_id": "a"})
+    assert agent.started.wait(2)
+
+    # Le tour en attente n'occupe pas le worker unique...
+    assert request(port, "POST", "/rag/search", {"query": "KANBAN"})[0].status == 200
+    # ...mais la limite de tours simultanés s'applique
+    response, _ = request(port, "POST", "/chat", {"message": "encore", "session_id": "b"})
+    assert response.status == 429
+    assert service.turns.stats()["rejected"] == 1
+
+    agent.release.set()
+    first.join()
+    assert results[0][0].status == 200
+    assert json.loads(request(port, "GET", "/health")[1])["chats"]["completed"] == 1
+
+
+def test_409_when_session_is_busy(api):
+    port, _, agent = api
+    first, _ = in_background(request, port, "POST", "/chat", {"message": "long", "session_id": "s1"})
+    assert agent.started.wait(2)
+
+    assert request(port, "POST", "/chat", {"message": "encore", "session_id": "s1"})[0].status == 409
+    agent.release.set()
+    first.join()
+
+
+def test_504_after_request_timeout(api):
+    port, service, _ = api
+    service.timeout_s = 0.2
+    response, _ = request(port, "POST", "/chat", {"message": "lent"})
+    assert response.status == 504
+
+
+def test_chat_stream_sends_server_sent_events(api):
+    port, _, agent = api
+    agent.release.set()
+    response, data = request(port, "POST", "/chat/stream", {"message": "Bonjour"})
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("text/event-stream")
+    events = [line[len("event: "):] for line in data.splitlines() if line.startswith("event: ")]
+    assert events == ["session", "text", "done"]
+
+
+# ─── Pool de workers et boucle des tours ──────────────────────────────────────
+
+def test_worker_pool_capacity_is_workers_plus_queue():
+    pool = WorkerPool(max_workers=1, queue_size=1)
+    release = threading.Event()
+    running, queued = pool.submit(release.wait, 5), pool.submit(release.wait, 5)
+    with pytest.raises(APIError) as error:
+        pool.submit(release.wait, 5)
+    assert error.value.status == 429 and error.value.headers == {"Retry-After": "5"}
+    assert pool.stats() == {"workers": 1, "capacity": 2, "running": 1, "queued": 1, "completed": 0, "rejected": 1}
+
+    release.set()
+    running.result(2), queued.result(2)
+    assert pool.submit(lambda: "ok").result(2) == "ok"
+    pool.shutdown()
+
+
+def test_expired_queued_request_cancelled_and_slot_freed():
+    pool = WorkerPool(max_workers=1, queue_size=1)
+    release = threading.Event()
+    running, queued = pool.submit(release.wait, 5), pool.submit(release.wait, 5)
+    assert queued.cancel()  # ce que fait AgentService._wait sur un 504
+    assert pool.submit(lambda: "ok") is not None  # place rendue par l'annulation
+    assert not running.cancel()  # déjà démarrée : garde sa place jusqu'à sa fin réelle
+    release.set()
+    pool.shutdown()
+
+
+def test_turn_runner_keeps_expired_turn_running():
+    runner = AsyncTurnRunner(max_inflight=1)
+    release, finished = threading.Event(), threading.Event()
+
+    async def turn():
+        await asyncio.to_thread(release.wait, 5)
+        finished.set()
+        return "réponse"
+
+    future = runner.submit(turn)
+    future.cancel()  # 504 : le client n'attend plus
+    with pytest.raises(APIError):
+        runner.submit(turn)  # le tour occupe toujours sa place
+    release.set()
+    assert finished.wait(2)
+    deadline = time.monotonic() + 2
+    while runner.stats()["inflight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert runner.stats() == {"max_inflight": 1, "inflight": 0, "completed": 1, "rejected": 1}
+    runner.shutdown()
@@ -0,0 +1,45 @@
+"""
+tests/test_bm25.py — Tokenisation française et classement BM25 (recherche lexicale)
+"""
+from core.bm25 import BM25Index, tokenize
+
+RECORDS = [
+    {"id": "crm", "text": "Créer une opportunité dans le module CRM : menu CRM > Opportunités."},
+    {"id": "temps", "text": "Saisir ses temps : Gestion des temps > Feuille de temps hebdomadaire."},
+    {"id": "factures", "text": "Les factures clients sont éditées depuis le module Facturation."},
+    {"id": "notes", "text": "Notes de frais : saisir une dépense, joindre le justificatif."},
+]
+
+
+def test_tokenize_accents_elisions_plurals_stopwords():
+    assert tokenize("L'opportunité des Factures") == ["opportunite", "facture"]
+    assert tokenize("le la les de du") == []
+    assert tokenize("Code TVA 20") == ["code", "tva", "20"]
+
+
+def test_search_ranks_exact_vocabulary_first():
+    index = BM25Index.from_records(RECORDS)
+    hits = index.search("Comment créer des opportunités ?", 3)
+    assert hits[0][0] == "crm"
+    assert [doc_id for doc_id, _ in index.search("feuille de temps", 2)][0] == "temps"
+
+
+def test_search_without_matching_term_is_empty():
+    index = BM25Index.from_records(RECORDS)
+    assert index.search("immobilisations", 5) == []
+    assert index.search("factures", 0) == []
+
+
+def test_rare_terms_weigh_more():
+    index = BM25Index.from_records(RECORDS)
+    scores = dict(index.search("saisir justificatif", 4))
+    assert scores["notes"] > scores["temps"]
+
+
+def test_save_load_roundtrip(tmp_path):
+    index = BM25Index.from_records(RECORDS)
+    path = tmp_path / "bm25.json"
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.ids == index.ids
+    assert loaded.search("module CRM", 2) == index.search("module CRM", 2)
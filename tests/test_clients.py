@@ -0,0 +1,86 @@
+"""
+tests/test_clients.py — Client asynchrone par boucle d'événements et fermeture de ses connexions
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core import clients
+from core.clients import async_client_scope, get_async_client
+
+
+class MessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive : la connexion reste dans le pool après la réponse
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "id": "msg_test", "type": "message", "role": "assistant", "model": "test",
+            "content": [{"type": "text", "text": "ok"}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 1, "output_tokens": 1},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MessagesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(clients, "ANTHROPIC_API_KEY", "test")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _pool_connections(client) -> list:
+    return clients._connections(client._client._transport)
+
+
+def test_one_client_per_loop():
+    async def twice():
+        return get_async_client(), get_async_client()
+
+    first, same = asyncio.run(twice())
+    assert first is same
+    other, _ = asyncio.run(twice())
+    assert other is not first
+
+
+def test_scope_closes_client_and_connections(api_server):
+    async def call():
+        async with async_client_scope():
+            client = get_async_client()
+            await client.messages.create(
+                model="test", max_tokens=8, messages=[{"role": "user", "content": "bonjour"}]
+            )
+            assert len(_pool_connections(client)) == 1
+        return client, asyncio.get_running_loop()
+
+    client, loop = asyncio.run(call())
+    assert client.is_closed()
+    assert _pool_connections(client) == []
+    assert loop not in clients._async_clients
+
+
+def test_nested_scopes_close_on_last_exit():
+    async def nested():
+        async with async_client_scope():
+            async with async_client_scope():
+                client = get_async_client()
+            assert not client.is_closed()
+            assert get_async_client() is client
+        return client
+
+    assert asyncio.run(nested()).is_closed()
@@ -0,0 +1,46 @@
+"""
+tests/test_embed_cache.py — Cache disque des embeddings : clé par contenu, éviction LRU, compteurs
+"""
+import pytest
+
+from core import embed_cache
+from core.embed_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(path=tmp_path / "embeddings.sqlite", model_name="test", max_entries=2)
+
+
+def test_hits_ignore_whitespace_and_count(cache):
+    cache.put_many(["Créer une  opportunité"], [[1.0, 0.0]])
+    assert cache.get_many(["  Créer une opportunité\n", "Saisir ses temps"]) == [[1.0, 0.0], None]
+    assert cache.stats() == {
+        "entries": 1, "max_entries": 2, "hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5,
+    }
+
+
+def test_key_depends_on_model(cache, tmp_path):
+    cache.put_many(["texte"], [[1.0]])
+    other = EmbeddingCache(path=tmp_path / "embeddings.sqlite", model_name="autre")
+    assert other.get_many(["texte"]) == [None]
+    assert EmbeddingCache(path=tmp_path / "embeddings.sqlite", model_name="test").get_many(["texte"]) == [[1.0]]
+
+
+def test_least_recently_used_evicted(cache, monkeypatch):
+    clock = [1_000.0]
+    monkeypatch.setattr(embed_cache.time, "time", lambda: clock[0])
+    cache.put_many(["a", "b"], [[1.0], [2.0]])
+    clock[0] += 1
+    cache.get_many(["a"])
+    clock[0] += 1
+    cache.put_many(["c"], [[3.0]])
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_clear_and_close(cache):
+    cache.put_many(["a"], [[1.0]])
+    cache.clear()
+    assert cache.count() == 0
+    cache.close()
@@ -0,0 +1,135 @@
+"""
+tests/test_history.py — Compaction de l'historique : budget, étapes successives, paires tool_use / tool_result valides
+"""
+import copy
+from types import SimpleNamespace
+
+from core.history import ConversationHistoryManager, estimate_tokens
+
+IMAGE = {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": "iVBOR"}}
+
+
+def _turn(i: int, image: bool = False, result_chars: int = 2_000) -> list:
+    """Un tour complet : question, tool_use (objets SDK), tool_result, réponse finale."""
+    question = [{"type": "text", "text": f"Question {i} : comment créer une opportunité ?"}]
+    tools = [SimpleNamespace(type="tool_use", id=f"rag_{i}", name="rag_search", input={"query": f"q{i}"})]
+    results = [{"type": "tool_result", "tool_use_id": f"rag_{i}", "content": "Procédure CRM. " * (result_chars // 15)}]
+    if image:
+        question.insert(0, IMAGE)
+        tools.append(SimpleNamespace(type="tool_use", id=f"vis_{i}", name="vision_analysis", input={}))
+        results.append({"type": "tool_result", "tool_use_id": f"vis_{i}", "content": f"Écran CRM > Opportunités ({i})"})
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": [SimpleNamespace(type="text", text="Je cherche."), *tools]},
+        {"role": "user", "content": results},
+        {"role": "assistant", "content": [SimpleNamespace(type="text", text=f"Réponse {i}")]},
+    ]
+
+
+def _conversation(turns: int, **kwargs) -> list:
+    return [message for i in range(turns) for message in _turn(i, **kwargs)]
+
+
+def _blocks(message: dict) -> list:
+    content = message["content"]
+    return [] if isinstance(content, str) else content
+
+
+def _type(block) -> str:
+    return block["type"] if isinstance(block, dict) else block.type
+
+
+def assert_valid_for_api(messages: list):
+    """Alternance user / assistant et chaque tool_use suivi de son tool_result (et réciproquement)."""
+    assert messages[0]["role"] == "user"
+    for previous, message in zip(messages, messages[1:]):
+        assert previous["role"] != message["role"]
+    for i, message in enumerate(messages):
+        if message["role"] != "assistant":
+            continue
+        use_ids = {block.id for block in _blocks(message) if _type(block) == "tool_use"}
+        following = messages[i + 1] if i + 1 < len(messages) else {"content": []}
+        result_ids = {block["tool_use_id"] for block in _blocks(following) if _type(block) == "tool_result"}
+        assert use_ids == result_ids
+    for i, message in enumerate(messages):
+        if message["role"] == "user" and any(_type(block) == "tool_result" for block in _blocks(message)):
+            assert i > 0 and any(_type(block) == "tool_use" for block in _blocks(messages[i - 1]))
+
+
+def test_under_budget_untouched():
+    messages = _conversation(3)
+    manager = ConversationHistoryManager(token_budget=100_000)
+    assert manager.compact(messages) is messages
+    assert manager.last_stats["steps"] == []
+
+
+def test_images_replaced_by_vision_analysis_first():
+    messages = _conversation(4, image=True, result_chars=100)
+    manager = ConversationHistoryManager(token_budget=estimate_tokens(messages) - 1_000, keep_recent_turns=2)
+    compacted = manager.compact(messages)
+    assert manager.last_stats["steps"] == ["images"]
+    assert_valid_for_api(compacted)
+    old, recent = compacted[:8], compacted[8:]
+    assert not any(_type(block) == "image" for message in old for block in _blocks(message))
+    assert "Écran CRM > Opportunités (0)" in old[0]["content"][0]["text"]
+    assert recent == messages[8:]
+
+
+def test_tool_results_truncated_before_summaries():
+    messages = _conversation(4, result_chars=20_000)
+    manager = ConversationHistoryManager(
+        token_budget=estimate_tokens(messages) // 2 + 500, keep_recent_turns=2, tool_result_chars=300
+    )
+    compacted = manager.compact(messages)
+    assert manager.last_stats["steps"] == ["images", "tool_results"]
+    assert_valid_for_api(compacted)
+    assert compacted[2]["content"][0]["content"].endswith("[tronqué]")
+    assert compacted[2]["content"][0]["tool_use_id"] == "rag_0"
+
+
+def test_summaries_drop_tool_pairs_together():
+    messages = _conversation(5, image=True)
+    budget = estimate_tokens(messages[12:]) + 300  # tours récents + résumés des anciens
+    manager = ConversationHistoryManager(token_budget=budget, keep_recent_turns=2, tool_result_chars=300)
+    compacted = manager.compact(messages)
+    assert manager.last_stats["steps"] == ["images", "tool_results", "summaries"]
+    assert_valid_for_api(compacted)
+    question, answer = compacted[:2]
+    # Le résumé garde le texte substitué à la capture (analyse vision) et la question
+    assert question["content"].startswith("[Capture d'écran retirée de l'historique — analyse : Écran CRM")
+    assert question["content"].endswith("Question 0 : comment créer une opportunité ?")
+    assert answer == {"role": "assistant", "content": "Réponse 0"}
+    assert compacted[6:] == messages[12:]
+
+
+def test_oldest_turns_dropped_last_and_recent_kept():
+    messages = _conversation(6, result_chars=20_000)
+    manager = ConversationHistoryManager(token_budget=50, keep_recent_turns=2)
+    compacted = manager.compact(messages)
+    assert manager.last_stats["steps"][-1] == "dropped"
+    assert manager.last_stats["dropped_turns"] == 4
+    assert_valid_for_api(compacted)
+    # Les tours récents sont conservés intacts même au-delà du budget
+    assert compacted == messages[16:]
+
+
+def test_multi_iteration_turn_stays_together():
+    turn = _turn(0)
+    second_round = copy.deepcopy(turn[1:3])
+    second_round[0]["content"][1].id = "rag_0b"
+    second_round[1]["content"][0]["tool_use_id"] = "rag_0b"
+    messages = turn[:3] + second_round + turn[3:] + _turn(1)
+    assert len(ConversationHistoryManager._split_turns(messages)) == 2
+    compacted = ConversationHistoryManager(token_budget=400, keep_recent_turns=1).compact(messages)
+    assert_valid_for_api(compacted)
+
+
+def test_original_messages_not_modified():
+    messages = _conversation(4, image=True, result_chars=5_000)
+    snapshot = copy.deepcopy(messages)
+    ConversationHistoryManager(token_budget=500, keep_recent_turns=1).compact(messages)
+    assert [m["content"] if isinstance(m["content"], str) else len(m["content"]) for m in messages] == [
+        m["content"] if isinstance(m["content"], str) else len(m["content"]) for m in snapshot
+    ]
+    assert messages[2]["content"][0]["content"] == snapshot[2]["content"][0]["content"]
+    assert messages[0]["content"][0] == IMAGE
@@ -0,0 +1,118 @@
+"""
+tests/test_image_optimizer.py — Optimisation des captures : format selon le contenu, recadrage, budget de tokens
+et limite d'octets de l'API
+"""
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from config import IMAGE_MAX_TOKENS
+from core.image_optimizer import PIXELS_PER_TOKEN, ImageOptimizer, estimate_image_tokens
+
+
+def _encode(img: Image.Image, fmt: str = "PNG", **params) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def _screen(size=(1200, 800)) -> Image.Image:
+    """Capture d'interface (menu, bandeau, barre d'état jusqu'aux bords) : aplats et quelques couleurs."""
+    width, height = size
+    img = Image.new("RGB", size, (245, 245, 245))
+    img.paste((225, 230, 240), (0, 0, 220, height))
+    img.paste((30, 60, 120), (220, 0, width, 60))
+    img.paste((90, 90, 90), (0, height - 30, width, height))
+    img.paste((200, 40, 40), (300, 150, 700, 400))
+    return img
+
+
+def _noise(size) -> Image.Image:
+    """Bruit aléatoire : incompressible, le pire cas pour la limite d'octets."""
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+def test_output_within_token_budget():
+    screen = Image.new("RGB", (3840, 2160), (240, 240, 240))
+    screen.paste((30, 60, 120), (0, 0, 3840, 80))
+    data, _, stats = ImageOptimizer().optimize(_encode(screen), "image/png")
+    optimized = Image.open(BytesIO(data))
+    assert optimized.width * optimized.height <= IMAGE_MAX_TOKENS * PIXELS_PER_TOKEN
+    assert estimate_image_tokens(*optimized.size) == stats["optimized_tokens"] <= IMAGE_MAX_TOKENS
+    assert list(optimized.size) == stats["optimized_size"]
+
+
+def test_fit_bytes_loops_until_under_limit():
+    optimizer = ImageOptimizer(max_bytes=20_000, crop_borders=False)
+    data, _, stats = optimizer.optimize(_encode(_noise((1200, 800))), "image/png", keep_format=True)
+    assert len(data) <= optimizer.max_bytes
+    assert stats["optimized_bytes"] == len(data)
+    assert Image.open(BytesIO(data)).format == "PNG"
+
+
+def test_dhash_computed_on_prepared_image():
+    screen = Image.new("RGB", (3000, 2000), (240, 240, 240))
+    screen.paste((200, 30, 30), (300, 300, 1500, 1200))
+    data, _, stats = ImageOptimizer().optimize(_encode(screen), "image/png")
+    resent = ImageOptimizer().optimize(data, "image/png")[2]
+    assert resent["optimized_bytes"] == resent["original_bytes"]  # déjà conforme : renvoyée telle quelle
+    assert resent["dhash"] == stats["dhash"]
+
+
+def test_screenshot_kept_as_png_and_photo_sent_as_jpeg():
+    _, media_type, stats = ImageOptimizer().optimize(_encode(_screen((3000, 2000))), "image/png")
+    assert (media_type, stats["content"]) == ("image/png", "screenshot")
+
+    _, media_type, stats = ImageOptimizer().optimize(_encode(_noise((2400, 1600))), "image/png")
+    assert (media_type, stats["content"]) == ("image/jpeg", "photo")
+
+
+def test_keep_format_preserves_media_type():
+    photo = _encode(_noise((2400, 1600)), "JPEG")
+    data, media_type, _ = ImageOptimizer().optimize(photo, "image/jpeg", keep_format=True)
+    assert media_type == "image/jpeg" and Image.open(BytesIO(data)).format == "JPEG"
+    data, media_type, _ = ImageOptimizer().optimize(_encode(_noise((2400, 1600))), "image/png", keep_format=True)
+    assert media_type == "image/png" and Image.open(BytesIO(data)).format == "PNG"
+
+
+def test_oversized_png_falls_back_to_jpeg(monkeypatch):
+    optimizer = ImageOptimizer(max_bytes=400_000, crop_borders=False)
+    monkeypatch.setattr(ImageOptimizer, "_classify", staticmethod(lambda img: "screenshot"))
+    data, media_type, _ = optimizer.optimize(_encode(_noise((1000, 800))), "image/png")
+    assert media_type == "image/jpeg" and Image.open(BytesIO(data)).format == "JPEG"
+    assert len(data) <= optimizer.max_bytes
+
+
+def test_compliant_image_returned_without_reencoding():
+    raw = _encode(_screen())
+    data, media_type, stats = ImageOptimizer().optimize(raw, "image/png")
+    assert data is raw and media_type == "image/png"
+    assert stats["bytes_saved"] == 0 and stats["cropped"] is False
+
+
+def test_uniform_borders_cropped():
+    content = _screen((800, 500))
+    framed = Image.new("RGB", (1400, 900), (0, 0, 0))
+    framed.paste(content, (300, 200))
+    data, _, stats = ImageOptimizer().optimize(_encode(framed), "image/png")
+    assert stats["cropped"] is True
+    width, height = Image.open(BytesIO(data)).size
+    assert 800 <= width <= 802 and 500 <= height <= 502
+
+    _, _, stats = ImageOptimizer(crop_borders=False).optimize(_encode(framed), "image/png")
+    assert stats["cropped"] is False
+
+
+def test_thin_border_not_cropped():
+    framed = Image.new("RGB", (1000, 700), (0, 0, 0))
+    framed.paste(_screen((996, 696)), (2, 2))
+    assert ImageOptimizer()._crop_uniform_borders(framed) is None
+
+
+def test_animated_gif_sent_unchanged():
+    frames = [_screen((300, 200)), _screen((300, 200)).transpose(Image.FLIP_LEFT_RIGHT)]
+    raw = _encode(frames[0], "GIF", save_all=True, append_images=frames[1:])
+    data, media_type, stats = ImageOptimizer().optimize(raw, "image/gif")
+    assert data is raw and media_type == "image/gif" and stats["content"] == "animation"
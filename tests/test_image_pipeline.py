@@ -0,0 +1,106 @@
+"""
+tests/test_image_pipeline.py — Reprise du checkpoint JSONL de l'analyse des captures en lot
+"""
+import json
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("llama_index.core")  # core.ingestion (libellés des sources)
+
+from core import image_pipeline  # noqa: E402
+from core.image_pipeline import ImageAnalysisPipeline  # noqa: E402
+
+
+class StubVision:
+    """aanalyze_screenshot sans appel API ; échoue pour les noms listés dans fail."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+
+    async def aanalyze_screenshot(self, image, question):
+        self.calls.append(image.name)
+        if image.name in self.fail:
+            return {"analysis": "Erreur", "metadata": {"error": "boom"}}
+        return {"analysis": f"Écran {image.name}", "metadata": {"model": "stub"}}
+
+
+@pytest.fixture
+def screenshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_pipeline, "DOCUMENTS", {})
+    directory = tmp_path / "screenshots"
+    directory.mkdir()
+    for name, color in [("crm.png", (200, 0, 0)), ("kanban.png", (0, 200, 0)), ("factures.png", (0, 0, 200))]:
+        Image.new("RGB", (400, 300), color).save(directory / name)
+    Image.new("RGB", (32, 32)).save(directory / "icone.png")
+    return directory
+
+
+def _pipeline(vision, screenshots, tmp_path):
+    return ImageAnalysisPipeline(
+        vision_engine=vision,
+        checkpoint_path=tmp_path / "image_analyses.jsonl",
+        screenshots_dir=screenshots,
+        concurrency=2,
+    )
+
+
+def _entries(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_second_run_resumes_from_checkpoint(screenshots, tmp_path):
+    vision = StubVision()
+    stats = _pipeline(vision, screenshots, tmp_path).run()
+    assert stats["analyzed"] == 3
+    assert stats["skipped"] == 1  # icône sous IMAGE_PIPELINE_MIN_SIDE
+
+    vision = StubVision()
+    stats = _pipeline(vision, screenshots, tmp_path).run()
+    assert stats["analyzed"] == 0
+    assert stats["already_done"] == 3
+    assert vision.calls == []
+
+
+def test_failed_analyses_are_not_checkpointed(screenshots, tmp_path):
+    pipeline = _pipeline(StubVision(fail={"kanban.png"}), screenshots, tmp_path)
+    assert pipeline.run()["failed"] == 1
+    assert {entry["image_name"] for entry in _entries(pipeline.checkpoint_path)} == {"crm.png", "factures.png"}
+
+    vision = StubVision()
+    _pipeline(vision, screenshots, tmp_path).run()
+    assert vision.calls == ["kanban.png"]
+
+
+def test_truncated_last_line_is_cut_before_appending(screenshots, tmp_path):
+    pipeline = _pipeline(StubVision(), screenshots, tmp_path)
+    pipeline.run()
+    lines = pipeline.checkpoint_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    # Interruption pendant l'écriture de la dernière entrée
+    pipeline.checkpoint_path.write_text("".join(lines[:-1]) + lines[-1][:25], encoding="utf-8")
+    lost = json.loads(lines[-1])["image_name"]
+
+    vision = StubVision()
+    _pipeline(vision, screenshots, tmp_path).run()
+
+    assert vision.calls == [lost]
+    entries = _entries(pipeline.checkpoint_path)  # chaque ligne est à nouveau du JSON valide
+    assert sorted(entry["image_name"] for entry in entries) == ["crm.png", "factures.png", "kanban.png"]
+
+
+def test_index_parser_skips_undecodable_lines(tmp_path):
+    from core.ingestion import _parse_image_analyses
+
+    entry = {
+        "id": "abc", "doc_key": "cas_usages", "source": "Cas d'Usage CRM (POC)",
+        "file_name": "Cas_d_Usages_CRM_Akuiteo_POC.pdf", "page_label": "4",
+        "image_name": "Image6.png", "analysis": "Vue KANBAN des opportunités",
+    }
+    path = tmp_path / "image_analyses.jsonl"
+    path.write_text(json.dumps(entry) + "\n" + '{"id": "tronq' + json.dumps(entry) + "\n", encoding="utf-8")
+
+    pages = _parse_image_analyses(str(path))
+    assert len(pages) == 1
+    assert "Vue KANBAN" in pages[0]["text"]
+    assert pages[0]["metadata"]["page_label"] == "4"
@@ -0,0 +1,98 @@
+"""
+tests/test_ingestion.py — Pipeline d'ingestion : tâches de parsing par plages de pages, pool de processus, embedding par lots
+"""
+import pytest
+
+pytest.importorskip("llama_index.core")
+pypdf = pytest.importorskip("pypdf")
+
+from core import ingestion  # noqa: E402
+from core.embed_cache import EmbeddingCache  # noqa: E402
+from core.ingestion import AkuiteoIngestionPipeline, _parse_pdf_pages  # noqa: E402
+
+
+class FakeEmbedModel:
+    def __init__(self):
+        self.batches = []
+
+    def get_text_embedding_batch(self, texts):
+        self.batches.append(len(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FakeNode:
+    def __init__(self, text):
+        self.text = text
+        self.embedding = None
+
+    def get_content(self, metadata_mode=None):
+        return self.text
+
+
+def _pdf(path, pages: int):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    paths = {
+        "mode_op_crm": _pdf(tmp_path / "Mode_operatoire.pdf", 5),
+        "cas_usages": _pdf(tmp_path / "Cas_usages.pdf", 3),
+        "images": tmp_path / "image_analyses.jsonl",  # absent : ignoré sans avertissement
+    }
+    monkeypatch.setattr(ingestion, "document_paths", lambda: paths)
+    return paths
+
+
+def _pipeline(**kwargs) -> AkuiteoIngestionPipeline:
+    pipeline = AkuiteoIngestionPipeline(FakeEmbedModel(), torch_threads=0, **kwargs)
+    # Un chunk par page, numérotée dans son document
+    pipeline._split = lambda doc_key, parsed: [
+        FakeNode(f"{doc_key} p{page['metadata']['page_label']}") for page in parsed
+    ]
+    return pipeline
+
+
+def test_pdf_split_into_page_range_tasks(documents):
+    tasks = _pipeline(pages_per_task=2)._plan_tasks(["mode_op_crm", "cas_usages", "images"])
+    ranges = [(doc_key, tuple(args[1:])) for doc_key, (fn, *args) in tasks]
+    assert ranges == [
+        ("mode_op_crm", (0, 2)), ("mode_op_crm", (2, 4)), ("mode_op_crm", (4, 5)),
+        ("cas_usages", (0, 2)), ("cas_usages", (2, 3)),
+    ]
+    assert all(fn is _parse_pdf_pages for _, (fn, *_) in tasks)
+
+
+def test_process_pool_parses_every_page(documents):
+    pipeline = _pipeline(workers=2, pages_per_task=2)
+    nodes = pipeline.run(["mode_op_crm", "cas_usages"])
+    assert sorted(node.text for node in nodes["mode_op_crm"]) == [f"mode_op_crm p{i}" for i in range(1, 6)]
+    assert len(nodes["cas_usages"]) == 3
+    assert pipeline.last_stats["pages"] == 8
+
+
+def test_failed_task_drops_whole_document(documents, monkeypatch):
+    pipeline = _pipeline(workers=1, pages_per_task=2)
+    tasks = pipeline._plan_tasks(["mode_op_crm", "cas_usages"])
+    tasks[1] = ("mode_op_crm", (_parse_pdf_pages, str(documents["mode_op_crm"]), 2, 99))  # page inexistante
+    monkeypatch.setattr(pipeline, "_plan_tasks", lambda keys: tasks)
+    assert sorted(pipeline.run()) == ["cas_usages"]
+
+
+def test_chunks_embedded_in_batches_and_cached(documents, tmp_path):
+    cache = EmbeddingCache(path=tmp_path / "embeddings.sqlite", model_name="test")
+    pipeline = _pipeline(workers=1, pages_per_task=1, embed_batch_size=3, embed_cache=cache)
+    nodes = pipeline.run(["mode_op_crm", "cas_usages"])
+    assert pipeline.embed_model.batches == [3, 3, 2]
+    assert all(node.embedding is not None for key_nodes in nodes.values() for node in key_nodes)
+
+    pipeline.embed_model.batches.clear()
+    again = pipeline.run(["mode_op_crm"])
+    assert pipeline.embed_model.batches == []
+    assert pipeline.last_stats["cache_hits"] == 5 and pipeline.last_stats["cache_misses"] == 0
+    assert [node.embedding for node in again["mode_op_crm"]] == [node.embedding for node in nodes["mode_op_crm"]]
@@ -0,0 +1,44 @@
+"""
+tests/test_query_cache.py — Cache LRU + TTL des requêtes RAG : normalisation des clés, éviction, expiration
+"""
+from core import query_cache
+from core.query_cache import LRUTTLCache, normalize_query
+
+
+def test_normalize_query_ignores_case_spaces_and_final_punctuation():
+    assert normalize_query("  Comment créer une  OPPORTUNITÉ ?! ") == "comment créer une opportunité"
+    assert normalize_query("Comment cre\u0301er") == normalize_query("Comment cr\u00e9er")  # NFD → NFC
+    assert normalize_query("code AKU-2041") != normalize_query("code AKU-2042")
+
+
+def test_least_recently_used_evicted():
+    cache = LRUTTLCache(max_entries=2, ttl_s=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: clock[0])
+    cache = LRUTTLCache(max_entries=8, ttl_s=10)
+    cache.put("q", "résultat")
+    clock[0] += 10
+    assert cache.get("q") == "résultat"
+    clock[0] += 1
+    assert cache.get("q") is None
+    assert len(cache) == 0
+
+
+def test_stats_and_clear():
+    cache = LRUTTLCache(max_entries=8, ttl_s=60)
+    cache.put("q", 1)
+    cache.get("q")
+    cache.get("absente")
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+    cache.clear()
+    assert cache.get("q") is None
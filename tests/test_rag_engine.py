@@ -0,0 +1,304 @@
+"""
+tests/test_rag_engine.py — Fusion RRF des classements dense et BM25, rebuild incrémental par manifeste,
+cache de requêtes, recherche groupée (query_many)
+"""
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+pytest.importorskip("llama_index.embeddings.huggingface")
+
+from config import RRF_K
+from core import rag_engine
+from core.bm25 import BM25Index
+from core.query_cache import LRUTTLCache
+from core.rag_engine import AkuiteoRAGEngine
+from core.vector_store import AkuiteoVectorStore
+
+
+class FakeStore:
+    def __init__(self, texts):
+        self.records = [
+            {"id": f"n{row}", "text": text, "metadata": {"source": f"Doc {row}"}}
+            for row, text in enumerate(texts)
+        ]
+
+    def record(self, row):
+        return self.records[row]
+
+    def row_of(self, node_id):
+        return int(node_id[1:])
+
+
+def _engine(texts):
+    """Moteur sans modèle d'embedding : seuls store et BM25 servent à _rank."""
+    engine = AkuiteoRAGEngine.__new__(AkuiteoRAGEngine)
+    engine.store = FakeStore(texts)
+    engine.bm25 = BM25Index.from_records(engine.store.records)
+    return engine
+
+
+def test_fuse_reciprocal_rank_scores():
+    fused = AkuiteoRAGEngine._fuse([[1, 2, 3], [3, 1, 4]])
+    scores = {
+        1: 1 / (RRF_K + 1) + 1 / (RRF_K + 2),
+        2: 1 / (RRF_K + 2),
+        3: 1 / (RRF_K + 3) + 1 / (RRF_K + 1),
+        4: 1 / (RRF_K + 3),
+    }
+    assert fused == sorted(scores, key=scores.get, reverse=True)
+    assert fused[:2] == [1, 3]
+
+
+def test_fuse_single_ranking_keeps_order():
+    assert AkuiteoRAGEngine._fuse([[5, 2, 9], []]) == [5, 2, 9]
+
+
+TEXTS = [
+    "Paramétrer les droits utilisateurs",
+    "Tableau de bord commercial",
+    "Code analytique AKU-2041 : imputation des temps",
+]
+
+
+def test_rank_lexical_match_overtakes_dense_order():
+    engine = _engine(TEXTS)
+    dense = [(0, 0.71), (1, 0.69), (2, 0.60)]
+    result, timings = engine._rank("code AKU-2041", dense, candidates=10, top_k=2)
+    assert result["passages"][0].startswith("Code analytique")
+    assert result["sources"] == ["Doc 2 (score: 0.6)", "Doc 0 (score: 0.71)"]
+    assert {"bm25_ms", "fusion_ms"} <= set(timings)
+
+
+def test_rank_keeps_lexical_match_missing_from_dense():
+    engine = _engine(TEXTS)
+    result, _ = engine._rank("code AKU-2041", [(0, 0.71), (1, 0.69)], candidates=10, top_k=2)
+    assert sorted(result["sources"]) == ["Doc 0 (score: 0.71)", "Doc 2 (score: BM25)"]
+
+
+def test_rank_dense_only_when_bm25_missing():
+    engine = _engine(["a propos", "deuxième passage"])
+    engine.bm25 = None
+    result, timings = engine._rank("propos", [(1, 0.9), (0, 0.5)], candidates=10, top_k=1)
+    assert result["sources"] == ["Doc 1 (score: 0.9)"]
+    assert timings == {}
+
+
+# ─── Rebuild incrémental ──────────────────────────────────────────────────────
+
+class FakeNode:
+    def __init__(self, node_id, text, embedding):
+        self.node_id = node_id
+        self.text = text
+        self.embedding = embedding
+        self.metadata = {"source": node_id.split(":")[0]}
+
+    def get_content(self):
+        return self.text
+
+
+class FakePipeline:
+    """Un nœud par document, identifié par le contenu du fichier (comme des chunks ré-embeddés)."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.runs = []
+        self.last_stats = {}
+
+    def run(self, doc_keys):
+        doc_keys = list(doc_keys)
+        self.runs.append(doc_keys)
+        nodes = {}
+        for key in doc_keys:
+            text = self.paths[key].read_text(encoding="utf-8")
+            seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+            embedding = np.random.default_rng(seed).normal(size=8).tolist()
+            nodes[key] = [FakeNode(f"{key}:{seed}", text, embedding)]
+        return nodes
+
+
+@pytest.fixture
+def indexing(tmp_path, monkeypatch):
+    """Moteur sans modèle d'embedding, documents et INDEX_DIR sous tmp_path."""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    paths = {key: docs / f"{key}.pdf" for key in ("crm", "temps", "factures")}
+    paths["crm"].write_text("Créer une opportunité", encoding="utf-8")
+    paths["temps"].write_text("Saisir ses temps", encoding="utf-8")
+    monkeypatch.setattr(rag_engine, "INDEX_DIR", tmp_path / "index")
+    monkeypatch.setattr(rag_engine, "document_paths", lambda: paths)
+
+    engine = AkuiteoRAGEngine.__new__(AkuiteoRAGEngine)
+    engine.quantization = "none"
+    engine.store = engine.bm25 = engine.index_version = None
+    engine.last_build_stats = {}
+    engine._query_results = LRUTTLCache(8, 60)
+    engine._query_embeddings = LRUTTLCache(8, 60)
+    engine.pipeline = FakePipeline(paths)
+    return engine, paths
+
+
+def _ids(engine):
+    return sorted(record["id"].split(":")[0] for record in engine.store.records)
+
+
+def test_first_build_is_full_then_loaded(indexing):
+    engine, _ = indexing
+    engine.build_index()
+    assert engine.last_build_stats["mode"] == "full"
+    assert _ids(engine) == ["crm", "temps"]
+    version = engine.index_version
+
+    engine.build_index()
+    assert engine.pipeline.runs == [["crm", "temps"]]
+    assert engine.index_version == version
+
+
+def test_rebuild_without_changes_embeds_nothing(indexing):
+    engine, _ = indexing
+    engine.build_index()
+    version = engine.index_version
+    engine.build_index(force_rebuild=True)
+    assert engine.last_build_stats == {"mode": "incremental", "added": [], "changed": [], "removed": [], "chunks": 0}
+    assert engine.pipeline.runs == [["crm", "temps"]]
+    assert engine.index_version == version
+
+
+def test_rebuild_reindexes_only_changed_documents(indexing):
+    engine, paths = indexing
+    engine.build_index()
+    engine._query_results.put("cle", "résultat périmé")
+    old_ids = {record["id"] for record in engine.store.records}
+    version = engine.index_version
+
+    paths["crm"].write_text("Créer une opportunité (v2)", encoding="utf-8")
+    paths["temps"].unlink()
+    paths["factures"].write_text("Éditer les factures", encoding="utf-8")
+    engine.build_index(force_rebuild=True)
+
+    stats = engine.last_build_stats
+    assert (stats["added"], stats["changed"], stats["removed"]) == (["factures"], ["crm"], ["temps"])
+    assert engine.pipeline.runs[-1] == ["factures", "crm"]
+    assert _ids(engine) == ["crm", "factures"]
+    assert not old_ids & {record["id"] for record in engine.store.records}
+    assert engine.bm25.ids == [record["id"] for record in engine.store.records]
+    assert engine.index_version != version
+    assert len(engine._query_results) == 0
+
+    manifest = engine._load_manifest()
+    assert sorted(manifest["documents"]) == ["crm", "factures"]
+    assert manifest["documents"]["crm"]["node_ids"] == [
+        record["id"] for record in engine.store.records if record["id"].startswith("crm:")
+    ]
+
+
+def test_settings_change_forces_full_build(indexing, monkeypatch):
+    engine, _ = indexing
+    engine.build_index()
+    monkeypatch.setattr(rag_engine, "CHUNK_SIZE", rag_engine.CHUNK_SIZE * 2)
+    engine.build_index(force_rebuild=True)
+    assert engine.last_build_stats["mode"] == "full"
+    assert engine.pipeline.runs == [["crm", "temps"], ["crm", "temps"]]
+
+
+# ─── Cache de requêtes ────────────────────────────────────────────────────────
+
+class FakeEmbedModel:
+    """Embedding déterministe par texte ; compte les passages dans le modèle."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _embed(self, text):
+        seed = int(hashlib.sha256(text.lower().encode()).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=8).tolist()
+
+    def get_query_embedding(self, text):
+        self.calls.append([text])
+        return self._embed(text)
+
+    def get_text_embedding_batch(self, texts):
+        self.calls.append(list(texts))
+        return [self._embed(text) for text in texts]
+
+
+@pytest.fixture
+def searchable(tmp_path, monkeypatch):
+    """Moteur sur un petit store réel (mmap) et un modèle d'embedding factice."""
+    model = FakeEmbedModel()
+    monkeypatch.setattr(rag_engine, "Settings", SimpleNamespace(embed_model=model))
+    engine = _engine(TEXTS)
+    store = AkuiteoVectorStore(tmp_path, quantization="none")
+    store.add(
+        FakeNode(record["id"], record["text"], model._embed(record["text"]))
+        for record in engine.store.records
+    )
+    store.persist()
+    engine.store = store
+    engine._query_results = LRUTTLCache(8, 60)
+    engine._query_embeddings = LRUTTLCache(8, 60)
+    return engine, model
+
+
+def test_query_result_cached_per_normalized_question_and_top_k(searchable):
+    engine, model = searchable
+    first = engine.query("Code AKU-2041 ?", top_k=2)
+    assert first["cached"] is False and "embed_ms" in first["timings"]
+
+    again = engine.query("  code aku-2041", top_k=2)
+    assert again["cached"] is True and again["timings"] == {}
+    assert again["passages"] == first["passages"]
+    assert len(model.calls) == 1
+
+    assert engine.query("code AKU-2041", top_k=1)["cached"] is False
+    assert len(model.calls) == 1  # embedding de la requête repris de son cache
+
+
+def test_index_change_invalidates_cached_results(searchable, tmp_path, monkeypatch):
+    engine, _ = searchable
+    monkeypatch.setattr(rag_engine, "INDEX_DIR", tmp_path)
+    engine.query("Tableau de bord", top_k=1)
+    engine._on_index_changed()
+    assert engine.query("Tableau de bord", top_k=1)["cached"] is False
+
+
+# ─── Recherche groupée ────────────────────────────────────────────────────────
+
+def test_query_many_embeds_and_scores_in_one_batch(searchable, monkeypatch):
+    engine, model = searchable
+    engine.query("Tableau de bord", top_k=1)
+    model.calls.clear()
+    searches = []
+    search_many = engine.store.search_many
+    monkeypatch.setattr(engine.store, "search_many", lambda q, k: searches.append(len(q)) or search_many(q, k))
+
+    questions = ["Droits utilisateurs", "code AKU-2041", "droits utilisateurs ?", "Tableau de bord"]
+    results = engine.query_many(questions, top_k=1)
+
+    # Doublon normalisé et question en cache : une seule passe du modèle et du store pour les 2 restantes
+    assert model.calls == [["Droits utilisateurs", "code AKU-2041"]]
+    assert searches == [2]
+    assert [result["cached"] for result in results] == [False, False, False, True]
+    for question, result in zip(questions, results):
+        expected = engine.query(question, top_k=1)
+        assert result["passages"] == expected["passages"]
+    assert results[0]["passages"] == ["Paramétrer les droits utilisateurs"]
+
+
+def test_aquery_many_matches_query_many(searchable):
+    engine, _ = searchable
+    questions = ["Tableau de bord", "code AKU-2041"]
+    expected = [result["passages"] for result in engine.query_many(questions, top_k=2)]
+    results = asyncio.run(engine.aquery_many(questions, top_k=2))
+    assert [result["passages"] for result in results] == expected
+
+
+def test_query_many_requires_index():
+    engine = AkuiteoRAGEngine.__new__(AkuiteoRAGEngine)
+    engine.store = None
+    with pytest.raises(RuntimeError):
+        engine.query_many(["Tableau de bord"])
@@ -0,0 +1,91 @@
+"""
+tests/test_tracing.py — Spans : opt-in, écriture JSONL par trace, oubli des traces sans span racine
+"""
+import json
+
+import pytest
+
+from core import tracing
+from core.tracing import Span, Tracer, span, traced
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(enabled=True, path=tmp_path / "traces" / "traces.jsonl", otlp_endpoint="", buffer_spans=3)
+    monkeypatch.setattr(tracing, "TRACER", tracer)
+    return tracer
+
+
+def _lines(tracer: Tracer) -> list:
+    if not tracer.path.exists():
+        return []
+    return [json.loads(line) for line in tracer.path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_disabled_tracer_records_nothing(tmp_path, monkeypatch):
+    disabled = Tracer(enabled=False, path=tmp_path / "traces.jsonl", otlp_endpoint="")
+    monkeypatch.setattr(tracing, "TRACER", disabled)
+    with span("agent.turn") as current:
+        current.set(tokens=1)
+    assert disabled.stats()["spans"] == {}
+    assert not (tmp_path / "traces.jsonl").exists()
+
+
+def test_spans_written_when_trace_ends(tracer):
+    with span("agent.turn"):
+        with span("claude.messages", input_tokens=12):
+            pass
+        assert _lines(tracer) == []  # en tampon tant que le span racine est ouvert
+    records = _lines(tracer)
+    assert [record["name"] for record in records] == ["claude.messages", "agent.turn"]
+    assert records[0]["parent_id"] == records[1]["span_id"]
+    assert tracer.stats()["tokens"] == {"input_tokens": 12}
+
+
+def test_buffer_flushed_when_full_and_on_flush(tracer):
+    with span("agent.turn"):
+        for _ in range(4):
+            with span("tool.rag_search"):
+                pass
+        assert len(_lines(tracer)) == 3
+    assert len(_lines(tracer)) == 5
+
+    tracer.finish(Span("orphan", Span("root", None, {}), {}))
+    assert len(_lines(tracer)) == 5
+    tracer.flush()
+    assert len(_lines(tracer)) == 6
+
+
+def test_errors_recorded_and_generators_traced(tracer):
+    @traced("agent.stream")
+    def stream():
+        yield 1
+        yield 2
+
+    assert list(stream()) == [1, 2]
+    with pytest.raises(ValueError):
+        with span("tool.vision_analysis"):
+            raise ValueError("capture illisible")
+    records = {record["name"]: record for record in _lines(tracer)}
+    assert records["agent.stream"]["status"] == "ok"
+    assert records["tool.vision_analysis"]["error"] == "ValueError: capture illisible"
+
+
+def test_pending_traces_evicted_by_age(monkeypatch):
+    tracer = Tracer(enabled=True, path=None, otlp_endpoint="http://collector.invalid", pending_ttl_s=60)
+    exported = []
+    monkeypatch.setattr(tracer, "_export_otlp", exported.append)
+    clock = [1_000.0]
+    monkeypatch.setattr(tracing.time, "monotonic", lambda: clock[0])
+
+    abandoned = Span("agent.turn", None, {})
+    tracer.finish(Span("claude.messages", abandoned, {}))  # racine jamais terminée (flux abandonné)
+    assert abandoned.trace_id in tracer._pending
+
+    clock[0] += 61
+    root = Span("agent.turn", None, {})
+    child = Span("tool.rag_search", root, {})
+    tracer.finish(child)
+    assert abandoned.trace_id not in tracer._pending
+    tracer.finish(root)
+    assert tracer._pending == {}
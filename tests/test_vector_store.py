@@ -0,0 +1,144 @@
+"""
+tests/test_vector_store.py — Persistance mmap, recherche exacte, premier passage quantifié (int8 / binary) et rescoring
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from core import vector_store
+from core.vector_store import AkuiteoVectorStore
+
+
+class FakeNode:
+    def __init__(self, node_id: str, embedding: np.ndarray):
+        self.node_id = node_id
+        self.embedding = embedding
+        self.metadata = {"file_name": f"{node_id}.pdf"}
+
+    def get_content(self) -> str:
+        return f"chunk {self.node_id}"
+
+
+def _clustered(rng, n: int, dim: int, clusters: int = 50) -> np.ndarray:
+    """Vecteurs groupés autour de quelques thèmes, comme des embeddings de documentation."""
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 1.2 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    vectors = _clustered(rng, 4_000, 384)
+    queries = vectors[rng.integers(0, len(vectors), 40)] + 0.8 * rng.normal(size=(40, 384))
+    persist_dir = tmp_path_factory.mktemp("vectorstore")
+    store = AkuiteoVectorStore(persist_dir, quantization="none")
+    store.add(FakeNode(str(i), vector) for i, vector in enumerate(vectors))
+    store.persist()
+    return persist_dir, vectors, queries.astype(np.float32)
+
+
+def _recall(hits, truth) -> float:
+    return float(np.mean([len({r for r, _ in h} & {r for r, _ in t}) / len(t) for h, t in zip(hits, truth)]))
+
+
+def test_exact_search_matches_brute_force(corpus):
+    persist_dir, vectors, queries = corpus
+    store = AkuiteoVectorStore(persist_dir, quantization="none").load()
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = queries[0] / np.linalg.norm(queries[0])
+    expected = np.argsort(-(normalized @ query))[:5]
+    hits = store.search(queries[0], 5)
+    assert [row for row, _ in hits] == expected.tolist()
+    assert hits[0][1] == pytest.approx(float(normalized[expected[0]] @ query), rel=1e-5)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescored_exactly(corpus, quantization):
+    persist_dir, _, queries = corpus
+    truth = AkuiteoVectorStore(persist_dir, quantization="none").load().search_many(queries, 5)
+    store = AkuiteoVectorStore(persist_dir, quantization=quantization).load()
+    hits = store.search_many(queries, 5)
+    assert _recall(hits, truth) >= 0.95
+    exact = dict(truth[0])
+    for row, score in hits[0]:
+        if row in exact:
+            assert score == pytest.approx(exact[row], rel=1e-5)
+
+
+def test_binary_uses_its_own_rescoring_depth(corpus, monkeypatch):
+    persist_dir, _, queries = corpus
+    store = AkuiteoVectorStore(persist_dir, quantization="binary").load()
+    counts = []
+    first_pass = store._quantized_candidates
+    monkeypatch.setattr(store, "_quantized_candidates", lambda q, count: counts.append(count) or first_pass(q, count))
+    monkeypatch.setattr(vector_store, "RESCORE_MIN_CANDIDATES", 0)
+    store.search(queries[0], 5)
+    assert counts == [5 * vector_store.RESCORE_FACTOR_BINARY]
+
+
+def test_quantized_codes_persisted_and_invalidated(corpus, tmp_path):
+    _, vectors, queries = corpus
+    store = AkuiteoVectorStore(tmp_path, quantization="int8")
+    store.add(FakeNode(str(i), vector) for i, vector in enumerate(vectors[:200]))
+    store.persist()
+    assert (tmp_path / vector_store.INT8_FILE).exists()
+
+    store = AkuiteoVectorStore(tmp_path, quantization="int8").load()
+    store.add([FakeNode("new", queries[0])])
+    store.persist()
+    reloaded = AkuiteoVectorStore(tmp_path, quantization="int8").load()
+    assert len(reloaded) == 201
+    assert reloaded.record(reloaded.search(queries[0], 1)[0][0])["id"] == "new"
+
+
+# ─── Persistance mmap ─────────────────────────────────────────────────────────
+
+def _small_store(path, dtype="float32"):
+    rng = np.random.default_rng(1)
+    store = AkuiteoVectorStore(path, dtype=dtype, quantization="none")
+    store.add(FakeNode(f"n{i}", rng.normal(size=16)) for i in range(10))
+    return store
+
+
+def test_persist_then_load_memory_maps_embeddings(tmp_path):
+    store = _small_store(tmp_path)
+    (tmp_path / "docstore.json").write_text("{}", encoding="utf-8")  # ancien format LlamaIndex
+    store.persist()
+    assert AkuiteoVectorStore.exists(tmp_path)
+    assert not (tmp_path / "docstore.json").exists()
+
+    loaded = AkuiteoVectorStore(tmp_path, quantization="none").load()
+    assert isinstance(loaded.embeddings, np.memmap) and not loaded.embeddings.flags.writeable
+    assert np.array_equal(np.asarray(loaded.embeddings), np.asarray(store.embeddings))
+    assert loaded.records == store.records
+    assert loaded.row_of("n3") == 3 and loaded.record(3)["text"] == "chunk n3"
+    assert np.allclose(np.linalg.norm(np.asarray(loaded.embeddings), axis=1), 1.0, atol=1e-5)
+
+
+def test_dtype_kept_on_disk(tmp_path):
+    _small_store(tmp_path, dtype="float16").persist()
+    loaded = AkuiteoVectorStore(tmp_path, dtype="float32", quantization="none").load()
+    assert loaded.embeddings.dtype == np.float16
+    assert loaded.search(np.asarray(loaded.embeddings[4], dtype=np.float32), 1)[0][0] == 4
+
+
+def test_delete_and_repersist_keeps_open_maps_valid(tmp_path):
+    _small_store(tmp_path).persist()
+    reader = AkuiteoVectorStore(tmp_path, quantization="none").load()
+    before = np.array(reader.embeddings[9])
+
+    writer = AkuiteoVectorStore(tmp_path, quantization="none").load()
+    writer.delete(["n0", "n1", "inconnu"])
+    writer.persist()
+    assert len(AkuiteoVectorStore(tmp_path, quantization="none").load()) == 8
+    # os.replace : le fichier déjà mappé par un autre lecteur reste lisible
+    assert np.array_equal(np.asarray(reader.embeddings[9]), before)
+
+
+def test_inconsistent_files_rejected(tmp_path):
+    _small_store(tmp_path).persist()
+    with open(tmp_path / vector_store.NODES_FILE, "a", encoding="utf-8") as f:
+        f.write('{"id": "orphelin", "text": "", "metadata": {}}\n')
+    with pytest.raises(ValueError):
+        AkuiteoVectorStore(tmp_path, quantization="none").load()
@@ -0,0 +1,78 @@
+"""
+tests/test_vision_cache.py — Cache des analyses vision : même écran réencodé retrouvé, autre écran manqué
+"""
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from config import VISION_CACHE_MAX_DISTANCE
+from core import vision_cache
+from core.image_optimizer import ImageOptimizer, hamming_distance
+from core.vision_cache import VisionAnalysisCache
+
+
+def _screen(seed: int, size=(1600, 1000)) -> Image.Image:
+    """Écran synthétique : bandeau, menu latéral et tuiles placées selon seed."""
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, size[0], 60), fill=(30, 60, 120))
+    draw.rectangle((0, 60, 220, size[1]), fill=(225, 230, 240))
+    for _ in range(12):
+        x, y = int(rng.integers(240, size[0] - 300)), int(rng.integers(80, size[1] - 200))
+        color = tuple(int(c) for c in rng.integers(0, 200, 3))
+        draw.rectangle((x, y, x + 260, y + 160), fill=color)
+        for line in range(4):
+            draw.line((x + 12, y + 24 + 30 * line, x + 220, y + 24 + 30 * line), fill=(255, 255, 255), width=6)
+    return img
+
+
+def _encode(img: Image.Image, fmt: str = "PNG", **params) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def _dhash(data: bytes, media_type: str = "image/png") -> str:
+    return ImageOptimizer().optimize(data, media_type)[2]["dhash"]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VisionAnalysisCache(path=tmp_path / "vision.sqlite", model_name="test", ttl_s=60)
+
+
+def test_identical_screenshot_hits(cache):
+    screen = _encode(_screen(1))
+    cache.put(_dhash(screen), "Que faire sur cet écran ?", "", "Écran CRM > Opportunités")
+    cached = cache.lookup(_dhash(screen), "Que faire sur cet écran ?")
+    assert cached == {"analysis": "Écran CRM > Opportunités", "distance": 0}
+
+
+def test_reencoded_and_resized_screenshot_hits(cache):
+    screen = _screen(1)
+    cache.put(_dhash(_encode(screen)), "Que faire ?", "", "Écran CRM > Opportunités")
+    recompressed = _encode(screen.resize((1200, 750), Image.LANCZOS).convert("RGB"), "JPEG", quality=70)
+    cached = cache.lookup(_dhash(recompressed, "image/jpeg"), "Que faire ?")
+    assert cached is not None
+    assert cached["distance"] <= VISION_CACHE_MAX_DISTANCE
+
+
+def test_different_screen_or_question_misses(cache):
+    first, second = _dhash(_encode(_screen(1))), _dhash(_encode(_screen(2)))
+    assert hamming_distance(first, second) > VISION_CACHE_MAX_DISTANCE
+    cache.put(first, "Que faire ?", "", "Écran CRM > Opportunités")
+    assert cache.lookup(second, "Que faire ?") is None
+    assert cache.lookup(first, "Pourquoi ce picto rouge ?") is None
+    assert cache.lookup(first, "Que faire ?", context="Autre contexte RAG") is None
+    assert cache.stats() == {"entries": 1, "hits": 0, "misses": 3, "hit_rate": 0.0}
+
+
+def test_expired_analysis_misses(cache, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(vision_cache.time, "time", lambda: clock[0])
+    cache.put("0" * 64, "Que faire ?", "", "Écran CRM")
+    clock[0] += 61
+    assert cache.lookup("0" * 64, "Que faire ?") is None
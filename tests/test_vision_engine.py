@@ -0,0 +1,42 @@
+"""
+tests/test_vision_engine.py — Requête Claude Vision : points de cache (system + image), question hors cache
+"""
+import pytest
+
+from core import vision_engine
+from core.vision_cache import VisionAnalysisCache
+from core.vision_engine import VISION_SYSTEM_PROMPT, AkuiteoVisionEngine
+
+
+@pytest.fixture
+def vision(tmp_path):
+    return AkuiteoVisionEngine(analysis_cache=VisionAnalysisCache(path=tmp_path / "vision.sqlite"), client=object())
+
+
+def test_system_and_image_cached_question_not(vision):
+    request = vision._build_request("aW1n", "image/png", "Que faire ?", "Passage CRM")
+    assert request["system"] == [
+        {"type": "text", "text": VISION_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+    ]
+    image, question = request["messages"][0]["content"]
+    assert image["type"] == "image" and image["cache_control"] == {"type": "ephemeral"}
+    assert image["source"] == {"type": "base64", "media_type": "image/png", "data": "aW1n"}
+    # La question (et le contexte RAG) suit le préfixe mis en cache : une autre question le relit
+    assert "cache_control" not in question
+    assert question["text"].startswith("Contexte documentaire Akuiteo pertinent :\nPassage CRM")
+    assert question["text"].endswith("Que faire ?")
+
+
+def test_same_image_shares_cached_prefix(vision):
+    first = vision._build_request("aW1n", "image/png", "Que faire ?", "")
+    second = vision._build_request("aW1n", "image/png", "Pourquoi ce picto rouge ?", "")
+    assert first["system"] == second["system"]
+    assert first["messages"][0]["content"][0] == second["messages"][0]["content"][0]
+    assert first["messages"][0]["content"][1] != second["messages"][0]["content"][1]
+
+
+def test_no_breakpoints_without_prompt_caching(vision, monkeypatch):
+    monkeypatch.setattr(vision_engine, "PROMPT_CACHING", False)
+    request = vision._build_request("aW1n", "image/png", "Que faire ?", "")
+    assert request["system"] == VISION_SYSTEM_PROMPT
+    assert "cache_control" not in request["messages"][0]["content"][0]
@@ -3,18 +3,21 @@ ui/app.py - Appi - Compagnon d'apprentissage Akuiteo
 Lancer avec : streamlit run ui/app.py
 """
 import sys
+import time
 import logging
 import datetime
 from pathlib import Path
 
+_APP_START = time.perf_counter()
+
 import streamlit as st
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import INDEX_DIR, DOCUMENTS
-from core.rag_engine import AkuiteoRAGEngine
-from core.vision_engine import AkuiteoVisionEngine
-from core.agent import AkuiteoAgent
+from config import INDEX_DIR, DOCUMENTS, ANSWER_CACHE_ENABLED
+from core.warmup import AkuiteoWarmup
+# core.rag_engine / core.agent / core.vision_engine (llama_index, torch, anthropic)
+# sont importés à la demande : l'UI s'affiche pendant le warm-up du moteur RAG.
 
 st.set_page_config(
     page_title="Appi - Compagnon Akuiteo",
@@ -76,23 +79,40 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-@st.cache_resource(show_spinner="Initialisation de l index RAG...")
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """Lance une seule fois par processus le chargement du moteur RAG en arrière-plan."""
+    return AkuiteoWarmup().start()
+
+
 def load_rag_engine():
-    engine = AkuiteoRAGEngine()
-    engine.build_index(force_rebuild=False)
-    return engine
+    warmup = start_warmup()
+    if not warmup.ready:
+        with st.spinner("Initialisation de l index RAG..."):
+            return warmup.wait()
+    return warmup.wait()
 
 
 @st.cache_resource
 def load_vision_engine():
+    from core.vision_engine import AkuiteoVisionEngine
     return AkuiteoVisionEngine()
 
 
+@st.cache_resource
+def load_answer_cache():
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    from core.answer_cache import SemanticAnswerCache
+    return SemanticAnswerCache()
+
+
 def get_agent():
     if "agent" not in st.session_state:
+        from core.agent import AkuiteoAgent
         rag = load_rag_engine()
         vision = load_vision_engine()
-        st.session_state["agent"] = AkuiteoAgent(rag, vision)
+        st.session_state["agent"] = AkuiteoAgent(rag, vision, answer_cache=load_answer_cache())
     return st.session_state["agent"]
 
 
@@ -159,21 +179,94 @@ def render_sidebar():
         if st.button("🔄 Reconstruire l index RAG", use_container_width=True):
             with st.spinner("Reconstruction..."):
                 try:
-                    rag = AkuiteoRAGEngine()
+                    # Moteur déjà chargé par le warm-up : pas de second chargement de bge-m3
+                    rag = load_rag_engine()
                     rag.build_index(force_rebuild=True)
-                    load_rag_engine.clear()
                     st.session_state.pop("agent", None)
-                    st.success("Index reconstruit !")
+                    stats = rag.last_build_stats
+                    updated = stats.get("added", []) + stats.get("changed", []) + stats.get("removed", [])
+                    if stats.get("mode") == "incremental" and not updated:
+                        st.success("Index deja a jour !")
+                    else:
+                        st.success("Index reconstruit ! (" + str(stats.get("chunks", 0)) + " chunks indexes)")
                     st.rerun()
                 except Exception as e:
                     st.error("Erreur : " + str(e))
 
+        st.divider()
+        st.markdown("**Demarrage**")
+        warmup = start_warmup()
+        if warmup.error is not None:
+            st.markdown("❌ Moteur RAG : " + str(warmup.error))
+        elif not warmup.ready:
+            st.markdown("⏳ Moteur RAG en cours de chargement...")
+        else:
+            labels = {
+                "imports": "Imports",
+                "model_load": "Modele bge-m3",
+                "index_load": "Index",
+                "first_query": "1re requete",
+            }
+            st.markdown("✅ Moteur RAG pret")
+            for step, seconds in warmup.timings.items():
+                st.caption(labels.get(step, step) + " : " + str(seconds) + " s")
+        st.caption("Script UI : " + str(st.session_state.get("ui_startup_s", "?")) + " s")
+
+        render_latency_panel()
+
         st.divider()
         st.markdown("**Stack**")
         st.markdown("LLM : Claude | RAG : LlamaIndex | Vision : Claude | UI : Streamlit")
 
 
+def render_latency_panel():
+    """Latences agrégées des spans de traçage (p50 / p95 sur les dernières mesures)."""
+    from core.tracing import TRACER
+    stats = TRACER.stats()
+    if not stats["spans"]:
+        return
+    st.divider()
+    st.markdown("**Latence**")
+    labels = {
+        "agent.turn": "Tour complet",
+        "claude.messages": "Appel Claude",
+        "tool.rag_search": "Tool RAG",
+        "tool.vision_analysis": "Tool Vision",
+        "rag.embed_queries": "Embedding requete",
+        "rag.search": "Recherche vectorielle",
+        "vision.analyze": "Claude Vision",
+        "image.prepare": "Preparation image",
+        "answer_cache.lookup": "Cache reponses",
+    }
+    for name, label in labels.items():
+        span_stats = stats["spans"].get(name)
+        if span_stats:
+            st.caption(
+                label + " : p50 " + str(span_stats["p50_ms"]) + " ms | p95 "
+                + str(span_stats["p95_ms"]) + " ms (" + str(span_stats["count"]) + ")"
+            )
+    tokens = stats["tokens"]
+    if tokens:
+        st.caption(
+            "Tokens : " + str(tokens.get("input_tokens", 0)) + " in / "
+            + str(tokens.get("output_tokens", 0)) + " out | cache lu "
+            + str(tokens.get("cache_read_input_tokens", 0))
+        )
+    from core.clients import pool_stats
+    pool = pool_stats()["sync"]
+    if pool["requests"]:
+        st.caption(
+            "Connexions API : " + str(pool["open_connections"]) + " ouvertes ("
+            + str(pool["idle_connections"]) + " inactives) | pic " + str(pool["peak_in_flight"])
+            + "/" + str(pool["max_connections"]) + " | reutilisation "
+            + str(round(pool["reuse_rate"] * 100)) + " %"
+        )
+
+
 def main():
+    start_warmup()
+    st.session_state.setdefault("ui_startup_s", round(time.perf_counter() - _APP_START, 2))
+
     st.markdown("""
     <div class="main-header">
         <h2>Appi - Compagnon d&#39;apprentissage</h2>
@@ -202,6 +295,8 @@ def main():
                     label = "RAG" if tool == "rag_search" else "Vision"
                     tools_html += '<span class="tool-badge ' + css_class + '">' + label + "</span>"
                 st.markdown(tools_html, unsafe_allow_html=True)
+            if msg.get("cached"):
+                st.caption("⚡ Reponse issue du cache")
 
             if msg["role"] == "assistant" and not msg.get("feedback_given"):
                 fb_key = "feedback_" + str(idx)
@@ -255,6 +350,18 @@ def main():
 
     if uploaded_image:
         st.image(uploaded_image, caption="Capture prete a envoyer", use_column_width=True)
+        # Optimisée dès l'upload (résultat en cache, réutilisé par l'agent)
+        try:
+            _, _, image_stats = load_vision_engine().prepare_image(uploaded_image)
+            st.caption(
+                "Optimisee : " + "x".join(map(str, image_stats["original_size"])) + " -> "
+                + "x".join(map(str, image_stats["optimized_size"])) + " | "
+                + str(image_stats["original_bytes"] // 1024) + " -> "
+                + str(image_stats["optimized_bytes"] // 1024) + " Ko | ~"
+                + str(image_stats["optimized_tokens"]) + " tokens image"
+            )
+        except Exception as e:
+            logger.warning(f"Optimisation de la capture impossible : {e}")
 
     user_input = st.chat_input("Posez votre question sur Akuiteo...")
 
@@ -269,40 +376,57 @@ def main():
             st.markdown(display_content)
 
         with st.chat_message("assistant"):
-            with st.spinner("Analyse en cours..."):
-                try:
-                    agent = get_agent()
-                    image_data = None
-                    if uploaded_image:
-                        uploaded_image.seek(0)
-                        image_data = uploaded_image
-
-                    result = agent.run(user_message=user_input, image_input=image_data)
-                    response_text = result["response"]
-                    tools_used = result.get("tools_used", [])
-
-                    st.markdown(response_text)
-
-                    if tools_used:
-                        tools_html = ""
-                        for tool in tools_used:
-                            css_class = "tool-rag" if tool == "rag_search" else "tool-vision"
-                            label = "RAG" if tool == "rag_search" else "Vision"
-                            tools_html += '<span class="tool-badge ' + css_class + '">' + label + "</span>"
-                        st.markdown(tools_html, unsafe_allow_html=True)
-
-                    st.session_state["messages"].append({
-                        "role": "assistant",
-                        "content": response_text,
-                        "tools_used": tools_used,
-                        "feedback_given": False,
-                    })
-                    st.rerun()
+            try:
+                agent = get_agent()
+                image_data = uploaded_image or None
+
+                tool_status = st.empty()
+                tool_status.caption("Analyse en cours...")
+                result = {}
+
+                def stream_text():
+                    # Affiche les tokens au fil de l'eau, les tools dans tool_status
+                    streamed = False
+                    for event in agent.run_stream(user_message=user_input, image_input=image_data):
+                        if event["type"] == "text":
+                            tool_status.empty()
+                            streamed = True
+                            yield event["text"]
+                        elif event["type"] == "tool_start":
+                            label = "Recherche documentaire" if event["tool"] == "rag_search" else "Analyse de la capture"
+                            tool_status.caption(label + " en cours...")
+                            if streamed:
+                                streamed = False
+                                yield "\n\n"
+                        elif event["type"] == "done":
+                            result.update(event)
+
+                st.write_stream(stream_text())
+                tool_status.empty()
+                response_text = result.get("response", "")
+                tools_used = result.get("tools_used", [])
+
+                if tools_used:
+                    tools_html = ""
+                    for tool in tools_used:
+                        css_class = "tool-rag" if tool == "rag_search" else "tool-vision"
+                        label = "RAG" if tool == "rag_search" else "Vision"
+                        tools_html += '<span class="tool-badge ' + css_class + '">' + label + "</span>"
+                    st.markdown(tools_html, unsafe_allow_html=True)
+
+                st.session_state["messages"].append({
+                    "role": "assistant",
+                    "content": response_text,
+                    "tools_used": tools_used,
+                    "cached": result.get("cached", False),
+                    "feedback_given": False,
+                })
+                st.rerun()
 
-                except Exception as e:
-                    err = "Erreur : " + str(e)
-                    st.error(err)
-                    st.session_state["messages"].append({"role": "assistant", "content": err, "feedback_given": True})
+            except Exception as e:
+                err = "Erreur : " + str(e)
+                st.error(err)
+                st.session_state["messages"].append({"role": "assistant", "content": err, "feedback_given": True})
 
     # Questions suggerees
     if not st.session_state["messages"]: